@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import time
+import zlib
+import numpy
+
+# Upper limits of the frame time histogram buckets in milliseconds, the last bucket holds everything slower
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50]
+
+# Lookup tables between LED values and perceived brightness, both 256 entries long.
+# Fading in perceived brightness and converting back keeps the fade from looking like it
+# jumps at the dark end, which a straight line between two LED values does.
+def gammaTables(gamma):
+	levels = numpy.arange(256, dtype = numpy.float64) / 255
+	decode = 255 * levels ** (1 / gamma)							# LED value -> perceived level
+	encode = numpy.round(255 * levels ** gamma).astype(numpy.uint8)	# perceived level -> LED value
+	return decode, encode
+
+# Phase offset of every LED in animation steps, derived from the airport code so it stays the same between refreshes
+def stationOffsets(airports, steps):
+	return numpy.array([zlib.crc32(airportcode.encode()) % steps for airportcode in airports], dtype = numpy.int64)
+
+# Compile the two phase frames of a mode into one full fade cycle of steps frames.
+# Every LED moves from its phase 0 color to its phase 1 color and back along a cosine,
+# LEDs that are the same in both phases stay constant. With steps of 2 or less the two
+# phase frames are returned as they are, which is the classic blink/fade toggle.
+def compileAnimation(frames, steps, gamma = 2.2, offsets = None):
+	if steps <= 2 or frames[0] == frames[1]:
+		return frames
+	decode, encode = gammaTables(gamma)
+	first = decode[numpy.array(frames[0], dtype = numpy.uint8).reshape(-1, 3)]
+	second = decode[numpy.array(frames[1], dtype = numpy.uint8).reshape(-1, 3)]
+
+	wave = (1 - numpy.cos(2 * numpy.pi * numpy.arange(steps) / steps)) / 2
+	index = numpy.arange(steps)[:, None]
+	if offsets is not None:
+		index = index + offsets[None, :]
+	weights = wave[index % steps]
+
+	levels = first[None, :, :] + (second - first)[None, :, :] * weights[:, :, None]
+	colors = encode[numpy.round(levels).astype(numpy.uint8)]
+	return [list(map(tuple, frame)) for frame in colors.tolist()]
+
+# Fixed rate frame clock for the render loop.
+# Frame deadlines sit on a fixed timeline from the start, so time spent drawing never adds up
+# to drift and frames that were missed are skipped instead of played late. The time spent on
+# each frame goes into a histogram, and if the render loop uses more than budget of the time
+# (e.g. 0.25 for a quarter of a CPU) only every second, fourth, ... frame is drawn.
+# With metrics, how late every frame starts against the timeline is recorded as the frame jitter.
+class FrameClock:
+	def __init__(self, fps, budget = None, metrics = None):
+		self.interval = 1.0 / fps
+		self.budget = budget
+		self.metrics = metrics
+		self.divider = 1					# Only every divider-th frame is drawn
+		self.maxDivider = max(1, int(fps))	# Never drop below one frame per second
+		self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+		self.work = 0.0						# Seconds spent drawing since the last budget check
+		self.checked = time.monotonic()
+		self.reset()
+
+	# Restart the timeline, e.g. after the render loop was idle
+	def reset(self):
+		self.start = time.monotonic()
+		self.tick = 0
+
+	def frameStarted(self):
+		self.frameStart = time.perf_counter()
+
+	def frameDone(self):
+		duration = time.perf_counter() - self.frameStart
+		self.work += duration
+		milliseconds = duration * 1000
+		bucket = 0
+		while bucket < len(HISTOGRAM_BUCKETS) and milliseconds >= HISTOGRAM_BUCKETS[bucket]:
+			bucket += 1
+		self.histogram[bucket] += 1
+
+	# Sleep until the next frame deadline or until wake is set, and advance tick to the current frame
+	def wait(self, wake = None):
+		now = time.monotonic()
+		current = int((now - self.start) / self.interval)
+		nextTick = (current // self.divider + 1) * self.divider
+		deadline = self.start + nextTick * self.interval
+		woken = False
+		if wake is not None:
+			if wake.wait(max(0.0, deadline - now)):
+				wake.clear()
+				woken = True
+		else:
+			time.sleep(max(0.0, deadline - now))
+		now = time.monotonic()
+		if self.metrics is not None and not woken:
+			self.metrics.observe("metarmap_frame_jitter_seconds", max(0.0, now - deadline))
+		self.tick = int((now - self.start) / self.interval)
+		self.checkBudget()
+
+	# Lower the frame rate when drawing takes more than the budget, raise it again when there is room
+	def checkBudget(self):
+		now = time.monotonic()
+		if self.budget is None or now - self.checked < 5:
+			return
+		load = self.work / (now - self.checked)
+		self.work = 0.0
+		self.checked = now
+		if load > self.budget and self.divider < self.maxDivider:
+			self.divider *= 2
+			print("Render load " + str(round(load * 100, 1)) + "% over budget, drawing every " + str(self.divider) + " frames")
+		elif load < self.budget / 4 and self.divider > 1:
+			self.divider //= 2
+
+	def report(self):
+		labels = ["<" + str(limit) + "ms" for limit in HISTOGRAM_BUCKETS] + [">=" + str(HISTOGRAM_BUCKETS[-1]) + "ms"]
+		return "Frame times: " + " ".join(label + ":" + str(count) for label, count in zip(labels, self.histogram))
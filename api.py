@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import asyncio
+import io
+import json
+import threading
+import zlib
+import numpy
+from stationstate import CATEGORIES, stationPositions
+
+KEEPALIVE = 30				# Seconds an idle client connection is kept open
+
+# Serialized responses of the local API, built once per data refresh on the refresh thread:
+#   /conditions.json	conditions and derived weather values of every station with a report
+#   /conditions.npy	the station state rows of all LEDs as a NumPy array, in the order of /airports.json
+#   /airports.json		the station of every LED, NULL for LEDs without one
+#   /frames/MODE.json	first frame of a mode as [G,R,B] per LED, /frames/MODE.bin as 3 bytes per LED
+def buildPayloads(state, airports, frames, updated):
+	stations = {}
+	for stationId, rows in stationPositions(airports).items():
+		row = state[rows[0]]
+		if not row["reported"]:
+			continue
+		stations[stationId] = {
+			"flightCategory" : CATEGORIES[row["flightCategory"]] or None,
+			"windSpeed" : int(row["windSpeed"]),
+			"windGust" : int(row["windGust"]) if row["windGust"] >= 0 else None,
+			"lightning" : bool(row["lightning"]),
+			"tempC" : round(float(row["tempC"]), 1),
+			"dewpointC" : round(float(row["dewpointC"]), 1),
+			"RH" : round(float(row["RH"]), 1),
+			"heatIndex" : round(float(row["heatIndex"]), 1),
+			"tempWet" : round(float(row["tempWet"]), 1),
+			"WBGT" : round(float(row["WBGT"]), 1),
+			"observed" : float(row["observed"]) or None,
+			"fromNeighbour" : bool(row["missing"]),
+			"leds" : rows,
+		}
+	stateArray = io.BytesIO()
+	numpy.save(stateArray, state)
+	payloads = {
+		"/conditions.json" : ("application/json", json.dumps({ "updated" : updated, "stations" : stations }).encode()),
+		"/conditions.npy" : ("application/octet-stream", stateArray.getvalue()),
+		"/airports.json" : ("application/json", json.dumps(airports).encode()),
+	}
+	for mode, modeFrames in frames.items():
+		payloads["/frames/" + mode + ".json"] = ("application/json", json.dumps(modeFrames[0]).encode())
+		payloads["/frames/" + mode + ".bin"] = ("application/octet-stream", numpy.array(modeFrames[0], dtype = numpy.uint8).tobytes())
+	return payloads
+
+# Small HTTP/1.1 server for the local API, running its own asyncio loop on a daemon thread.
+# Requests are answered from the payloads of the last publish() without touching the station data,
+# and every payload has an ETag, so clients that poll with If-None-Match mostly get an empty 304.
+# /frame.json and /frame.bin are the frames of the mode the map is showing right now.
+class ConditionsServer:
+	def __init__(self):
+		self.payloads = {}			# path -> (content type, body, ETag), replaced as a whole
+		self.mode = None			# Mode shown on the map, set by the render loop
+
+	# Take new payloads from buildPayloads, the ETags are calculated here once
+	def publish(self, payloads):
+		payloads = dict(payloads)
+		payloads["/"] = ("application/json", json.dumps(sorted(payloads)).encode())
+		self.payloads = { path : (contentType, body, '"%08x"' % zlib.crc32(body)) for path, (contentType, body) in payloads.items() }
+
+	def setMode(self, mode):
+		self.mode = mode
+
+	def response(self, method, path, headers):
+		if path in ("/frame.json", "/frame.bin"):
+			path = "/frames/" + str(self.mode) + path[6:]
+		payload = self.payloads.get(path)
+		if method not in ("GET", "HEAD"):
+			return "405 Method Not Allowed", [], b""
+		if payload is None:
+			return "404 Not Found", [], b""
+		contentType, body, etag = payload
+		if headers.get("if-none-match") == etag:
+			return "304 Not Modified", [("ETag", etag)], b""
+		return "200 OK", [("Content-Type", contentType), ("ETag", etag), ("Cache-Control", "no-cache")], body
+
+	async def handle(self, reader, writer):
+		try:
+			while True:
+				requestLine = await asyncio.wait_for(reader.readline(), KEEPALIVE)
+				if not requestLine:
+					break
+				headers = {}
+				while True:
+					line = await asyncio.wait_for(reader.readline(), KEEPALIVE)
+					if line in (b"\r\n", b"\n", b""):
+						break
+					name, separator, value = line.decode('latin-1').partition(":")
+					headers[name.strip().lower()] = value.strip()
+				method, target, version = requestLine.decode('latin-1').split()
+				status, responseHeaders, body = self.response(method, target.split("?")[0], headers)
+				keepAlive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+				head = "HTTP/1.1 " + status + "\r\n" + "".join(name + ": " + value + "\r\n" for name, value in responseHeaders)
+				head += "Content-Length: " + str(len(body)) + "\r\nConnection: " + ("keep-alive" if keepAlive else "close") + "\r\n\r\n"
+				writer.write(head.encode('latin-1') + (body if method != "HEAD" else b""))
+				await writer.drain()
+				if not keepAlive:
+					break
+		except (asyncio.TimeoutError, ConnectionError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, port, address):
+		server = await asyncio.start_server(self.handle, address, port)
+		async with server:
+			await server.serve_forever()
+
+	# Serve on http://address:port/ from a daemon thread
+	def start(self, port, address = "127.0.0.1"):
+		threading.Thread(target = asyncio.run, args = (self.serve(port, address),), daemon = True).start()
+		return self
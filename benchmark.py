@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the data and render path of the map that do not need the LEDs or a Raspberry Pi.
+# Run with: python3 benchmark.py [recorded.xml or recorded.xml.gz]
+# Without an argument the pipeline benchmark uses the response cached by the map in metar.xml.gz.
+#
+# The stage suite times map.py, metar.py and temp.py on synthetic responses and runs offline:
+#   python3 benchmark.py --save		run the suite and save its times as the baseline of this machine
+#   python3 benchmark.py --check	run the suite and exit with status 1 if a stage got slower than the baseline
+
+import contextlib
+import gzip
+import http.server
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import json
+import numpy
+import map as metarmap
+import metar
+import temp
+from api import buildPayloads
+from animation import compileAnimation, stationOffsets, FrameClock
+from corpus import METAR_CORPUS, TAF_CORPUS
+from fetch import CachedFetcher, ChunkedFetcher
+from framebuffer import packFrames, unpackFrames
+from frames import compileFrames, frameBytes, FrameWriter
+from grid import buildInterpolator
+from hardware import RecordingStrip
+from metarparse import parseMetars, parseResponses
+from rawmetar import decodeMetar
+from metrics import Metrics
+from stationstate import CATEGORIES, newState, computeMetrics, fillMissing
+from stations import nearestNeighbours
+from synthetic import syntheticResponse
+from taf import decodeTaf
+from metarparse import isoTime
+from weather import derivedMetrics, derivedMetricsScalar
+
+STATION_COUNT = 10000						# Number of synthetic stations
+RENDER_FRAMES = 1000						# Frames pushed to the recording strip
+ANIMATION_SECONDS = 5						# How long the animation engine runs at FRAME_RATE
+DECODE_REPORTS = 50000						# Raw reports decoded in the decoder benchmark
+STATE_SIZES = [150, 10000]					# LED counts of the station state benchmark
+CHUNK_LATENCY = 0.2							# Seconds the stub server waits before every chunked response
+CHUNK_STATIONS = [300, 1200, 4800]			# Station list lengths of the chunked fetch benchmark
+SUITE_SIZES = [150, 5000, 50000]			# Station counts of the stage suite
+SUITE_TOLERANCE = 0.25						# Slowdown against the baseline that counts as a regression
+SUITE_NOISE = 0.05							# Milliseconds a stage may always differ by, below that it is timer noise
+GRID_STATIONS = [150, 10000]				# LED counts of the grid interpolation benchmark
+WRITER_SIZES = [150, 1000, 10000]			# LED counts of the frame writer benchmark
+TAF_STATIONS = [150, 5000]					# LED counts of the forecast timeline benchmark
+BASELINE_FILE = os.path.join(metarmap.BASE_DIR, 'benchmark-baseline.json')
+
+# Time a function over a few repetitions and return the best run in milliseconds
+def best(function, repeat = 5):
+	times = []
+	for r in range(repeat):
+		start = time.perf_counter()
+		function()
+		times.append((time.perf_counter() - start) * 1000)
+	return min(times)
+
+# Derived metrics: one vectorized pass against the per-station formulas, tests/test_weather.py checks that they agree
+def benchDerivedMetrics():
+	random.seed(1)
+	tempC = [round(random.uniform(-30, 50), 1) for i in range(STATION_COUNT)]
+	dewpointC = [round(t - random.uniform(0, 30), 1) for t in tempC]
+
+	print("Derived metrics, " + str(STATION_COUNT) + " stations:")
+	print("  scalar:     %8.2f ms" % best(lambda: [derivedMetricsScalar(tempC[i], dewpointC[i]) for i in range(STATION_COUNT)]))
+	print("  vectorized: %8.2f ms" % best(lambda: derivedMetrics(tempC, dewpointC)))
+
+# Serve one response from memory on a local port, like the data server would
+def serve(content):
+	class Handler(http.server.BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+		def do_GET(self):
+			self.send_response(200)
+			self.send_header("Content-Length", str(len(content)))
+			self.end_headers()
+			self.wfile.write(content)
+		def log_message(self, format, *args):
+			pass
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	return server
+
+# Answer every request with a METAR for each station of its stationString after a fixed delay, like a slow data server
+def serveStations(latency):
+	class Handler(http.server.BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+		def do_GET(self):
+			time.sleep(latency)
+			query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+			stations = query.get("stationString", [""])[0].split(",")
+			content = ("<response><data>" + "".join("<METAR><station_id>" + station + "</station_id><flight_category>VFR</flight_category></METAR>" for station in stations) + "</data></response>").encode()
+			self.send_response(200)
+			self.send_header("Content-Length", str(len(content)))
+			self.end_headers()
+			self.wfile.write(content)
+		def log_message(self, format, *args):
+			pass
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	return server
+
+# Chunked fetching against a slow server: with enough workers the wall time stays at about one response
+def benchChunkedFetch():
+	server = serveStations(CHUNK_LATENCY)
+	url = "http://127.0.0.1:" + str(server.server_address[1]) + "/metar?stationString="
+	cacheDir = tempfile.mkdtemp()
+	chunkSize = metarmap.FETCH_CHUNK_SIZE
+	print("Chunked fetch, " + str(chunkSize) + " stations per chunk, " + str(int(CHUNK_LATENCY * 1000)) + " ms server latency:")
+	for count in CHUNK_STATIONS:
+		stations = ["S" + str(i) for i in range(count)]
+		chunks = (count + chunkSize - 1) // chunkSize
+		for workers in sorted({1, chunks}):
+			fetcher = ChunkedFetcher(url, stations, os.path.join(cacheDir, str(count) + "-" + str(workers) + ".xml.gz"), chunkSize, workers)
+			start = time.perf_counter()
+			received = sum(1 for record in parseResponses(fetcher.fetch()))
+			duration = (time.perf_counter() - start) * 1000
+			fetcher.close()
+			print("  %5d stations, %2d chunks, %2d workers: %8.2f ms, %d reports" % (count, chunks, workers, duration, received))
+	server.shutdown()
+
+# Full fetch -> parse -> compute -> frames -> render pipeline of map.py against a recorded response
+def benchPipeline(recording):
+	opener = gzip.open if recording.endswith(".gz") else open
+	with opener(recording, 'rb') as f:
+		content = f.read()
+	with open(os.path.join(metarmap.BASE_DIR, "airports")) as f:
+		airports = [x.strip() for x in f.readlines()][:metarmap.LED_COUNT]
+
+	server = serve(content)
+	url = "http://127.0.0.1:" + str(server.server_address[1]) + "/metar"
+	cacheDir = tempfile.mkdtemp()
+	def fetch():
+		fetcher = CachedFetcher(url, os.path.join(cacheDir, "metar.xml.gz"))
+		fetcher.fetch()
+		fetcher.close()
+	def parse():
+		return list(parseMetars(content))
+	records = parse()
+	tempC = [record['tempC'] or 0 for record in records]
+	dewpointC = [record['dewpointC'] or 0 for record in records]
+	with contextlib.redirect_stdout(io.StringIO()):
+		state = metarmap.parseConditions([content], airports)
+		computeMetrics(state)
+	def frames():
+		return { name : compileFrames(state, colorFunction) for name, colorFunction in metarmap.MODES.items() }
+	compiled = frames()
+
+	writer = FrameWriter(RecordingStrip(metarmap.LED_COUNT, keep = 1), brightness = metarmap.LED_DAY_BRIGHTNESS)
+	renderFrames = frameBytes(compiled['metar'])
+	def render():
+		for i in range(RENDER_FRAMES):
+			writer.write(renderFrames[i % 2])
+
+	print("Pipeline, " + str(len(records)) + " reports from " + recording + ":")
+	print("  fetch:      %8.2f ms" % best(fetch))
+	print("  parse:      %8.2f ms" % best(parse))
+	print("  compute:    %8.2f ms" % best(lambda: derivedMetrics(tempC, dewpointC)))
+	print("  frames:     %8.2f ms" % best(frames))
+	print("  api:        %8.2f ms to serialize the payloads" % best(lambda: buildPayloads(state, airports, compiled, 0)))
+	animations = [{ name : metarmap.animate(modeFrames, airports) for name, modeFrames in compiled.items() }]
+	packed = packFrames(animations)
+	print("  publish:    %8.2f ms to pack, %.2f ms to unpack the animations, %d bytes" % (best(lambda: packFrames(animations)), best(lambda: unpackFrames(packed)), len(packed)))
+	renderTime = best(render, repeat = 3)
+	print("  render:     %8.3f ms per frame, %.0f frames/s" % (renderTime / RENDER_FRAMES, RENDER_FRAMES / renderTime * 1000))
+	server.shutdown()
+	benchAnimation(compiled['metar'], airports)
+
+# Fade animation: compile time of a full cycle and frame times of the engine running in real time
+def benchAnimation(frames, airports):
+	steps = metarmap.ANIMATION_STEPS
+	offsets = stationOffsets(airports, steps)
+	animation = frameBytes(compileAnimation(frames, steps, metarmap.ANIMATION_GAMMA, offsets))
+	print("Animation, " + str(steps) + " steps at " + str(metarmap.FRAME_RATE) + " fps:")
+	print("  compile:    %8.2f ms" % best(lambda: compileAnimation(frames, steps, metarmap.ANIMATION_GAMMA, offsets)))
+
+	# With the same instrumentation as the map, the metrics are part of the measured CPU time
+	metrics = Metrics()
+	writer = FrameWriter(RecordingStrip(metarmap.LED_COUNT, keep = 1), metrics)
+	clock = FrameClock(metarmap.FRAME_RATE, metarmap.ANIMATION_CPU_BUDGET, metrics)
+	cpuStart = time.process_time()
+	wallStart = time.monotonic()
+	while time.monotonic() - wallStart < ANIMATION_SECONDS:
+		clock.frameStarted()
+		writer.write(animation[clock.tick % len(animation)])
+		clock.frameDone()
+		clock.wait()
+	cpu = (time.process_time() - cpuStart) / (time.monotonic() - wallStart)
+	print("  " + clock.report())
+	print("  " + writer.stats() + ", CPU %.1f%% (budget %.0f%%)" % (cpu * 100, metarmap.ANIMATION_CPU_BUDGET * 100))
+	print("  metrics:    %8.3f us per recorded value" % (best(lambda: [metrics.observe("metarmap_stage_seconds", 0.001, 'stage="show"') for i in range(10000)]) / 10))
+
+# Deep size of a dictionary of dictionaries in bytes
+def dictSize(conditionDict):
+	return sys.getsizeof(conditionDict) + sum(sys.getsizeof(key) + sys.getsizeof(conditions) + sum(sys.getsizeof(value) for value in conditions.values()) for key, conditions in conditionDict.items())
+
+# Station state columns against the former dictionary per station: memory, per-LED reads, frame compilation and writes
+def benchStationState():
+	for count in STATE_SIZES:
+		airports = ["NULL" if i % 10 == 9 else "S" + str(i) for i in range(count)]
+		state = newState(count)
+		state["reported"] = [airportcode != "NULL" for airportcode in airports]
+		state["flightCategory"] = [random.randint(1, 4) for i in range(count)]
+		state["windSpeed"] = [random.randint(0, 40) for i in range(count)]
+		state["tempC"] = [round(random.uniform(-30, 50), 1) for i in range(count)]
+		state["heatIndex"] = [round(random.uniform(0, 120), 1) for i in range(count)]
+		conditionDict = { airportcode : { "flightCategory" : CATEGORIES[row["flightCategory"]], "windSpeed" : int(row["windSpeed"]), "windGust" : False, "lightning" : bool(row["lightning"]), "tempC" : float(row["tempC"]), "dewpointC" : 0.0, "RH" : 0.0, "heatIndex" : float(row["heatIndex"]), "tempWet" : 0.0, "WBGT" : 0.0 } for airportcode, row in zip(airports, state) if airportcode != "NULL" }
+
+		frames = { name : compileFrames(state, colorFunction) for name, colorFunction in metarmap.MODES.items() }
+		writer = FrameWriter(RecordingStrip(count, keep = 1))
+		metarFrames = frameBytes(frames['metar'])
+		def write():
+			for i in range(RENDER_FRAMES):
+				writer.write(metarFrames[i % 2])
+		print("Station state, " + str(count) + " LEDs:")
+		print("  memory:     %8d bytes, %d bytes as dictionaries" % (state.nbytes, dictSize(conditionDict)))
+		print("  reads:      %8.3f ms per pass as dictionaries" % best(lambda: [conditionDict.get(airportcode, None) is not None and conditionDict[airportcode]["windSpeed"] > 30 for airportcode in airports]))
+		print("  reads:      %8.3f ms per pass as columns" % best(lambda: state["windSpeed"] > 30))
+		print("  frames:     %8.3f ms for all modes" % best(lambda: [compileFrames(state, colorFunction) for colorFunction in metarmap.MODES.values()]))
+		print("  write:      %8.3f ms per frame" % (best(write, repeat = 3) / RENDER_FRAMES))
+
+# Frame writer: brightness and color order applied to a whole frame with one table lookup, for frames as bytes and as
+# color tuples, against setting every LED and scaling it on its own like NeoPixel did on every show()
+def benchWriter():
+	print("Frame writer, GRB strip at brightness " + str(metarmap.LED_DAY_BRIGHTNESS) + ":")
+	for count in WRITER_SIZES:
+		strip = RecordingStrip(count, keep = 1)
+		strip.channels = [1, 0, 2]
+		writer = FrameWriter(strip, brightness = metarmap.LED_DAY_BRIGHTNESS)
+		tuples = [[(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)) for i in range(count)] for frame in range(2)]
+		frames = frameBytes(tuples)
+		def write(frames):
+			for i in range(RENDER_FRAMES):
+				writer.write(frames[i % 2])
+		def perPixel():
+			for i in range(RENDER_FRAMES // 10):
+				buffer = bytearray(count * 3)
+				for index, (r, g, b) in enumerate(tuples[i % 2]):
+					buffer[index * 3:index * 3 + 3] = bytes((int(g * writer.brightness), int(r * writer.brightness), int(b * writer.brightness)))
+				strip.writeBytes(buffer)
+		byteTime = best(lambda: write(frames), repeat = 3) / RENDER_FRAMES * 1000
+		print("  %5d LEDs: %8.2f us per frame from bytes (%.4f us per LED), %8.2f us from tuples, %8.2f us per pixel" % (count, byteTime, byteTime / count, best(lambda: write(tuples), repeat = 3) / RENDER_FRAMES * 1000, best(perPixel, repeat = 3) / (RENDER_FRAMES // 10) * 1000))
+
+# Grid interpolation on a global 0.5 degree grid like the NOAA files: building the weights once against the gather for every new field
+def benchGrid():
+	latitudes = numpy.arange(90, -90.1, -0.5)
+	longitudes = numpy.arange(0, 360, 0.5)
+	lons, lats = numpy.meshgrid(longitudes, latitudes)
+	field = numpy.random.default_rng(1).uniform(0, 12, lats.shape)
+	print("Grid interpolation, " + str(lats.shape[1]) + "x" + str(lats.shape[0]) + " grid:")
+	for count in GRID_STATIONS:
+		stationLats = numpy.array([random.uniform(25, 49) for i in range(count)])
+		stationLons = numpy.array([random.uniform(-124, -67) for i in range(count)])
+		interpolator = buildInterpolator("", lats, lons, stationLats, stationLons)
+		print("  %5d LEDs: weights %8.3f ms, gather %8.3f ms, frames %8.3f ms" % (count, best(lambda: buildInterpolator("", lats, lons, stationLats, stationLons)), best(lambda: interpolator.interpolate(field)), best(lambda: metarmap.gridFrames(interpolator.interpolate(field)))))
+
+# Nearest station fallback: finding the neighbours once per airports list against filling in the missing stations on every refresh
+def benchFallback():
+	print("Nearest station fallback, " + str(metarmap.FALLBACK_NEIGHBOURS) + " neighbours within " + str(metarmap.FALLBACK_RADIUS) + " nm:")
+	for count in GRID_STATIONS:
+		airports = ["S" + str(i) for i in range(count)]
+		latitudes = numpy.array([random.uniform(25, 49) for i in range(count)])
+		longitudes = numpy.array([random.uniform(-124, -67) for i in range(count)])
+		neighbours = nearestNeighbours(latitudes, longitudes, metarmap.FALLBACK_RADIUS, metarmap.FALLBACK_NEIGHBOURS)
+		state = newState(count)
+		state["reported"] = [random.random() > 0.1 for i in range(count)]
+		def fill():
+			filled = state.copy()
+			fillMissing(filled, airports, neighbours)
+		print("  %5d LEDs: neighbours %8.3f ms, fill %8.3f ms" % (count, best(lambda: nearestNeighbours(latitudes, longitudes, metarmap.FALLBACK_RADIUS, metarmap.FALLBACK_NEIGHBOURS), repeat = 3), best(fill)))
+
+# Raw METAR decoder: reports of the test corpus decoded per second
+def benchDecoder():
+	reports = [METAR_CORPUS[i % len(METAR_CORPUS)][0] for i in range(DECODE_REPORTS)]
+	duration = best(lambda: [decodeMetar(rawText) for rawText in reports], repeat = 3)
+	print("Raw METAR decoder, " + str(len(METAR_CORPUS)) + " corpus reports:")
+	print("  speed:      %8.0f reports/s" % (DECODE_REPORTS / duration * 1000))
+
+# TAF decoder: TAFs of the test corpus decoded per second and the forecast timeline of the map
+def benchTaf():
+	tafs = [(TAF_CORPUS[i % len(TAF_CORPUS)][0], isoTime(TAF_CORPUS[i % len(TAF_CORPUS)][1])) for i in range(DECODE_REPORTS // 10)]
+	duration = best(lambda: [decodeTaf(rawText, issued) for rawText, issued in tafs], repeat = 3)
+	print("TAF decoder, " + str(len(TAF_CORPUS)) + " corpus TAFs:")
+	print("  speed:      %8.0f TAFs/s" % (len(tafs) / duration * 1000))
+	hourStart = isoTime("2026-10-18T18:00:00Z")
+	for count in TAF_STATIONS:
+		airports = ["S" + str(i) for i in range(count)]
+		records = "".join("<TAF><raw_text>" + TAF_CORPUS[i % len(TAF_CORPUS)][0].replace(decodeTaf(TAF_CORPUS[i % len(TAF_CORPUS)][0], hourStart)["stationId"], airport, 1) + "</raw_text><station_id>" + airport + "</station_id><issue_time>" + TAF_CORPUS[i % len(TAF_CORPUS)][1] + "</issue_time></TAF>" for i, airport in enumerate(airports))
+		content = ("<response><data>" + records + "</data></response>").encode()
+		print("  %5d LEDs: timeline of %d hours %8.2f ms" % (count, metarmap.TAF_HOURS, best(lambda: metarmap.tafAnimation([content], airports, hourStart), repeat = 3)))
+
+# Parse, compute, color and frame stages of every script on a synthetic response, in milliseconds by "script stage stations"
+def benchSuite():
+	scripts = [("map", metarmap, metarmap.MODES, True), ("metar", metar, { 'metar' : metar.metarColor }, False), ("temp", temp, { 'temp' : temp.tempColor }, True)]
+	results = {}
+	for count in SUITE_SIZES:
+		stations, content = syntheticResponse(count, observed = 1760000000)
+		repeat = 5 if count <= 5000 else 2
+		for name, script, colorFunctions, computes in scripts:
+			with contextlib.redirect_stdout(io.StringIO()):
+				results[name + " parse " + str(count)] = best(lambda: script.parseConditions([content], stations), repeat)
+				state = script.parseConditions([content], stations)
+			if computes:
+				results[name + " compute " + str(count)] = best(lambda: computeMetrics(state), repeat)
+				computeMetrics(state)
+			results[name + " color " + str(count)] = best(lambda: [colorFunction(state, flashCycle) for colorFunction in colorFunctions.values() for flashCycle in (False, True)], repeat)
+			results[name + " frames " + str(count)] = best(lambda: [compileFrames(state, colorFunction) for colorFunction in colorFunctions.values()], repeat)
+	return results
+
+# Print the suite times next to the baseline and return the stages that got slower
+def compareBaseline(results, baseline):
+	regressions = []
+	print("Stage suite, synthetic responses (ms, baseline, change):")
+	for key, value in results.items():
+		if key not in baseline:
+			print("  %-22s %10.3f" % (key, value))
+			continue
+		change = value / baseline[key] - 1 if baseline[key] > 0 else 0
+		regressed = value > baseline[key] * (1 + SUITE_TOLERANCE) and value - baseline[key] > SUITE_NOISE
+		print("  %-22s %10.3f %10.3f %+7.0f%%%s" % (key, value, baseline[key], change * 100, "  REGRESSION" if regressed else ""))
+		if regressed:
+			regressions.append(key)
+	return regressions
+
+def loadBaseline():
+	try:
+		with open(BASELINE_FILE, 'r') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+if "--save" in sys.argv or "--check" in sys.argv:
+	results = benchSuite()
+	regressions = compareBaseline(results, loadBaseline())
+	if "--save" in sys.argv:
+		with open(BASELINE_FILE, 'w') as f:
+			json.dump(results, f, indent = 1)
+		print("Saved the baseline to " + BASELINE_FILE)
+	elif regressions:
+		print(str(len(regressions)) + " stages are more than " + str(int(SUITE_TOLERANCE * 100)) + "% slower than the baseline: " + ", ".join(regressions))
+		sys.exit(1)
+	elif not os.path.exists(BASELINE_FILE):
+		print("No baseline at " + BASELINE_FILE + ", save one with --save")
+	sys.exit(0)
+
+benchDerivedMetrics()
+benchDecoder()
+benchTaf()
+benchChunkedFetch()
+benchStationState()
+benchWriter()
+benchGrid()
+benchFallback()
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+recording = arguments[0] if arguments else metarmap.CACHE_FILE
+if os.path.exists(recording):
+	benchPipeline(recording)
+else:
+	print("No recorded response at " + recording + ", skipping the pipeline benchmark.")
+compareBaseline(benchSuite(), loadBaseline())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import time
+
+DAYS = 732							# Days in the sun table, this year and the next starting on new year's eve
+
+# Sun event table for a city.
+# The dawn, sunrise, sunset and dusk times of every day are calculated with astral once and
+# stored on disk, so the running map never has to load the astral geocoder database again.
+# Each day is [local midnight, dawn, sunrise, sunset, dusk] in seconds since the epoch, with
+# None for events that do not happen that day (polar regions).
+def buildSunTable(cityName, start):
+	from astral.geocoder import database, lookup
+	from astral.sun import sun
+	city = lookup(cityName, database())
+	days = []
+	for offset in range(DAYS):
+		date = start + datetime.timedelta(days = offset)
+		midnight = datetime.datetime.combine(date, datetime.time(), tzinfo = city.tzinfo).timestamp()
+		try:
+			# query with the city's local day to keep sunset and sunrise on local day not zulu day
+			s = sun(city.observer, date = date, tzinfo = city.tzinfo)
+			days.append([midnight, s["dawn"].timestamp(), s["sunrise"].timestamp(), s["sunset"].timestamp(), s["dusk"].timestamp()])
+		except ValueError:
+			days.append([midnight, None, None, None, None])
+	return { "city" : cityName, "days" : days }
+
+# Index of the day in the table that contains now, or None if the table does not cover it
+def dayIndex(table, now):
+	days = table["days"]
+	index = int((now - days[0][0]) // 86400)
+	# Days are 23 or 25 hours long when daylight saving time changes
+	while 0 <= index + 1 < len(days) and days[index + 1][0] <= now:
+		index += 1
+	while 0 < index < len(days) and days[index][0] > now:
+		index -= 1
+	if 0 <= index < len(days) and days[index][0] <= now and (index + 1 < len(days) or now - days[index][0] < 86400):
+		return index
+	return None
+
+# Load the table from disk, building and saving a new one if it is missing, for another city or out of date
+def loadSunTable(cityName, path):
+	try:
+		with open(path, 'r') as f:
+			table = json.load(f)
+		if table["city"] == cityName and dayIndex(table, time.time()) is not None:
+			return table
+	except (OSError, ValueError, KeyError, IndexError):
+		pass
+	print("Calculating sun times for " + cityName)
+	today = datetime.date.today()
+	table = buildSunTable(cityName, datetime.date(today.year, 1, 1) - datetime.timedelta(days = 1))
+	try:
+		with open(path + ".tmp", 'w') as f:
+			json.dump(table, f)
+		os.replace(path + ".tmp", path)
+	except OSError as e:
+		print("Could not save sun table: " + str(e))
+	return table
+
+# Day/night brightness with a smooth ramp from dawn to sunrise and from sunset to dusk.
+# Every lookup is an index into the sun table, brightness is rounded to steps of 0.001 so the
+# strip only has to be rewritten when the value actually changes.
+class BrightnessScheduler:
+	def __init__(self, table, night, day, cityName = None, path = None, step = 10):
+		self.table = table
+		self.night = night
+		self.day = day
+		self.cityName = cityName		# With path, used to extend the table once it runs out
+		self.path = path
+		self.step = step				# Seconds between updates while ramping
+
+	# Dawn, sunrise, sunset and dusk of the day that contains now
+	def events(self, now):
+		index = dayIndex(self.table, now)
+		if index is None and self.path is not None:
+			self.table = loadSunTable(self.cityName, self.path)
+			index = dayIndex(self.table, now)
+		if index is None:
+			return None
+		return self.table["days"][index][1:]
+
+	def brightness(self, now = None):
+		now = time.time() if now is None else now
+		events = self.events(now)
+		if events is None or None in events:
+			return self.day
+		dawn, sunrise, sunset, dusk = events
+		if now <= dawn or now >= dusk:
+			value = self.night
+		elif sunrise <= now <= sunset:
+			value = self.day
+		elif now < sunrise:
+			value = self.night + (self.day - self.night) * (now - dawn) / (sunrise - dawn)
+		else:
+			value = self.day + (self.night - self.day) * (now - sunset) / (dusk - sunset)
+		return round(value, 3)
+
+	# Seconds until the brightness may change next, for render loops that sleep while idle
+	def nextChange(self, now = None):
+		now = time.time() if now is None else now
+		events = self.events(now)
+		if events is None or None in events:
+			return 3600
+		dawn, sunrise, sunset, dusk = events
+		if dawn < now < sunrise or sunset < now < dusk:
+			return self.step
+		upcoming = [event - now for event in (dawn, sunset) if event > now]
+		# After dusk the next change is tomorrow's dawn, check again at midnight at the latest
+		index = dayIndex(self.table, now)
+		if index is not None and index + 1 < len(self.table["days"]):
+			upcoming.append(self.table["days"][index + 1][0] - now)
+		return max(1, min(upcoming + [86400]))
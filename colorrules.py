@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import json
+import numpy
+from stationstate import CATEGORY_CODES, STATE_DTYPE
+from weather import FtoC
+
+# Columns of the station state in degrees C, their limits can be given in degrees F
+CELSIUS_COLUMNS = ("tempC", "dewpointC", "tempWet", "WBGT")
+
+# Color rules of the modes, written as dictionaries like the ones in colors.json and compiled once into
+# lookup tables, so every station of a mode is colored in one vectorized pass without per-pixel Python.
+# A mode has the palette of the stations in "colors" and optional "flash" overlays, which replace the
+# colors of the stations they match in one phase of the animation:
+#   { "colors" : palette, "flash" : [{ "phase" : 0 or 1, "any" : [conditions], "all" : [conditions], "colors" : palette }] }
+# A palette is one of:
+#   [G,R,B]													the same color for every station
+#   { "column" : "tempC", "limits" : [...], "colors" : [...] }	bands, one color more than limits, a value on a limit is in the upper band
+#   { "column" : "flightCategory", "colors" : { "VFR" : [G,R,B], ... }, "default" : [G,R,B] }	one color per value of the column, default for the others
+# A condition is { "column" : "windSpeed", "above" : 30 } with one of above, atLeast, below, atMost or equals,
+# or without one to test the column for being true. Overlays match stations that meet any of "any" and all of "all".
+# Values are a column of the station state (see stationstate.STATE_DTYPE), "minus" subtracts another column,
+# e.g. { "column" : "tempC", "minus" : "dewpointC" } for the dewpoint spread, and "fahrenheit" : true takes the
+# limits of a column in degrees C in degrees F. Keys other than these are an error, so a misspelled comparison
+# is not silently taken for a test of the column being true.
+class ColorRule:
+	def __init__(self, palette, overlays):
+		self.palette = palette			# state -> colors of all stations
+		self.overlays = overlays		# (phase, condition, palette) in the order they are applied
+
+	# Colors of all stations, like the color functions of MODES
+	def __call__(self, state, flashCycle):
+		colors = self.palette(state)
+		phase = 1 if flashCycle else 0
+		for overlayPhase, condition, palette in self.overlays:
+			if overlayPhase == phase:
+				matched = condition(state)
+				if matched.any():
+					colors[matched] = palette(state)[matched]
+		return colors
+
+MODE_KEYS = ("colors", "flash")
+OVERLAY_KEYS = ("phase", "any", "all", "colors")
+PALETTE_KEYS = ("column", "minus", "fahrenheit", "limits", "colors", "default")
+
+def checkKeys(definition, keys, where):
+	unknown = [key for key in definition if key not in keys]
+	if unknown:
+		raise ValueError("Unknown key " + ", ".join(unknown) + " in " + where + " in color rules, use one of " + ", ".join(keys))
+
+def checkColumn(column):
+	if column not in STATE_DTYPE.names:
+		raise ValueError("Unknown column in color rules: " + str(column) + ", use one of " + ", ".join(STATE_DTYPE.names))
+	return column
+
+def checkColor(color):
+	if not isinstance(color, (list, tuple)) or len(color) != 3 or not all(isinstance(value, int) and 0 <= value <= 255 for value in color):
+		raise ValueError("Colors in color rules are [G,R,B] with values from 0 to 255, not " + json.dumps(color))
+	return tuple(color)
+
+# Function that returns the value of every station for a palette or condition
+def compileValues(definition):
+	column = checkColumn(definition.get("column"))
+	minus = definition.get("minus")
+	if minus is None:
+		return lambda state: state[column]
+	checkColumn(minus)
+	return lambda state: state[column].astype(numpy.float64) - state[minus]
+
+# Limits of bands or a condition in the unit of the column
+def convertLimit(definition, limit):
+	if not definition.get("fahrenheit"):
+		return limit
+	if definition["column"] not in CELSIUS_COLUMNS or definition.get("minus", definition["column"]) not in CELSIUS_COLUMNS:
+		raise ValueError("Only the columns " + ", ".join(CELSIUS_COLUMNS) + " can have limits in degrees F")
+	if definition.get("minus") is not None:
+		return numpy.asarray(limit, dtype = numpy.float64) * (5/9)
+	return FtoC(numpy.asarray(limit, dtype = numpy.float64))
+
+# Function that returns the colors of all stations for a palette
+def compilePalette(definition):
+	if isinstance(definition, (list, tuple)):
+		color = numpy.array(checkColor(definition), dtype = numpy.uint8)
+		return lambda state: numpy.tile(color, (len(state), 1))
+	if not isinstance(definition, dict):
+		raise ValueError("A palette in color rules is a color or a dictionary, not " + json.dumps(definition))
+	checkKeys(definition, PALETTE_KEYS, "a palette")
+	values = compileValues(definition)
+	colors = definition.get("colors")
+	if "limits" in definition:
+		limits = numpy.array(convertLimit(definition, definition["limits"]), dtype = numpy.float64)
+		if not isinstance(colors, list) or len(colors) != len(limits) + 1:
+			raise ValueError("Bands of " + definition["column"] + " need one color more than limits")
+		if numpy.any(numpy.diff(limits) <= 0):
+			raise ValueError("Limits of " + definition["column"] + " have to be increasing")
+		table = numpy.array([checkColor(color) for color in colors], dtype = numpy.uint8)
+		return lambda state: table[numpy.digitize(values(state), limits)]
+	if not isinstance(colors, dict):
+		raise ValueError("A palette of " + definition["column"] + " needs limits and a list of colors or a dictionary of colors")
+	# One table entry per value of the column, values outside the table get the default color
+	codes = {}
+	for key, color in colors.items():
+		if definition["column"] == "flightCategory" and key in CATEGORY_CODES:
+			codes[CATEGORY_CODES[key]] = checkColor(color)
+		elif key in ("true", "false"):
+			codes[int(key == "true")] = checkColor(color)
+		else:
+			try:
+				code = int(key)
+			except ValueError:
+				raise ValueError("Unknown value " + key + " of " + definition["column"] + " in color rules")
+			if code < 0:
+				raise ValueError("Values of " + definition["column"] + " in color rules cannot be negative")
+			codes[code] = checkColor(color)
+	if "default" not in definition:
+		raise ValueError("A palette of " + definition["column"] + " by value needs a default color for the other values")
+	default = checkColor(definition["default"])
+	table = numpy.array([codes.get(code, default) for code in range(max(codes, default = 0) + 2)], dtype = numpy.uint8)
+	last = len(table) - 1
+	def palette(state):
+		index = values(state).astype(numpy.int64)
+		return table[numpy.where(index < 0, last, numpy.minimum(index, last))]
+	return palette
+
+COMPARISONS = {
+	"above" : numpy.greater,
+	"atLeast" : numpy.greater_equal,
+	"below" : numpy.less,
+	"atMost" : numpy.less_equal,
+	"equals" : numpy.equal,
+}
+
+# Function that returns which stations meet a condition
+def compileCondition(definition):
+	if not isinstance(definition, dict):
+		raise ValueError("A condition in color rules is a dictionary, not " + json.dumps(definition))
+	checkKeys(definition, ("column", "minus", "fahrenheit") + tuple(COMPARISONS), "a condition")
+	values = compileValues(definition)
+	tests = [name for name in COMPARISONS if name in definition]
+	if len(tests) > 1:
+		raise ValueError("A condition on " + definition["column"] + " can only have one of " + ", ".join(COMPARISONS))
+	if not tests:
+		return lambda state: values(state).astype(numpy.bool_)
+	comparison = COMPARISONS[tests[0]]
+	limit = definition[tests[0]]
+	if definition["column"] == "flightCategory" and limit in CATEGORY_CODES:
+		limit = CATEGORY_CODES[limit]
+	limit = convertLimit(definition, limit)
+	return lambda state: comparison(values(state), limit)
+
+def compileOverlay(definition):
+	checkKeys(definition, OVERLAY_KEYS, "a flash overlay")
+	phase = definition.get("phase", 1)
+	if phase not in (0, 1):
+		raise ValueError("The phase of a flash overlay is 0 or 1, not " + json.dumps(phase))
+	anyOf = [compileCondition(condition) for condition in definition.get("any", [])]
+	allOf = [compileCondition(condition) for condition in definition.get("all", [])]
+	def condition(state):
+		matched = numpy.ones(len(state), dtype = numpy.bool_)
+		if anyOf:
+			matched = numpy.logical_or.reduce([test(state) for test in anyOf])
+		for test in allOf:
+			matched &= test(state)
+		return matched
+	return (phase, condition, compilePalette(definition.get("colors", [0,0,0])))
+
+def compileRule(definition):
+	if not isinstance(definition, dict):
+		raise ValueError("A mode in color rules is a dictionary, not " + json.dumps(definition))
+	checkKeys(definition, MODE_KEYS, "a mode")
+	if "colors" not in definition:
+		raise ValueError("A mode in color rules needs colors")
+	return ColorRule(compilePalette(definition["colors"]), [compileOverlay(overlay) for overlay in definition.get("flash", [])])
+
+# Compile the built-in modes and the modes of a colors.json file, which can replace built-in modes and add new ones.
+# The file is optional, modes are returned in the order of the built-in modes and then the file.
+def loadColorRules(path, builtins):
+	definitions = dict(builtins)
+	try:
+		with open(path) as f:
+			definitions.update(json.load(f)["modes"])
+	except FileNotFoundError:
+		pass
+	except (OSError, ValueError, KeyError, TypeError) as e:
+		raise ValueError("Could not read the color rules in " + path + ": " + str(e))
+	modes = {}
+	for name, definition in definitions.items():
+		try:
+			modes[name] = compileRule(definition)
+		except (ValueError, TypeError, AttributeError) as e:
+			raise ValueError("Mode " + name + " in " + path + ": " + str(e))
+	return modes
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Hand-written reports with the results they decode to, checked by tests/test_rawmetar.py and tests/test_taf.py
+# and decoded over and over by benchmark.py
+
+# Raw METAR reports with their expected flight category and lightning flag
+METAR_CORPUS = [
+	("KAUS 181853Z 17012G22KT 10SM FEW035 SCT250 29/18 A2998 RMK AO2 SLP145 T02940178", "VFR", False),
+	("KJFK 181851Z 04015KT 1 1/2SM -RA BR BKN008 OVC015 12/11 A2990 RMK AO2 LTG DSNT NW", "IFR", True),
+	("KSFO 181856Z 28008KT 1/4SM FG VV002 13/13 A3002 RMK AO2 SLP165", "LIFR", False),
+	("KDEN 181853Z VRB03KT P6SM VCTS SCT080CB M02/M08 A3020 RMK AO2", "VFR", True),
+	("KORD 181851Z 18010KT 4SM HZ OVC025 20/15 A2995 RMK AO2", "MVFR", False),
+	("KBOS 181854Z 00000KT 10SM CLR 15/05 A3010 RMK AO2", "VFR", False),
+	("KMIA 181853Z 09014G26KT 2SM +TSRA BKN012CB OVC040 24/23 A2987 RMK AO2 FRQ LTGICCG OHD", "IFR", True),
+	("KSEA 181853Z 19006KT 6SM -RA BR OVC030 11/09 A3001 RMK AO2", "MVFR", False),
+	("KMSP 181853Z 32018G27KT 3/4SM -SN BLSN OVC006 M05/M07 A3012 RMK AO2", "LIFR", False),
+	("KPHX 181851Z 26005KT 10SM SKC 41/M03 A2981 RMK AO2", "VFR", False),
+	("KDFW 181853Z 16011KT 10SM BKN045 OVC250 27/19 A2996", "VFR", False),
+	("KATL 181852Z 20008KT 5SM BR SCT009 BKN020 22/20 A3004 RMK AO2", "MVFR", False),
+	("EGLL 181850Z 24010MPS 9999 SCT035 14/08 Q1012", "VFR", False),
+	("LFPG 181830Z 21008KT CAVOK 17/09 Q1018 NOSIG", "VFR", False),
+	("KCAR 181853Z AUTO 36008KT 1/2SM FZFG VV001 M09/M09 A3026 RMK AO2", "LIFR", False),
+	("KTPA 181853Z 24010KT 10SM VCSH FEW025CB 31/24 A2995 RMK AO2 LTG DSNT E", "VFR", True),
+	# Without a visibility the ceiling alone decides the category
+	("KPWM 181853Z AUTO 36008KT OVC004 09/08 A3001 RMK AO2 VISNO", "LIFR", False),
+	("KBGR 181853Z AUTO 36008KT BKN018 09/05 A3001 RMK AO2 VISNO", "MVFR", False),
+]
+
+# Raw TAFs with their issue time and the expected flight category of some hours, None outside the validity
+TAF_CORPUS = [
+	("TAF KAUS 181720Z 1818/1924 17012G22KT P6SM SCT035 BKN250 FM182300 16008KT P6SM BKN040 TEMPO 1904/1908 3SM -TSRA BKN020CB BECMG 1912/1914 18015KT 5SM BR OVC012 PROB30 1920/1924 2SM TSRA OVC008 RMK NXT FCST BY 00Z",
+		"2026-10-18T17:20:00Z", [("2026-10-18T17:00:00Z", None), ("2026-10-18T18:00:00Z", "VFR"), ("2026-10-18T23:00:00Z", "VFR"), ("2026-10-19T05:00:00Z", "MVFR"), ("2026-10-19T10:00:00Z", "VFR"), ("2026-10-19T13:00:00Z", "MVFR"), ("2026-10-19T21:00:00Z", "IFR"), ("2026-10-20T00:00:00Z", None)]),
+	("TAF AMD KJFK 181930Z 1819/1924 04015KT 1 1/2SM -RA BR OVC008 FM190300 36010KT 3/4SM FG VV002 FM191500 31012KT P6SM SCT030",
+		"2026-10-18T19:30:00Z", [("2026-10-18T20:00:00Z", "IFR"), ("2026-10-19T02:00:00Z", "IFR"), ("2026-10-19T04:00:00Z", "LIFR"), ("2026-10-19T16:00:00Z", "VFR")]),
+	("TAF KSEA 312340Z 0100/0206 19006KT 6SM -RA OVC030 BECMG 0106/0108 P6SM BKN050",
+		"2026-10-31T23:40:00Z", [("2026-11-01T01:00:00Z", "MVFR"), ("2026-11-01T07:00:00Z", "VFR"), ("2026-11-02T05:00:00Z", "VFR"), ("2026-11-02T06:00:00Z", None)]),
+	("TAF EGLL 181658Z 1818/1924 24010KT 9999 SCT035 TEMPO 1818/1822 4000 SHRA BECMG 1900/1903 CAVOK",
+		"2026-10-18T16:58:00Z", [("2026-10-18T19:00:00Z", "IFR"), ("2026-10-18T23:00:00Z", "VFR"), ("2026-10-19T04:00:00Z", "VFR")]),
+	("TAF KDEN 181730Z 1818/1918 VRB03KT P6SM SCT080 PROB40 TEMPO 1820/1824 VRB25G40KT 1SM +TSRA BKN040CB FM190200 32010KT P6SM SKC",
+		"2026-10-18T17:30:00Z", [("2026-10-18T19:00:00Z", "VFR"), ("2026-10-18T21:00:00Z", "IFR"), ("2026-10-19T03:00:00Z", "VFR")]),
+	("TAF KMIA 181730Z 1818/1924 09014G26KT P6SM VCSH SCT025 TEMPO 1818/1822 2SM +TSRA BKN012CB FM190000 09010KT P6SM NSW SCT030",
+		"2026-10-18T17:30:00Z", [("2026-10-18T19:00:00Z", "IFR"), ("2026-10-19T01:00:00Z", "VFR")]),
+	("TAF KORD 181720Z 1818/1924 18010KT P6SM BKN030 TEMPO 2SM BR FM190000 20010KT P6SM OVC015",
+		"2026-10-18T17:20:00Z", [("2026-10-18T19:00:00Z", "MVFR"), ("2026-10-19T01:00:00Z", "MVFR")]),
+	("TAF KCAR 181740Z 1818/1918 36008KT 1/2SM FZFG VV001 FM182100 36010KT 2SM -SN OVC009 BECMG 1906/1908 P6SM OVC035",
+		"2026-10-18T17:40:00Z", [("2026-10-18T18:00:00Z", "LIFR"), ("2026-10-18T20:00:00Z", "LIFR"), ("2026-10-18T22:00:00Z", "IFR"), ("2026-10-19T09:00:00Z", "VFR")]),
+]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import queue
+import threading
+import time
+
+# Debounced button events for the render loop.
+# press() runs on the GPIO callback thread and only queues the event and sets wake, the render
+# loop takes the events off the queue itself, so mode changes never race with drawing a frame.
+class ButtonQueue:
+	def __init__(self, wake, debounce = 0.2):
+		self.wake = wake
+		self.debounce = debounce			# Seconds in which further presses are ignored
+		self.events = queue.Queue()
+		self.lastPress = None
+
+	# GPIO event callback
+	def press(self, channel):
+		now = time.monotonic()
+		if self.lastPress is not None and now - self.lastPress < self.debounce:
+			return
+		self.lastPress = now
+		self.events.put(channel)
+		self.wake.set()
+
+	# All events queued since the last call, without blocking
+	def drain(self):
+		events = []
+		while True:
+			try:
+				events.append(self.events.get_nowait())
+			except queue.Empty:
+				return events
+
+# Write a JSON file atomically, readers see either the old or the new file but never a partial one
+def writeJson(path, data):
+	tmp = path + ".tmp"
+	with open(tmp, 'w') as outfile:
+		json.dump(data, outfile)
+		outfile.flush()
+		os.fsync(outfile.fileno())
+	os.replace(tmp, path)
+
+# Saves the configuration on a background thread so the render loop never waits for the SD card.
+# Only the latest configuration is written when several saves are requested in quick succession.
+class ConfigSaver:
+	def __init__(self, path):
+		self.path = path
+		self.pending = None
+		self.lock = threading.Lock()
+		self.requested = threading.Event()
+		self.thread = threading.Thread(target = self.run, daemon = True)
+		self.thread.start()
+
+	def save(self, config):
+		with self.lock:
+			self.pending = dict(config)
+		self.requested.set()
+
+	def run(self):
+		while True:
+			self.requested.wait()
+			self.requested.clear()
+			with self.lock:
+				config = self.pending
+				self.pending = None
+			if config is None:
+				continue
+			try:
+				writeJson(self.path, config)
+			except OSError as e:
+				print("Could not save config: " + str(e))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import gzip
+import http.client
+import json
+import os
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Conditional, cached fetching of the aviationweather.gov data server response.
+# One keep-alive connection is reused between refreshes and every request carries the
+# ETag/Last-Modified of the previous response, so an unchanged feed costs a 304 without a body.
+# The last good response is kept gzip compressed on disk together with its validators, so
+# a restart or a network outage can render right away from the cached copy.
+class CachedFetcher:
+	def __init__(self, url, cacheFile, timeout = 30):
+		self.url = url
+		self.cacheFile = cacheFile					# Compressed copy of the last good response
+		self.metaFile = cacheFile + ".json"			# Validators and URL of the cached response
+		self.timeout = timeout
+		self.connection = None
+		self.content = None
+		self.etag = None
+		self.lastModified = None
+		self.modified = False						# True if the last fetch returned new content
+		self.bytesDownloaded = 0					# Body bytes received by the last fetch
+		self.loadCache()
+
+	# Read the last good response from disk, ignoring it if it was made for a different URL
+	def loadCache(self):
+		try:
+			with open(self.metaFile, 'r') as f:
+				meta = json.load(f)
+			if meta.get('url') != self.url:
+				return
+			with gzip.open(self.cacheFile, 'rb') as f:
+				self.content = f.read()
+			self.etag = meta.get('etag')
+			self.lastModified = meta.get('lastModified')
+		except (OSError, ValueError, EOFError):
+			self.content = None
+
+	# Write the response and its validators next to each other, replacing the old files atomically
+	def saveCache(self):
+		tmp = self.cacheFile + ".tmp"
+		with gzip.open(tmp, 'wb') as f:
+			f.write(self.content)
+		os.replace(tmp, self.cacheFile)
+		with open(self.metaFile + ".tmp", 'w') as f:
+			json.dump({ "url" : self.url, "etag" : self.etag, "lastModified" : self.lastModified }, f)
+		os.replace(self.metaFile + ".tmp", self.metaFile)
+
+	def connect(self):
+		parts = urllib.parse.urlsplit(self.url)
+		if parts.scheme == 'https':
+			self.connection = http.client.HTTPSConnection(parts.netloc, timeout = self.timeout)
+		else:
+			self.connection = http.client.HTTPConnection(parts.netloc, timeout = self.timeout)
+
+	def close(self):
+		if self.connection is not None:
+			self.connection.close()
+			self.connection = None
+
+	def request(self, headers):
+		parts = urllib.parse.urlsplit(self.url)
+		path = parts.path + ("?" + parts.query if parts.query else "")
+		if self.connection is None:
+			self.connect()
+		self.connection.request("GET", path, headers = headers)
+		response = self.connection.getresponse()
+		body = response.read()
+		return response, body
+
+	# Fetch the feed and return its content, which is the cached content if the server answered 304
+	def fetch(self):
+		self.modified = False
+		headers = { "Accept-Encoding" : "gzip", "Connection" : "keep-alive" }
+		if self.content is not None and self.etag:
+			headers["If-None-Match"] = self.etag
+		if self.content is not None and self.lastModified:
+			headers["If-Modified-Since"] = self.lastModified
+
+		try:
+			response, body = self.request(headers)
+		except (http.client.HTTPException, ConnectionError):
+			# The server may have dropped the idle keep-alive connection, retry once on a new one
+			self.close()
+			try:
+				response, body = self.request(headers)
+			except Exception:
+				self.close()
+				raise
+		except Exception:
+			self.close()
+			raise
+		if response.getheader("Connection", "").lower() == "close":
+			self.close()
+
+		self.bytesDownloaded = len(body)
+		if response.status == 304 and self.content is not None:
+			self.modified = False
+			return self.content
+		if response.status != 200:
+			raise http.client.HTTPException("HTTP " + str(response.status) + " " + response.reason)
+
+		if response.getheader("Content-Encoding", "").lower() == "gzip":
+			body = gzip.decompress(body)
+		self.content = body
+		self.etag = response.getheader("ETag")
+		self.lastModified = response.getheader("Last-Modified")
+		self.modified = True
+		try:
+			self.saveCache()
+		except OSError as e:
+			print("Could not write METAR cache: " + str(e))
+		return self.content
+
+# Fetches a long station list in chunks of chunkSize stations, several chunks at the same time.
+# Every chunk has its own CachedFetcher with its own keep-alive connection and cache file, so
+# the URLs stay short, one slow response does not hold up the others and a failed chunk keeps
+# its last good response while the rest of the map is updated. The pool has a thread per chunk up to workers,
+# with more chunks than workers a fetch takes one response longer for every further workers chunks.
+class ChunkedFetcher:
+	def __init__(self, url, stations, cacheFile, chunkSize = 300, workers = 16, timeout = 30):
+		chunks = [stations[i:i + chunkSize] for i in range(0, len(stations), chunkSize)] or [[]]
+		root, ext = os.path.splitext(cacheFile)
+		self.fetchers = [CachedFetcher(url + ",".join(chunk), cacheFile if len(chunks) == 1 else root + "-" + str(i) + ext, timeout) for i, chunk in enumerate(chunks)]
+		self.pool = ThreadPoolExecutor(max_workers = max(1, min(workers, len(chunks))))
+		self.modified = False						# True if any chunk returned new content
+		self.bytesDownloaded = 0					# Body bytes received by the last fetch
+		self.failed = 0								# Chunks that failed in the last fetch
+
+	# Last good response of every chunk that has one
+	@property
+	def contents(self):
+		return [fetcher.content for fetcher in self.fetchers if fetcher.content is not None]
+
+	# Fetch all chunks and return the responses, failing only if every chunk failed
+	def fetch(self):
+		futures = [self.pool.submit(fetcher.fetch) for fetcher in self.fetchers]
+		errors = []
+		for future in futures:
+			try:
+				future.result()
+			except Exception as e:
+				errors.append(e)
+		self.failed = len(errors)
+		self.modified = any(fetcher.modified for fetcher in self.fetchers)
+		self.bytesDownloaded = sum(fetcher.bytesDownloaded for fetcher in self.fetchers)
+		if len(errors) == len(self.fetchers):
+			raise errors[0]
+		if errors:
+			print(str(len(errors)) + " of " + str(len(self.fetchers)) + " chunks failed, keeping their last good data: " + str(errors[0]))
+		return self.contents
+
+	def close(self):
+		for fetcher in self.fetchers:
+			fetcher.close()
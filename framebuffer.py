@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import json
+import struct
+import time
+import numpy
+from multiprocessing import shared_memory
+
+HEADER_DTYPE = numpy.dtype([("sequence", numpy.uint64), ("capacity", numpy.uint64), ("length", numpy.uint64, (2,)), ("heartbeat", numpy.float64)])
+
+# Double buffer in shared memory between the data worker process and the renderer.
+# The writer fills the slot the reader is not using and then counts the sequence up, which makes
+# that slot the current one. The reader copies the current slot and checks that the sequence did not
+# move while it was copying, so it never sees a half written payload and the writer never waits.
+# The header also carries the worker's heartbeat for the watchdog.
+class SharedBuffer:
+	def __init__(self, name = None, size = 0):
+		if name is None:
+			self.memory = shared_memory.SharedMemory(create = True, size = HEADER_DTYPE.itemsize + 2 * size)
+		else:
+			self.memory = shared_memory.SharedMemory(name = name)
+		self.header = numpy.ndarray((1,), dtype = HEADER_DTYPE, buffer = self.memory.buf)
+		if name is None:
+			self.header[0] = (0, size, (0, 0), time.time())
+		self.capacity = int(self.header["capacity"][0])
+		self.name = self.memory.name
+		self.last = 0			# Sequence of the payload this side read last
+
+	def slot(self, index):
+		start = HEADER_DTYPE.itemsize + index * self.capacity
+		return self.memory.buf[start:start + self.capacity]
+
+	def publish(self, payload):
+		if len(payload) > self.capacity:
+			raise ValueError("Payload of " + str(len(payload)) + " bytes does not fit into the shared buffer of " + str(self.capacity) + " bytes")
+		sequence = int(self.header["sequence"][0])
+		index = (sequence + 1) % 2
+		self.slot(index)[:len(payload)] = payload
+		self.header["length"][0, index] = len(payload)
+		self.header["sequence"][0] = sequence + 1
+
+	# The newest payload, or None if there is nothing new since the last read
+	def read(self):
+		while True:
+			sequence = int(self.header["sequence"][0])
+			if sequence == self.last:
+				return None
+			index = sequence % 2
+			payload = bytes(self.slot(index)[:int(self.header["length"][0, index])])
+			if int(self.header["sequence"][0]) == sequence:
+				self.last = sequence
+				return payload
+
+	def beat(self, timestamp = None):
+		self.header["heartbeat"][0] = time.time() if timestamp is None else timestamp
+
+	def heartbeat(self):
+		return float(self.header["heartbeat"][0])
+
+	def close(self):
+		del self.header
+		self.memory.close()
+
+	def unlink(self):
+		self.memory.unlink()
+
+# Frames of every map and mode as one payload: the length of a JSON index, the index and the frames as 3 bytes per LED.
+# Animations repeat frames a lot, e.g. a replay shows every snapshot for many frames, so every distinct frame is
+# stored once and the index lists the frames of every animation. Unpacked frames are bytes like frameBytes(),
+# which FrameWriter sends as they are, and animations showing the same frame share it.
+def packFrames(maps):
+	unique = {}
+	chunks = []
+	offset = 0
+	index = { "frames" : [], "maps" : [] }
+	for animations in maps:
+		entry = {}
+		for mode, frames in animations.items():
+			numbers = []
+			for frame in frames:
+				colors = numpy.array(frame, dtype = numpy.uint8).tobytes()
+				number = unique.get(colors)
+				if number is None:
+					number = unique[colors] = len(chunks)
+					chunks.append(colors)
+					index["frames"].append([offset, len(frame)])
+					offset += len(colors)
+				numbers.append(number)
+			entry[mode] = numbers
+		index["maps"].append(entry)
+	head = json.dumps(index).encode()
+	return struct.pack("<I", len(head)) + head + b"".join(chunks)
+
+# Bytes of the largest payload packFrames makes of maps with ledCounts LEDs each and up to frameCounts[mode] frames of every mode, for the size of a
+# SharedBuffer. The index is measured with every frame distinct and every number in it as wide as it can get, so it grows with the maps and modes.
+def packedSize(ledCounts, frameCounts):
+	frames = sum(frameCounts.values()) * len(ledCounts)
+	data = sum(ledCounts) * 3 * sum(frameCounts.values())
+	index = { "frames" : [[data, max(ledCounts, default = 0)]] * frames, "maps" : [{ mode : [frames] * count for mode, count in frameCounts.items() }] * len(ledCounts) }
+	return 4 + len(json.dumps(index).encode()) + data
+
+def unpackFrames(payload):
+	length = struct.unpack_from("<I", payload)[0]
+	index = json.loads(payload[4:4 + length])
+	data = memoryview(payload)[4 + length:]
+	frames = [bytes(data[offset:offset + leds * 3]) for offset, leds in index["frames"]]
+	return [{ mode : [frames[number] for number in numbers] for mode, numbers in entry.items() } for entry in index["maps"]]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import time
+import numpy
+
+COLOR_CLEAR = (0,0,0)
+
+# Precompiled LED frames.
+# The color of every LED only depends on the station data and the animation phase, so each mode
+# is compiled into one frame per phase whenever new data arrives and the render loop only has to
+# pick a frame and send it. colorFunction(state, flashCycle) returns the colors of all rows of the
+# station state at once. Rows without a report, including NULL entries in the airports list, stay dark,
+# stations on the map without a report and without a neighbour standing in get staleColor.
+def compileFrames(state, colorFunction, staleColor = COLOR_CLEAR):
+	frames = []
+	for flashCycle in (False, True):
+		colors = numpy.array(colorFunction(state, flashCycle), dtype = numpy.uint8)
+		colors[~state["reported"]] = COLOR_CLEAR
+		colors[state["missing"] & ~state["reported"]] = staleColor
+		frames.append(list(map(tuple, colors.tolist())))
+	return frames
+
+# Frames of the LEDs start to end, e.g. of one map on a longer strip, with the colors scaled by brightness
+# and their channels in the order of channels. The frames are returned as they are if nothing changes.
+def segmentFrames(frames, start, end, brightness = 1.0, channels = None):
+	if start == 0 and all(len(frame) == end for frame in frames) and brightness == 1.0 and channels is None:
+		return frames
+	colors = numpy.array([frame[start:end] for frame in frames], dtype = numpy.float32).reshape(len(frames), end - start, 3)
+	if channels is not None:
+		colors = colors[:, :, channels]
+	colors = numpy.round(colors * brightness).astype(numpy.uint8)
+	return [list(map(tuple, frame)) for frame in colors.tolist()]
+
+# Frames that keep every LED dark, used for unknown modes
+def blankFrames(airports):
+	return [[COLOR_CLEAR] * len(airports), [COLOR_CLEAR] * len(airports)]
+
+# Frames as bytes, 3 per LED in the order of the color tuples, the form FrameWriter sends without converting anything
+def frameBytes(frames):
+	return [numpy.array(frame, dtype = numpy.uint8).tobytes() for frame in frames]
+
+# Brightness of every possible channel value, truncated like NeoPixel does
+def brightnessTable(brightness):
+	return (numpy.arange(256) * min(max(brightness, 0.0), 1.0)).astype(numpy.uint8)
+
+# Sends frames to the strip, skipping frames that are identical to the one already shown.
+# Every write is a full transfer to all LEDs, so an unchanged frame is counted and dropped instead.
+# Brightness and the channel order of the strip are applied to the whole frame at once with a table
+# lookup into one preallocated buffer, which goes to the strip in a single writeBytes(). Frames can be
+# lists of color tuples or, cheaper, bytes from frameBytes().
+class FrameWriter:
+	def __init__(self, pixels, metrics = None, brightness = 1.0):
+		self.pixels = pixels
+		self.metrics = metrics	# Optional Metrics that gets the duration of every encode and show
+		self.last = None		# Frame currently on the LEDs
+		self.shown = 0			# Number of frames sent to the strip
+		self.skipped = 0		# Number of writes avoided because nothing changed
+		self.buffer = bytearray(len(pixels) * 3)
+		self.colors = numpy.frombuffer(self.buffer, dtype = numpy.uint8)
+		self.channels = pixels.channels
+		self.setBrightness(brightness)
+
+	# Bytes for the strip of a frame, a view of the writer's buffer
+	def encode(self, frame):
+		if isinstance(frame, (bytes, bytearray, memoryview)):
+			colors = numpy.frombuffer(frame, dtype = numpy.uint8)
+		else:
+			colors = numpy.array(frame, dtype = numpy.uint8).ravel()
+		if self.channels is not None:
+			colors = colors.reshape(-1, 3)[:, self.channels].ravel()
+		numpy.take(self.table, colors, out = self.colors[:len(colors)])
+		return memoryview(self.buffer)[:len(colors)]
+
+	# Send a frame if it differs from the last one, returns True if the strip was written
+	def write(self, frame):
+		if frame is self.last or frame == self.last:
+			self.skipped += 1
+			return False
+		start = time.perf_counter()
+		data = self.encode(frame)
+		encoded = time.perf_counter()
+		self.pixels.writeBytes(data)
+		if self.metrics is not None:
+			self.metrics.observe("metarmap_stage_seconds", encoded - start, 'stage="encode"')
+			self.metrics.observe("metarmap_stage_seconds", time.perf_counter() - encoded, 'stage="show"')
+		self.last = frame
+		self.shown += 1
+		return True
+
+	# Scale all following frames, the table is only built when the brightness changes
+	def setBrightness(self, brightness):
+		self.brightness = brightness
+		self.table = brightnessTable(brightness)
+		self.invalidate()
+
+	# Force the next frame to be written, e.g. after the brightness changed
+	def invalidate(self):
+		self.last = None
+
+	def stats(self):
+		return "Frames shown: " + str(self.shown) + ", writes avoided: " + str(self.skipped)
+
+# True if the frames of an animation differ, i.e. they have to be alternated at all
+def isAnimated(frames):
+	return any(frame != frames[0] for frame in frames[1:])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import numpy
+
+# Bilinear interpolation from a regular latitude/longitude grid to the LED positions.
+# For every LED the four surrounding grid points and their weights are found once, so turning a
+# grid of values into one value per LED is a single gather and a weighted sum. LEDs without a
+# position or outside the grid get NaN, and so do LEDs whose grid points are all missing (masked).
+class GridInterpolator:
+	def __init__(self, key, indices, weights):
+		self.key = key				# Grid definition and LED positions the weights were built for
+		self.indices = indices		# Flat grid index of the four corners of every LED
+		self.weights = weights		# Bilinear weights of the corners, 0 for LEDs outside the grid
+
+	def interpolate(self, values):
+		corners = numpy.ma.filled(numpy.ma.asarray(values, dtype = numpy.float64), numpy.nan).ravel()[self.indices]
+		valid = ~numpy.isnan(corners) & (self.weights > 0)
+		weights = numpy.where(valid, self.weights, 0.0)
+		total = weights.sum(axis = 1)
+		weighted = (numpy.where(valid, corners, 0.0) * weights).sum(axis = 1)
+		return numpy.where(total > 0, weighted / numpy.where(total > 0, total, 1.0), numpy.nan)
+
+# Find the corners and weights of every position on the grid with the 2D latitude and longitude arrays of GRIB latlons()
+def buildInterpolator(key, lats, lons, stationLats, stationLons):
+	latAxis = lats[:, 0]
+	lonAxis = lons[0, :]
+	if not (numpy.allclose(lats, latAxis[:, None]) and numpy.allclose(lons, lonAxis[None, :])):
+		raise ValueError("only regular latitude/longitude grids are supported")
+	rows, columns = len(latAxis), len(lonAxis)
+	descending = latAxis[0] > latAxis[-1]
+	latAscending = latAxis[::-1] if descending else latAxis
+	step = (lonAxis[-1] - lonAxis[0]) / (columns - 1)
+	wraps = abs(lonAxis[-1] - lonAxis[0] + step - 360) < step / 2
+
+	stationLats = numpy.asarray(stationLats, dtype = numpy.float64)
+	stationLons = numpy.asarray(stationLons, dtype = numpy.float64)
+	known = ~(numpy.isnan(stationLats) | numpy.isnan(stationLons))
+	stationLats = numpy.where(known, stationLats, latAscending[0])
+	stationLons = numpy.where(known, (stationLons - lonAxis[0]) % 360 + lonAxis[0], lonAxis[0])
+
+	i0 = numpy.clip(numpy.searchsorted(latAscending, stationLats, side = 'right') - 1, 0, rows - 2)
+	t = (stationLats - latAscending[i0]) / (latAscending[i0 + 1] - latAscending[i0])
+	j0 = numpy.clip(numpy.searchsorted(lonAxis, stationLons, side = 'right') - 1, 0, columns - 1)
+	j1 = j0 + 1
+	if wraps:
+		# Between the last column and the first one again
+		u = (stationLons - lonAxis[j0]) / step
+		j1 = j1 % columns
+	else:
+		j0 = numpy.minimum(j0, columns - 2)
+		j1 = j0 + 1
+		u = (stationLons - lonAxis[j0]) / (lonAxis[j1] - lonAxis[j0])
+	inside = known & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+	i1 = i0 + 1
+	if descending:
+		i0, i1 = rows - 1 - i0, rows - 1 - i1
+	indices = numpy.stack([i0 * columns + j0, i0 * columns + j1, i1 * columns + j0, i1 * columns + j1], axis = 1)
+	weights = numpy.stack([(1 - t) * (1 - u), (1 - t) * u, t * (1 - u), t * u], axis = 1)
+	weights[~inside] = 0
+	return GridInterpolator(key, indices, weights)
+
+# Identity of a GRIB message's grid, all messages on the same grid can share the interpolation weights
+def gridKey(grb):
+	return " ".join(str(grb[name]) for name in ("gridType", "Ni", "Nj", "latitudeOfFirstGridPointInDegrees", "longitudeOfFirstGridPointInDegrees", "latitudeOfLastGridPointInDegrees", "longitudeOfLastGridPointInDegrees"))
+
+# Field of a GRIB2 file at the LED positions.
+# The interpolation weights are built once per grid and set of LED positions and kept in
+# weightsFile, so later GRIB files on the same grid never have to search the grid again.
+class GribOverlay:
+	def __init__(self, path, field, weightsFile):
+		self.path = path
+		self.field = field				# Name of the GRIB message, e.g. 'UV index'
+		self.weightsFile = weightsFile
+		self.interpolator = None
+		self.mtime = None				# Modification time of the GRIB file the values were read from
+		self.values = None
+		self.valuesKey = None
+
+	# True if the GRIB file changed since it was last read
+	def modified(self):
+		try:
+			return os.path.getmtime(self.path) != self.mtime
+		except OSError:
+			return False
+
+	def loadInterpolator(self, key, grb, stationLats, stationLons):
+		try:
+			with numpy.load(self.weightsFile) as cached:
+				if str(cached["key"]) == key:
+					return GridInterpolator(key, cached["indices"], cached["weights"])
+		except (OSError, ValueError, KeyError):
+			pass
+		print("Calculating grid interpolation weights for " + self.field)
+		lats, lons = grb.latlons()
+		interpolator = buildInterpolator(key, lats, lons, stationLats, stationLons)
+		try:
+			with open(self.weightsFile + ".tmp", 'wb') as f:
+				numpy.savez(f, key = key, indices = interpolator.indices, weights = interpolator.weights)
+			os.replace(self.weightsFile + ".tmp", self.weightsFile)
+		except OSError as e:
+			print("Could not save grid weights: " + str(e))
+		return interpolator
+
+	# Value of the field at every position, NaN where there is none
+	def stationValues(self, stationLats, stationLons):
+		mtime = os.path.getmtime(self.path)
+		positionsKey = zlib.crc32(numpy.asarray(stationLats, dtype = numpy.float64).tobytes() + numpy.asarray(stationLons, dtype = numpy.float64).tobytes())
+		if mtime == self.mtime and positionsKey == self.valuesKey:
+			return self.values
+		import pygrib
+		grbs = pygrib.open(self.path)
+		try:
+			grb = grbs.select(name = self.field)[0]
+			key = gridKey(grb) + " " + str(positionsKey)
+			if self.interpolator is None or self.interpolator.key != key:
+				self.interpolator = self.loadInterpolator(key, grb, stationLats, stationLons)
+			self.values = self.interpolator.interpolate(grb.values)
+		finally:
+			grbs.close()
+		self.mtime = mtime
+		self.valuesKey = positionsKey
+		return self.values
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import struct
+import sys
+import zlib
+
+# LED strip and button backends.
+# "neopixel" drives the real strip and RPi.GPIO, "memory" keeps every shown frame in a list and
+# "terminal" also prints each frame as a row of colored blocks, so the data and render path can
+# run and be profiled on any Linux box. Colors are (G,R,B) tuples like the ones in the scripts.
+# Every strip takes a whole frame at once with writeBytes(), 3 bytes per LED that already have the
+# brightness applied and are in the order of channels, the bytes of each color tuple to send.
+
+# Bytes of a color tuple in the order a strip sends them. NeoPixel reads the tuples as (R,G,B)
+# and sends them in pixel_order, so e.g. a GRB strip sends the second value first.
+def wireChannels(order):
+	if sorted(order) != ["B", "G", "R"]:
+		raise ValueError("Unknown LED order: " + str(order))
+	return ["RGB".index(channel) for channel in order]
+
+# Real WS281x strip, the Raspberry Pi libraries are only imported when it is used.
+# NeoPixel only sets up the pin, the frames go to the driver as they are without its per-pixel brightness and reordering.
+class NeoPixelStrip:
+	def __init__(self, pin, count, order):
+		import board
+		import neopixel
+		from neopixel_write import neopixel_write
+		self.strip = neopixel.NeoPixel(getattr(board, pin), count, brightness = 1.0, pixel_order = getattr(neopixel, order), auto_write = False)
+		self.transmit = neopixel_write
+		self.count = count
+		self.channels = wireChannels(order)
+
+	def __len__(self):
+		return self.count
+
+	def writeBytes(self, buffer):
+		self.transmit(self.strip.pin, buffer)
+
+	def deinit(self):
+		self.strip.deinit()
+
+# In-memory strip, the frames are kept as they were sent
+class RecordingStrip:
+	channels = None					# Colors are kept in the order of the tuples
+
+	def __init__(self, count, keep = 100):
+		self.count = count
+		self.buffer = bytearray(count * 3)
+		self.frames = []				# Last shown frames as bytes, oldest first
+		self.keep = keep				# Number of frames to keep, None keeps all of them
+		self.shows = 0
+
+	def __len__(self):
+		return self.count
+
+	# Color of one LED in the last written frame
+	def __getitem__(self, index):
+		return tuple(self.buffer[index * 3:index * 3 + 3])
+
+	def writeBytes(self, buffer):
+		self.buffer[:len(buffer)] = buffer
+		self.shows += 1
+		self.frames.append(bytes(self.buffer))
+		if self.keep is not None and len(self.frames) > self.keep:
+			del self.frames[0]
+
+	def deinit(self):
+		self.writeBytes(bytes(self.count * 3))
+
+	# Write the last shown frame as a PNG, one block of scale x scale pixels per LED
+	def savePng(self, path, scale = 8, width = 50):
+		frame = self.frames[-1] if self.frames else self.buffer
+		rows = (self.count + width - 1) // width
+		raw = bytearray()
+		for row in range(rows):
+			line = bytearray()
+			for col in range(width):
+				i = row * width + col
+				g, r, b = frame[i * 3:i * 3 + 3] if i < self.count else (0,0,0)
+				line += bytes((r, g, b)) * scale
+			for y in range(scale):
+				raw += b"\x00" + line
+		def chunk(kind, data):
+			return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+		with open(path, 'wb') as f:
+			f.write(b"\x89PNG\r\n\x1a\n")
+			f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width * scale, rows * scale, 8, 2, 0, 0, 0)))
+			f.write(chunk(b"IDAT", zlib.compress(bytes(raw))))
+			f.write(chunk(b"IEND", b""))
+
+# Recording strip that also draws every shown frame in a 24-bit color terminal
+class TerminalStrip(RecordingStrip):
+	def __init__(self, count, width = 50, out = sys.stdout):
+		RecordingStrip.__init__(self, count, keep = 1)
+		self.width = width
+		self.out = out
+
+	def writeBytes(self, buffer):
+		RecordingStrip.writeBytes(self, buffer)
+		lines = []
+		for start in range(0, self.count, self.width):
+			line = ""
+			for i in range(start, min(start + self.width, self.count)):
+				g, r, b = self.buffer[i * 3:i * 3 + 3]
+				line += "\x1b[48;2;%d;%d;%dm " % (r, g, b)
+			lines.append(line + "\x1b[0m")
+		self.out.write("\x1b[H" + "\n".join(lines) + "\n")
+		self.out.flush()
+
+# Create the strip for a backend name
+def createStrip(backend, pin, count, order):
+	if backend == 'neopixel':
+		return NeoPixelStrip(pin, count, order)
+	elif backend == 'memory':
+		return RecordingStrip(count)
+	elif backend == 'terminal':
+		return TerminalStrip(count)
+	raise ValueError("Unknown LED backend: " + str(backend))
+
+# Channels to swap in the colors of a segment whose LEDs have another order than the strip they are part of,
+# e.g. an RGB segment chained behind a GRB strip, None if the orders are the same
+def channelOrder(stripOrder, order):
+	if order == stripOrder:
+		return None
+	if sorted(stripOrder) != sorted(order) or len(order) != 3:
+		raise ValueError("Cannot show " + order + " LEDs on a " + stripOrder + " strip")
+	channels = [0, 1, 2]
+	for stripChannel, channel in zip(stripOrder, order):
+		channels["RGB".index(stripChannel)] = "RGB".index(channel)
+	return channels
+
+# Stand-in for RPi.GPIO, button presses are simulated by calling press(pin)
+class FakeGPIO:
+	IN = 'in'
+	OUT = 'out'
+	PUD_DOWN = 'down'
+	PUD_UP = 'up'
+	RISING = 'rising'
+	FALLING = 'falling'
+	BOTH = 'both'
+
+	def __init__(self):
+		self.callbacks = {}
+
+	def setwarnings(self, flag):
+		pass
+
+	def setmode(self, mode):
+		pass
+
+	def setup(self, pin, direction, pull_up_down = None):
+		pass
+
+	def add_event_detect(self, pin, edge, callback = None, bouncetime = None):
+		self.callbacks[pin] = callback
+
+	def cleanup(self):
+		self.callbacks = {}
+
+	def press(self, pin):
+		if self.callbacks.get(pin) is not None:
+			self.callbacks[pin](pin)
+
+# RPi.GPIO for the neopixel backend, the stand-in for everything else
+def loadGPIO(backend):
+	if backend == 'neopixel':
+		import RPi.GPIO as GPIO
+		return GPIO
+	return FakeGPIO()
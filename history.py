@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import numpy
+from stationstate import STATE_DTYPE
+
+MAGIC = b"METARHS1"
+HEADER_DTYPE = numpy.dtype([("magic", "S8"), ("layout", numpy.uint32), ("capacity", numpy.uint32), ("count", numpy.uint64)])
+
+# Observation history, a fixed number of station state snapshots in a ring buffer on disk.
+# The file is memory-mapped and has its full size from the start, so the history survives restarts
+# and neither RAM nor the SD card grows with it: once it is full every snapshot replaces the oldest.
+# Each snapshot is the time it was taken and the station state columns of every LED, so frames can
+# be compiled from it directly. A snapshot that equals the newest stored one is not stored again.
+class ObservationHistory:
+	def __init__(self, path, airports, capacity):
+		self.path = path
+		self.capacity = capacity
+		self.recordDtype = numpy.dtype([("time", numpy.float64), ("state", STATE_DTYPE, (len(airports),))])
+		# Identifies the LED order and the row format, a history written for other airports is started over
+		self.layout = zlib.crc32(("\n".join(airports) + str(STATE_DTYPE.descr)).encode())
+		if not self.load():
+			self.create()
+
+	def size(self):
+		return HEADER_DTYPE.itemsize + self.capacity * self.recordDtype.itemsize
+
+	# Map an existing history file, returns False if there is none or it was written with another layout
+	def load(self):
+		try:
+			if os.path.getsize(self.path) != self.size():
+				return False
+			header = numpy.memmap(self.path, dtype = HEADER_DTYPE, mode = 'r+', shape = (1,))
+		except (OSError, ValueError):
+			return False
+		if header["magic"][0] != MAGIC or header["layout"][0] != self.layout or header["capacity"][0] != self.capacity:
+			return False
+		self.header = header
+		self.records = numpy.memmap(self.path, dtype = self.recordDtype, mode = 'r+', offset = HEADER_DTYPE.itemsize, shape = (self.capacity,))
+		return True
+
+	# Allocate an empty history file at its full size and replace the old one atomically
+	def create(self):
+		print("Starting a new observation history in " + self.path)
+		tmp = self.path + ".tmp"
+		with open(tmp, 'wb') as f:
+			f.truncate(self.size())
+		header = numpy.memmap(tmp, dtype = HEADER_DTYPE, mode = 'r+', shape = (1,))
+		header[0] = (MAGIC, self.layout, self.capacity, 0)
+		header.flush()
+		del header
+		os.replace(tmp, self.path)
+		self.load()
+
+	# Store a snapshot of the station state, returns False if it equals the newest stored one
+	def append(self, timestamp, state):
+		count = int(self.header["count"][0])
+		if count > 0 and numpy.array_equal(self.records["state"][(count - 1) % self.capacity], state):
+			return False
+		# The record is on disk before the header counts it, so a crash never leaves a half written snapshot in the history
+		slot = count % self.capacity
+		self.records["time"][slot] = timestamp
+		self.records["state"][slot] = state
+		self.records.flush()
+		self.header["count"][0] = count + 1
+		self.header.flush()
+		return True
+
+	# Snapshots from the one that was current at start up to the newest, oldest first, as a copy
+	def window(self, start):
+		count = int(self.header["count"][0])
+		records = numpy.array(self.records[numpy.arange(max(0, count - self.capacity), count) % self.capacity])
+		first = max(0, numpy.searchsorted(records["time"], start, side = 'right') - 1)
+		return records[first:]
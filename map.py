@@ -1,26 +1,55 @@
 #!/usr/bin/env python3
 
-import urllib.request
-import xml.etree.ElementTree as ET
-import board
-import neopixel
+import atexit
+import os
 import time
-import numpy
 import json
-import RPi.GPIO as GPIO
-import datetime
-import astral
-from astral import LocationInfo
-from astral.geocoder import database, lookup
-from astral.sun import sun
-
+import multiprocessing
+import multiprocessing.connection
+import signal
+import sys
+import threading
+import numpy
+from fetch import ChunkedFetcher
+from metarparse import parseResponses
+from rawmetar import decodeMetar
+from refresher import Refresher
+from stationstate import CATEGORIES, CATEGORY_CODES, newState, stationPositions, dataAges, computeMetrics, fillMissing
+from frames import compileFrames, blankFrames, frameBytes, segmentFrames, FrameWriter, isAnimated
+from animation import compileAnimation, stationOffsets, FrameClock
+from metrics import Metrics
+from hardware import createStrip, loadGPIO, channelOrder
+from events import ButtonQueue, ConfigSaver
+from brightness import BrightnessScheduler, loadSunTable
+from power import PowerSchedule, PowerUsage
+from history import ObservationHistory
+from framebuffer import SharedBuffer, packFrames, packedSize, unpackFrames
+from api import ConditionsServer, buildPayloads
+from stations import StationTable
+from colorrules import loadColorRules
+from taf import parseTafs, decodeTaf, forecastHours
+from grid import GribOverlay
+
+
+# Folder with the airports and config.json files, /home/pi/METARMap on the Raspberry Pi
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # NeoPixel LED Configuration
 LED_COUNT			= 150				# Number of LED pixels.
-LED_PIN				= board.D18			# GPIO pin connected to the pixels (18 is PCM).
+LED_PIN				= "D18"				# GPIO pin connected to the pixels (18 is PCM).
 LED_DAY_BRIGHTNESS	= 0.2				# Float from 0.0 (min) to 1.0 (max)
 LED_NIGHT_BRIGHTNESS= 0.08				# Float from 0.0 (min) to 1.0 (max)
-LED_ORDER			= neopixel.GRB		# Strip type and colour ordering
+LED_ORDER			= "GRB"				# Strip type and colour ordering
+LED_BACKEND			= os.environ.get("METARMAP_BACKEND", "neopixel")	# "neopixel" for the strip, "memory" or "terminal" to run without a Raspberry Pi
+
+# Maps driven by this script from one fetch, each with its own airports file, LEDs, order, brightness and mode.
+# Maps on the same pin are segments of one strip, one after the other in this list. The strip uses the order
+# of its first map, the colors of segments with another order are swapped to match. brightness scales the
+# day and night brightness for one map, mode is None to follow config.json and the mode button.
+MAPS = [
+	{ "airports" : "airports", "pin" : LED_PIN, "count" : LED_COUNT, "order" : LED_ORDER, "brightness" : 1.0, "mode" : None },
+	# { "airports" : "airports-west", "pin" : "D21", "count" : 60, "order" : "RGB", "brightness" : 0.5, "mode" : "temp" },
+]
 
 COLOR_VFR		= (255,0,0)			# Green
 COLOR_VFR_FADE	= (125,0,0)			# Green Fade for wind
@@ -32,6 +61,7 @@ COLOR_LIFR		= (0,125,125)		# Magenta
 COLOR_LIFR_FADE	= (0,75,75)			# Magenta Fade for wind
 COLOR_CLEAR		= (0,0,0)			# Clear
 COLOR_LIGHTNING	= (255,255,255)		# White
+COLOR_STALE		= (0,0,0)			# Stations without a report and no station nearby to stand in, e.g. (10,10,10) for a dim white
 
 COLOR_NEG		= (0,255,255)		# Pink
 COLOR_0			= (0,204,255)		# Magenta
@@ -48,8 +78,19 @@ COLOR_100		= (0,255,0)			# Red
 COLOR_HOT		= (255,255,255)		# White
 # COLOR_CLEAR 	= (0,0,0)			# Clear
 
+# Modes defined in a file, e.g. a copy of colors.example.json, with new modes or other colors for metar and temp
+COLOR_RULES_FILE	= os.path.join(BASE_DIR, 'colors.json')
+
+# Colors of the grib mode as (upper limit of the field value, color), GRIB_COLOR_MAX above the last limit
+GRIB_BANDS		= [(3, COLOR_60), (6, COLOR_70), (8, COLOR_90), (11, COLOR_100)]	# UV index: low, moderate, high, very high
+GRIB_COLOR_MAX	= COLOR_NEG			# Extreme
+
 # What city are you living in? It should one of the cities listed here: https://astral.readthedocs.io/en/latest/#sun
 CITY = "Austin"
+SUN_TABLE_FILE = os.path.join(BASE_DIR, 'suntable.json')		# Sun times of the city for this year and the next, calculated on first start
+
+# Power schedule, outside these windows of local time the LEDs are dark, no data is fetched and the map sleeps until the next window
+POWER_WINDOWS = []			# (on, off) times, e.g. [("07:00", "22:00")] or [("06:30", "09:00"), ("17:00", "23:30")], [] to stay on around the clock
 
 # Do you want the METARMap to be static to just show flight conditions, or do you also want blinking/fading based on current wind conditions
 ACTIVATE_WINDCONDITION_ANIMATION = True		# Set this to False for Static or True for animated wind conditions
@@ -64,220 +105,624 @@ FADE_INSTEAD_OF_BLINK	= True				# Set to False if you want blinking
 WIND_BLINK_THRESHOLD	= 30				# Knots of windspeed
 ALWAYS_BLINK_FOR_GUSTS	= False				# Always animate for Gusts (regardless of speeds)
 
+# Mode button
+BUTTON_DEBOUNCE		= 0.2			# Seconds in which further presses of the mode button are ignored
+
 # Blinking Speed in seconds
 BLINK_SPEED		= 1.0				# Float in seconds, e.g. 0.5 for half a second
 
+# Smooth animation, fading at FRAME_RATE instead of switching colors every BLINK_SPEED seconds
+SMOOTH_ANIMATION		= True			# Set to False for the two step blinking/fading
+FRAME_RATE				= 30			# Frames per second of the smooth animation, one fade cycle takes two BLINK_SPEED
+ANIMATION_GAMMA			= 2.2			# Gamma correction so fades look even to the eye
+ANIMATION_PHASE_OFFSETS	= True			# Give every airport its own phase so windy airports don't pulse in lockstep
+ANIMATION_CPU_BUDGET	= 0.25			# Share of one CPU the render loop may use before it draws fewer frames
+
+# Data refresh interval in seconds, the map keeps running and fetches new METARs in the background
+REFRESH_INTERVAL	= 300			# Float in seconds, e.g. 300 for five minutes
+FETCH_TIMEOUT		= 30			# Seconds before giving up on a single request to aviationweather.gov
+CACHE_FILE			= os.path.join(BASE_DIR, 'metar.xml.gz')	# Last good response (one file per chunk), used right away after a restart or during an outage
+FETCH_CHUNK_SIZE	= 300			# Stations per request, longer station lists are split into several requests
+FETCH_WORKERS		= 16			# Requests that run at the same time, never more than there are chunks
+
+# Metrics of every stage for monitoring, with the same names in map.py, metar.py and temp.py
+METRICS_FILE		= None			# Prometheus text file, e.g. '/dev/shm/metarmap.prom' on a tmpfs, for the node_exporter textfile collector (None to disable)
+METRICS_PORT		= None			# Port of a local HTTP endpoint with the same metrics, e.g. 9101 (None to disable)
+METRICS_INTERVAL	= 60			# Seconds between writes of METRICS_FILE
+
+# Local API with the current conditions and LED frames for other displays, e.g. http://127.0.0.1:8080/conditions.json
+API_PORT			= None			# Port of the local HTTP API, e.g. 8080 (None to disable)
+API_ADDRESS			= "127.0.0.1"	# Address the API listens on, "0.0.0.0" for other computers on the network
+
+# Fetching, parsing and compiling run in a worker process, the LEDs are driven by the main process
+WORKER_TIMEOUT		= 180			# Seconds a refresh may take before the watchdog restarts the worker
+WATCHDOG_INTERVAL	= 1				# Seconds between checks of the worker's heartbeat
+METRICS_BUFFER_SIZE	= 1048576		# Bytes of shared memory for the worker's metrics
+
+# Stations without a report, e.g. when their METAR is stale, are filled in from the nearest station on the map that has one
+STATION_FILE		= os.path.join(BASE_DIR, 'stations.json')		# Station coordinates, learned from the METAR responses and the station information
+STATION_INFO_FILE	= os.path.join(BASE_DIR, 'stationinfo.xml.gz')	# Last good station information response, like CACHE_FILE
+STATION_INFO_INTERVAL	= 86400		# Seconds between requests for the coordinates of stations that have not reported yet
+FALLBACK_RADIUS		= 50			# Nautical miles a station may be away to stand in, 0 to leave stations without a report dark
+FALLBACK_NEIGHBOURS	= 3				# Nearest stations that may stand in, nearest first
+
+# Observation history and the replay mode, which plays the last hours back as a time-lapse
+HISTORY_FILE		= os.path.join(BASE_DIR, 'history.bin')	# Past observations, the file keeps the same size however long the map runs
+HISTORY_SIZE		= 576			# Observations kept, 48 hours at a REFRESH_INTERVAL of 300 seconds (0 to disable the history)
+REPLAY_HOURS		= 12			# Hours played back in replay mode
+REPLAY_SECONDS		= 24			# Seconds one playback of REPLAY_HOURS takes
+REPLAY_MODE			= 'metar'		# Mode whose colors are played back
+
+# Forecast mode, plays the TAFs of the airports for the next hours back hour by hour
+TAF_HOURS			= 24			# Forecast hours shown in the taf mode, starting with the current one (0 to disable the mode)
+TAF_HOUR_SECONDS	= 2				# Seconds every forecast hour is shown
+TAF_TEMPORARY		= True			# An hour with TEMPO or PROB groups shows the worse of them and the prevailing forecast
+TAF_MODE			= 'metar'		# Mode whose colors show the forecast
+TAF_CACHE_FILE		= os.path.join(BASE_DIR, 'taf.xml.gz')	# Last good TAF response, like CACHE_FILE
+
+# Gridded data mode, shows a field of a GRIB2 file (e.g. a NOAA model run) at the airports, needs pygrib
+GRIB_FILE			= None			# e.g. os.path.join(BASE_DIR, 'uv.t12z.grbf22.grib2'), None to disable the grib mode
+GRIB_FIELD			= 'UV index'	# Name of the GRIB message to show, e.g. 'Significant height of wind waves' or '2 metre temperature'
+GRIB_WEIGHTS_FILE	= os.path.join(BASE_DIR, 'gridweights.npz')	# Interpolation weights of the airports on the last grid, calculated once per grid
+
 # Wet Bulb Threshold
 WET_BULB_THRESHOLD = 27.8			# Float in degrees C
 
 # Heat Index Threshold
 HEAT_INDEX_THRESHOLD = 100			# Float in degrees F
 
-# Function to convert degrees fahrenheit to celsius
-def FtoC(temp):
-	return ((temp - 32) * (5/9))
-
-# Function to convert degrees celsius to fahrenheit
-def CtoF(temp):
-	return ((temp * (9/5)) + 32)
-
-# Read JSON configuration file
-configFile = '/home/pi/METARMap/config.json'
-with open(configFile, 'r') as f:
-	config = json.load(f)
-	mode = config['mode']
-
-# Button press event
-def button_callback(channel):
-	global mode
-	global config
-	global configFile
-	print("Button was pushed.")
-	if mode == 'metar':
-		mode = 'temp'
-	elif mode == 'temp':
-		mode = 'metar'
+# Timings and counters of every stage, exported by the main block
+metrics = Metrics()
+
+# Retrieve flying conditions from the service response and store them in the rows of the airports' LEDs
+# The coordinates of the stations are added to the station table, if there is one
+def parseConditions(contents, airports, stations = None):
+	state = newState(len(airports))
+	positions = stationPositions(airports)
+	for metar in parseResponses(contents):
+		rows = positions.get(metar['stationId'])
+		if rows is None:
+			continue
+		if stations is not None:
+			stations.add(metar['stationId'], metar['latitude'], metar['longitude'])
+		# Decode the raw report to catch thunderstorms and to derive the flight category when the feed has none
+		decoded = decodeMetar(metar['rawText']) if metar['rawText'] is not None else None
+		flightCategory = metar['flightCategory']
+		if flightCategory is None and decoded is not None:
+			flightCategory = decoded['flightCategory']
+		if flightCategory is None:
+			print("Missing flight condition, skipping.")
+			continue
+		observed = 0
+		windSpeed = 0
+		windGust = -1
+		lightning = False
+		tempC = 0
+		dewpointC = 0
+		if metar['observationTime'] is not None:
+			observed = metar['observationTime']
+		if metar['windSpeed'] is not None:
+			windSpeed = metar['windSpeed']
+		if metar['windGust'] is not None:
+			windGust = metar['windGust']
+		if decoded is not None:
+			lightning = decoded['lightning']
+		if metar['tempC'] is not None:
+			tempC = metar['tempC']
+		if metar['dewpointC'] is not None:
+			dewpointC = metar['dewpointC']
+
+		state[rows] = (True, observed, CATEGORY_CODES.get(flightCategory, 0), windSpeed, windGust, lightning, tempC, dewpointC, 0, 0, 0, 0, False)
+	return state
+
+# Print the conditions of every station with a report, stations filled in from a neighbour are marked with a *
+def printConditions(state, airports):
+	gusting = gusts(state)
+	for stationId, rows in stationPositions(airports).items():
+		row = state[rows[0]]
+		if row["reported"]:
+			print(stationId + ("*" if row["missing"] else "") + ":" + CATEGORIES[row["flightCategory"]] + ":" + str(row["windSpeed"]) + ":" + str(gusting[rows[0]]) + ":" + str(row["lightning"]) + "; T_c:%.1f; D_c:%.1f; RH:%.1f; HI:%.1f; T_w:%.1f; WBGT:%.1f" % (row["tempC"], row["dewpointC"], row["RH"], row["heatIndex"], row["tempWet"], row["WBGT"]))
+
+# Stations whose gusts should animate
+def gusts(state):
+	return (state["windGust"] >= 0) & (ALWAYS_BLINK_FOR_GUSTS | (state["windGust"] > WIND_BLINK_THRESHOLD))
+
+# Color rules of METAR mode (see colorrules.py): the color of the flight category, fading to a darker shade on the
+# second phase when it is windy or gusting, and white on the first phase for lightning
+METAR_RULES = {
+	"colors" : { "column" : "flightCategory", "colors" : { "VFR" : COLOR_VFR, "MVFR" : COLOR_MVFR, "IFR" : COLOR_IFR, "LIFR" : COLOR_LIFR }, "default" : COLOR_CLEAR },
+	"flash" : ([{ "phase" : 1,
+		"any" : [{ "column" : "windSpeed", "above" : WIND_BLINK_THRESHOLD }, { "column" : "windGust", "atLeast" : 0 } if ALWAYS_BLINK_FOR_GUSTS else { "column" : "windGust", "above" : WIND_BLINK_THRESHOLD }],
+		"colors" : { "column" : "flightCategory", "colors" : { "VFR" : COLOR_VFR_FADE, "MVFR" : COLOR_MVFR_FADE, "IFR" : COLOR_IFR_FADE, "LIFR" : COLOR_LIFR_FADE }, "default" : COLOR_CLEAR } if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR,
+	}] if ACTIVATE_WINDCONDITION_ANIMATION else []) + ([{ "phase" : 0,
+		"all" : [{ "column" : "lightning" }, { "column" : "flightCategory", "above" : 0 }],
+		"colors" : COLOR_LIGHTNING,
+	}] if ACTIVATE_LIGHTNING_ANIMATION else []),
+}
+
+# Color rules of temperature mode, bands of 10 degrees F, flashing white on the second phase when the heat index is high
+TEMP_RULES = {
+	"colors" : { "column" : "tempC", "fahrenheit" : True, "limits" : [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100], "colors" : [COLOR_NEG, COLOR_0, COLOR_10, COLOR_20, COLOR_30, COLOR_40, COLOR_50, COLOR_60, COLOR_70, COLOR_80, COLOR_90, COLOR_100] },
+	"flash" : [{ "phase" : 1, "all" : [{ "column" : "heatIndex", "above" : HEAT_INDEX_THRESHOLD }], "colors" : COLOR_HOT }],
+}
+
+GRIB_LIMITS = numpy.array([limit for limit, color in GRIB_BANDS])
+GRIB_COLORS = numpy.array([color for limit, color in GRIB_BANDS] + [GRIB_COLOR_MAX], dtype = numpy.uint8)
+
+# Frames of the grib mode from the field value at every LED, LEDs without a value stay clear
+def gridFrames(values):
+	colors = GRIB_COLORS[numpy.searchsorted(GRIB_LIMITS, values, side = 'right')]
+	colors[numpy.isnan(values)] = COLOR_CLEAR
+	frame = list(map(tuple, colors.tolist()))
+	return [frame, frame]
+
+# Modes selectable with the button or in config.json and the color function used to compile their frames,
+# the built-in modes and the modes of COLOR_RULES_FILE compiled into lookup tables once at start
+MODES = loadColorRules(COLOR_RULES_FILE, { 'metar' : METAR_RULES, 'temp' : TEMP_RULES })
+metarColor = MODES['metar']
+tempColor = MODES['temp']
+
+# Compile the frames of a mode into one animation cycle, ANIMATION_STEPS frames long
+ANIMATION_STEPS = int(round(FRAME_RATE * 2 * BLINK_SPEED)) if SMOOTH_ANIMATION else 2
+def animate(frames, airports):
+	return compileAnimation(frames, ANIMATION_STEPS, ANIMATION_GAMMA, stationOffsets(airports, ANIMATION_STEPS) if ANIMATION_PHASE_OFFSETS else None)
+
+# Time-lapse of the last REPLAY_HOURS in the history, one frame for every frame of the render loop
+REPLAY_FRAMES = int(round(REPLAY_SECONDS * (FRAME_RATE if SMOOTH_ANIMATION else 1 / BLINK_SPEED)))
+def replayAnimation(history, now):
+	start = now - REPLAY_HOURS * 3600
+	records = history.window(start)
+	if len(records) == 0:
+		return None
+	# Frames come straight from the stored state columns, every frame shows the snapshot that was current at its time
+	frames = [compileFrames(state, MODES[REPLAY_MODE], COLOR_STALE)[0] for state in records["state"]]
+	times = start + numpy.arange(REPLAY_FRAMES) * (REPLAY_HOURS * 3600 / REPLAY_FRAMES)
+	snapshots = numpy.maximum(numpy.searchsorted(records["time"], times, side = 'right') - 1, 0)
+	return [frames[i] for i in snapshots]
+
+# Forecast of the next TAF_HOURS from hourStart on, one frame per hour that is shown for TAF_HOUR_FRAMES frames.
+# Every hour is resolved into station state rows once, the render loop only steps through the finished frames.
+# Stations without a TAF are filled in from their neighbours like stations without a METAR.
+TAF_HOUR_FRAMES = max(1, int(round(TAF_HOUR_SECONDS * (FRAME_RATE if SMOOTH_ANIMATION else 1 / BLINK_SPEED))))
+def tafAnimation(contents, airports, hourStart, neighbours = None):
+	hourStarts = [hourStart + hour * 3600 for hour in range(TAF_HOURS)]
+	states = numpy.stack([newState(len(airports)) for hour in hourStarts])
+	positions = stationPositions(airports)
+	# Forecasts are collected as (hour, row) entries and stored in the state columns all at once
+	hours, rows, forecasts = [], [], []
+	for record in parseTafs(contents):
+		stationRows = positions.get(record['stationId'])
+		if stationRows is None or record['rawText'] is None:
+			continue
+		taf = decodeTaf(record['rawText'], record['issueTime'] or hourStart)
+		if taf is None:
+			continue
+		for hour, forecast in enumerate(forecastHours(taf, hourStarts, TAF_TEMPORARY)):
+			if forecast is not None:
+				for row in stationRows:
+					hours.append(hour)
+					rows.append(row)
+					forecasts.append(forecast)
+	if not forecasts:
+		return None
+	forecasts = numpy.array(forecasts)
+	states["reported"][hours, rows] = True
+	for column, name in enumerate(("flightCategory", "windSpeed", "windGust", "lightning")):
+		states[name][hours, rows] = forecasts[:, column]
+	frames = []
+	for state in states:
+		fillMissing(state, airports, neighbours)
+		frames.append(compileFrames(state, MODES[TAF_MODE], COLOR_STALE)[0])
+	return [frame for frame in frames for i in range(TAF_HOUR_FRAMES)]
+
+# Parse a response and compile the frames and animation of every mode, all on the refresh thread
+# New observations are stored in the history, if there is one, and the replay is compiled from it
+# With a station table, stations without a report are filled in from their neighbours
+# With a GRIB overlay the field is interpolated to the airports' coordinates from the station table
+# With TAF responses the forecast of the hours from the current one on is compiled as well
+# airports are the LEDs of all maps one after the other, segments splits the animations into the maps (see mapSegments)
+def loadData(contents, airports, history = None, stations = None, overlay = None, segments = None, tafContents = None):
+	now = time.time()
+	neighbours = stations.neighbours(airports, FALLBACK_RADIUS, FALLBACK_NEIGHBOURS) if stations is not None and FALLBACK_RADIUS > 0 else None
+	with metrics.stage("parse"):
+		state = parseConditions(contents, airports, stations)
+		fillMissing(state, airports, neighbours)
+	# Calculate weather values for all stations in one vectorized pass
+	with metrics.stage("compute"):
+		computeMetrics(state)
+	printConditions(state, airports)
+	with metrics.stage("frames"):
+		frames = { name : compileFrames(state, colorFunction, COLOR_STALE) for name, colorFunction in MODES.items() }
+		animations = { name : animate(modeFrames, airports) for name, modeFrames in frames.items() }
+	if history is not None:
+		history.append(now, state)
+		replay = replayAnimation(history, now)
+		if replay is not None:
+			animations['replay'] = replay
+	if stations is not None:
+		stations.save()
+	if overlay is not None:
+		try:
+			with metrics.stage("grid"):
+				values = overlay.stationValues(*stations.positions(airports))
+			frames['grib'] = gridFrames(values)
+			animations['grib'] = frames['grib']
+		except (ImportError, OSError, ValueError, IndexError) as e:
+			print("Could not read " + overlay.field + " from " + overlay.path + ": " + str(e))
+	tafHour = now - now % 3600
+	if tafContents:
+		with metrics.stage("taf"):
+			forecast = tafAnimation(tafContents, airports, tafHour, neighbours)
+		if forecast is not None:
+			animations['taf'] = forecast
+	if segments is None:
+		maps = [animations]
 	else:
-		mode = 'metar'
+		with metrics.stage("segments"):
+			maps = [{ name : segmentFrames(animation, segment["start"], segment["end"], segment["brightness"], segment["channels"]) for name, animation in animations.items() } for segment in segments]
+	return { "state" : state, "frames" : frames, "animations" : animations, "maps" : maps, "tafHour" : tafHour }
+
+# Read the airports file of every map and place the maps on their strips
+# Returns the LEDs of all maps one after the other, one segment per map and the strips as (pin, count, order, maps)
+def mapSegments(maps):
+	airports = []
+	segments = []
+	strips = {}
+	for index, definition in enumerate(maps):
+		with open(os.path.join(BASE_DIR, definition["airports"])) as f:
+			mapAirports = [x.strip() for x in f.readlines()]
+		# Every map takes exactly its count of LEDs, so the maps behind it on the same strip start in the right place
+		mapAirports = (mapAirports + ["NULL"] * definition["count"])[:definition["count"]]
+		strip = strips.setdefault(definition["pin"], [definition["pin"], 0, definition["order"], []])
+		segments.append({ "start" : len(airports), "end" : len(airports) + len(mapAirports), "brightness" : definition["brightness"], "channels" : channelOrder(strip[2], definition["order"]), "mode" : definition["mode"] })
+		strip[1] += definition["count"]
+		strip[3].append(index)
+		airports += mapAirports
+	return airports, segments, list(strips.values())
+
+# Mode that follows each mode when the button is pressed, the grib mode, the forecast and the replay of the history come after the live modes
+MODE_ORDER = list(MODES) + (['grib'] if GRIB_FILE is not None else []) + (['taf'] if TAF_HOURS > 0 else []) + ['replay']
+MODE_NEXT = { name : MODE_ORDER[(i + 1) % len(MODE_ORDER)] for i, name in enumerate(MODE_ORDER) }
+def nextMode(mode):
+	if mode not in MODE_NEXT:
 		print("Error: no mode found.")
-
-	# Write to file
-	config['mode'] = mode
-	with open(configFile, 'w') as outfile:
-		json.dump(config, outfile)
-
-# Set LED brightness based on astronomy and location
-now_utc = datetime.datetime.utcnow()
-now_local = datetime.datetime.now()
-year = now_local.date().year
-month = now_local.date().month
-day = now_local.date().day
-city = lookup(CITY,database())
-s = sun(city.observer, date=datetime.date(year, month, day))
-sunrise = (s["sunrise"]).replace(tzinfo=None)
-sunset = (s["sunset"]).replace(tzinfo=None)
-dawn = (s["dawn"]).replace(tzinfo=None)
-dusk = (s["dusk"]).replace(tzinfo=None)
-up = dawn
-down = dusk
-if ((now_utc < up) | (now_utc > down)):
-	LED_BRIGHTNESS = LED_NIGHT_BRIGHTNESS
-	print("Nightime. Switching at " + str(up))
-elif ((now_utc > up) & (now_utc < down)):
-	LED_BRIGHTNESS = LED_DAY_BRIGHTNESS
-	print("Daytime. Switching at " + str(down))
-else:
-	LED_BRIGHTNESS = LED_DAY_BRIGHTNESS
-	print("Time error. Setting brightness to day.")
-
-#Button Configuration
-GPIO.setwarnings(False) 			# Ignore warning for now
-MODE_PIN = 15 						# GPIO pin connected to mode button 
-GPIO.setup(MODE_PIN, GPIO.IN, pull_up_down = GPIO.PUD_DOWN) # Set pin to be an input pin and set initial value to be pulled low (off)
-GPIO.add_event_detect(MODE_PIN, GPIO.RISING, callback = button_callback) # Setup event on pin rising edge
-
-# Initialize the LED strip
-pixels = neopixel.NeoPixel(LED_PIN, LED_COUNT, brightness = LED_BRIGHTNESS, pixel_order = LED_ORDER, auto_write = False)
-
-# Read the airports file to retrieve list of airports and use as order for LEDs
-with open("/home/pi/METARMap/airports") as f:
-	airports = f.readlines()
-airports = [x.strip() for x in airports]
-
-# Retrieve METAR from aviationweather.gov data server
-# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
-url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString=" + ",".join([item for item in airports if item != "NULL"])
-print(url)
-
-content = urllib.request.urlopen(url).read()
-
-# Retrieve flying conditions from the service response and store in a dictionary for each airport
-root = ET.fromstring(content)
-conditionDict = { "": {"flightCategory" : "", "windSpeed" : 0, "windGust" : False, "lightning": False, "tempC" : 0, "dewpointC" : 0,} }
-for metar in root.iter('METAR'):
-	stationId = metar.find('station_id').text
-	if metar.find('flight_category') is None:
-		print("Missing flight condition, skipping.")
-		continue
-	flightCategory = metar.find('flight_category').text
-	windGust = False
-	windSpeed = 0
-	lightning = False
-	tempC = 0
-	dewpointC = 0
-	if metar.find('wind_gust_kt') is not None:
-		windGust = (True if (ALWAYS_BLINK_FOR_GUSTS or int(metar.find('wind_gust_kt').text) > WIND_BLINK_THRESHOLD) else False)
-	if metar.find('wind_speed_kt') is not None:
-		windSpeed = int(metar.find('wind_speed_kt').text)
-	if metar.find('raw_text') is not None:
-		rawText = metar.find('raw_text').text
-		lightning = False if rawText.find('LTG') == -1 else True
-	if metar.find('temp_c') is not None:
-		tempC = float(metar.find('temp_c').text)
-	if metar.find('dewpoint_c') is not None:
-		dewpointC = float(metar.find('dewpoint_c').text)
-
-	# Calculate weather values
-	e = 6.11 * 10**((7.5 * dewpointC)/(237.3 + dewpointC))
-	e_s = 6.11 * 10**((7.5 * tempC)/(237.3 + tempC))
-	rh = e/e_s * 100
-
-	tempF = CtoF(tempC) 
-	# hi = -42.379 + 2.04901523*tempF + 10.14333127*rh - .22475541*tempF*rh - .00683783*tempF*tempF - .05481717*rh*rh + .00122874*tempF*tempF*rh + .00085282*tempF*rh*rh - .00000199*tempF*tempF*rh*rh
-	if tempF < 70:
-		hi = -1
-	elif tempF > 115:
-		hi = 1000
-	else:
-		hi = 16.923 + 0.185212*tempF + 5.37941*rh - 0.100254*tempF*rh + 0.00941695*(tempF**2) + 0.00728898*(rh**2) + 0.000345372*(tempF**2)*rh - 0.000814971*tempF*(rh**2) + 0.0000102102*(tempF**2)*(rh**2) - 0.000038646*(tempF**3) + 0.0000291583*(rh**3) + 0.00000142721*(tempF**3)*rh + 0.000000197483*tempF*(rh**3) - 0.0000000218429*(tempF**3)*(rh**2) + 0.000000000843296*(tempF**2)*(rh**3) - 0.0000000000481975*(tempF**3)*(rh**3)
-	t_w = tempC * numpy.arctan(0.151977 * (rh + 8.313659)**(1/2)) + numpy.arctan(tempC + rh) - numpy.arctan(rh - 1.676331) + 0.00391838 *(rh)**(3/2) * numpy.arctan(0.023101 * rh) - 4.686035
-	WBGT = 0.7 * t_w + 0.3 * tempC
-
-	# Round floats
-	t_w = round(t_w * 10) / 10
-	rh = round(rh * 10) / 10
-	hi = round(hi*10) / 10
-	WBGT = round(WBGT * 10) / 10
-
-	print(stationId + ":" + flightCategory + ":" + str(windSpeed) + ":" + str(windGust) + ":" + str(lightning) + "; T_c:" + str(tempC) + "; D_c:" + str(dewpointC) + "; RH:" + str(rh) + "; HI:" + str(hi) + "; T_w:" + str(t_w) + "; WBGT:" + str(WBGT))
-	conditionDict[stationId] = { "flightCategory" : flightCategory, "windSpeed" : windSpeed, "windGust": windGust, "lightning": lightning, "tempC" : tempC, "dewpointC" : dewpointC, "RH" : rh, "heatIndex" : hi, "tempWet" : t_w, "WBGT" : WBGT}
-
-# Setting LED colors based on weather conditions
-flashCycle = False
-while True:
-	i = 0
-	for airportcode in airports:
-		# Skip NULL entries
-		if airportcode == "NULL":
-			i += 1
+		return MODE_ORDER[0]
+	return MODE_NEXT[mode]
+
+# Data side of the map, run in its own process: fetch, parse, calculate and compile every REFRESH_INTERVAL
+# and publish the frames of all maps into the shared frame buffer, and the metrics into the metrics buffer.
+# The payloads of the local API are sent to the renderer through apiPipe, if there is one, which serves them.
+# The heartbeat in the frame buffer is the start of the refresh that is running, or now between refreshes.
+# Outside the power windows, while powered is cleared, the worker stops fetching and sleeps until it is set again.
+def dataWorker(frameBufferName, metricsBufferName, published, apiPipe, powered, airports, segments):
+	frameBuffer = SharedBuffer(frameBufferName)
+	metricsBuffer = SharedBuffer(metricsBufferName)
+
+	# Exit together with the renderer, also when it was killed and could not stop the worker itself
+	parent = multiprocessing.parent_process()
+	def watchParent():
+		multiprocessing.connection.wait([parent.sentinel])
+		print("Renderer is gone, stopping the data worker.")
+		os._exit(0)
+	threading.Thread(target = watchParent, daemon = True).start()
+
+	# Retrieve METAR from aviationweather.gov data server
+	# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
+	# Every station is requested once, however many maps show it
+	url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString="
+	stations = list(dict.fromkeys(item for item in airports if item != "NULL" and item != ""))
+	print(url + ",".join(stations))
+
+	# TAFs of the same stations for the forecast mode, from the same data server
+	tafUrl = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=tafs&requestType=retrieve&format=xml&hoursBeforeNow=6&mostRecentForEachStation=true&stationString="
+	tafFetcher = ChunkedFetcher(tafUrl, stations, TAF_CACHE_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT) if TAF_HOURS > 0 else None
+
+	# Past observations for the replay mode
+	history = ObservationHistory(HISTORY_FILE, airports, HISTORY_SIZE) if HISTORY_SIZE > 0 else None
+
+	# Station coordinates for the stations without a report and the gridded field shown in the grib mode
+	# Stations that have not reported since the table was started are looked up in the station information of the same data server
+	stationTable = StationTable(STATION_FILE)
+	stationUrl = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=stations&requestType=retrieve&format=xml&stationString="
+	stationFetcher = ChunkedFetcher(stationUrl, stations, STATION_INFO_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	stationTable.addStations(stationFetcher.contents)
+	overlay = GribOverlay(GRIB_FILE, GRIB_FIELD, GRIB_WEIGHTS_FILE) if GRIB_FILE is not None else None
+
+	# Parse and compile a response and hand the new data to the API, whose payloads are serialized once per refresh
+	def load(contents):
+		data = loadData(contents, airports, history, stationTable, overlay, segments, tafFetcher.contents if tafFetcher is not None else None)
+		if apiPipe is not None:
+			with metrics.stage("api"):
+				apiPipe.send(buildPayloads(data["state"], airports, data["frames"], time.time()))
+		return data
+
+	# Fetching and parsing runs on a background thread of the worker every REFRESH_INTERVAL seconds
+	# Only download and parse again when a feed or the GRIB file has changed since the last request, or the forecast has to move on by an hour
+	# The forecast keeps its last good TAFs when they cannot be fetched
+	def fetchData():
+		with metrics.stage("fetch"):
+			contents = fetcher.fetch()
+		metrics.count("metarmap_fetch_bytes_total", fetcher.bytesDownloaded)
+		metrics.count("metarmap_fetch_chunk_failures_total", fetcher.failed)
+		tafModified = False
+		if tafFetcher is not None:
+			try:
+				with metrics.stage("fetch_taf"):
+					tafFetcher.fetch()
+				tafModified = tafFetcher.modified
+			except Exception as e:
+				print("Could not fetch the TAFs: " + str(e))
+			metrics.count("metarmap_fetch_bytes_total", tafFetcher.bytesDownloaded)
+			metrics.count("metarmap_fetch_chunk_failures_total", tafFetcher.failed)
+		placed = stationTable.lookup(stationFetcher, stations, STATION_INFO_INTERVAL)
+		newHour = tafFetcher is not None and refresher.data is not None and time.time() - refresher.data["tafHour"] >= 3600
+		if not fetcher.modified and not tafModified and not placed and not newHour and not (overlay is not None and overlay.modified()) and refresher.data is not None:
+			return refresher.data
+		return load(contents)
+
+	# Start from the cached response of the last run, if there is one, while the first fetch is running
+	fetcher = ChunkedFetcher(url, stations, CACHE_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	refresher = Refresher(fetchData, REFRESH_INTERVAL, initial = load(fetcher.contents) if fetcher.contents else None)
+	if not powered.is_set():
+		refresher.pause()
+	refresher.start()
+
+	# The age of every station's data is exported by the renderer together with its own metrics
+	def stationAges():
+		if refresher.data is None:
+			return []
+		return [('station="' + stationId + '"', round(age, 1)) for stationId, age in dataAges(refresher.data["state"], airports, time.time())]
+	metrics.collect("metarmap_station_data_age_seconds", "gauge", stationAges)
+	metrics.collect("metarmap_worker_cpu_seconds_total", "counter", lambda: [("", time.process_time())])
+
+	lastMetrics = 0
+	while True:
+		if refresher.updated.is_set():
+			refresher.updated.clear()
+			with metrics.stage("publish"):
+				frameBuffer.publish(packFrames(refresher.data["maps"]))
+			published.set()
+			lastMetrics = 0
+		if time.time() - lastMetrics >= METRICS_INTERVAL:
+			metricsBuffer.publish(json.dumps(metrics.snapshot()).encode())
+			lastMetrics = time.time()
+		frameBuffer.beat(refresher.busySince)
+		# While the map is off the worker sleeps without any wakeups, once the frames it has are published. The data, the
+		# station table and the fetcher's cache and validators are kept, so the first refresh afterwards is a conditional request.
+		if not powered.is_set():
+			refresher.pause()
+			metricsBuffer.publish(json.dumps(metrics.snapshot()).encode())
+			powered.wait()
+			refresher.resume()
+			continue
+		refresher.updated.wait(WATCHDOG_INTERVAL)
+
+# Bytes one compiled set of frames of every mode of every map takes in the frame buffer, with the index of packFrames
+def frameBufferSize(segments):
+	frameCounts = { name : max(ANIMATION_STEPS, 2) for name in MODE_ORDER }
+	frameCounts.update({ 'grib' : 2, 'taf' : TAF_HOURS * TAF_HOUR_FRAMES, 'replay' : REPLAY_FRAMES })
+	return packedSize([segment["end"] - segment["start"] for segment in segments], { name : frameCounts[name] for name in MODE_ORDER })
+
+# Everything below only runs when the script is started, not when it is imported e.g. by benchmark.py
+if __name__ == "__main__":
+	# Woken up by a data refresh or a button press while the LEDs are idle
+	wake = threading.Event()
+
+	# Read JSON configuration file
+	configFile = os.path.join(BASE_DIR, 'config.json')
+	with open(configFile, 'r') as f:
+		config = json.load(f)
+		mode = config['mode']
+
+	# Button presses are queued and handled by the render loop, the config is saved in the background
+	buttons = ButtonQueue(wake, BUTTON_DEBOUNCE)
+	saver = ConfigSaver(configFile)
+
+	# Set LED brightness based on astronomy and location
+	# The sun times come from a table precalculated for the whole year, brightness ramps between night and day from dawn to sunrise and sunset to dusk
+	scheduler = BrightnessScheduler(loadSunTable(CITY, SUN_TABLE_FILE), LED_NIGHT_BRIGHTNESS, LED_DAY_BRIGHTNESS, CITY, SUN_TABLE_FILE)
+	LED_BRIGHTNESS = scheduler.brightness()
+
+	# On and off hours of the map, the time, CPU time and wakeups of both are counted to check the savings of the off hours
+	power = PowerSchedule(POWER_WINDOWS)
+	usage = PowerUsage(power.isOn())
+
+	#Button Configuration
+	GPIO = loadGPIO(LED_BACKEND)
+	GPIO.setwarnings(False) 			# Ignore warning for now
+	MODE_PIN = 15 						# GPIO pin connected to mode button 
+	GPIO.setup(MODE_PIN, GPIO.IN, pull_up_down = GPIO.PUD_DOWN) # Set pin to be an input pin and set initial value to be pulled low (off)
+	GPIO.add_event_detect(MODE_PIN, GPIO.RISING, callback = buttons.press) # Setup event on pin rising edge
+
+	# Read the airports files of all maps, their LEDs are parsed and compiled together as one list and split into the maps afterwards
+	airports, segments, strips = mapSegments(MAPS)
+
+	# Initialize the LED strips
+	pixels = [createStrip(LED_BACKEND, pin, count, order) for pin, count, order, members in strips]
+
+	# The data side runs in its own process and publishes the compiled frames of all maps into shared memory,
+	# so the LEDs keep animating at a steady rate whatever the network or the parser is doing
+	frameBuffer = SharedBuffer(size = frameBufferSize(segments))
+	metricsBuffer = SharedBuffer(size = METRICS_BUFFER_SIZE)
+	atexit.register(frameBuffer.unlink)
+	atexit.register(metricsBuffer.unlink)
+	context = multiprocessing.get_context('spawn')
+	published = context.Event()
+	powered = context.Event()			# Set while the map is on, the worker and the threads below sleep while it is cleared
+	if power.isOn():
+		powered.set()
+
+	# Local API, served by the renderer so its port, payloads and ETags stay when the watchdog restarts the worker.
+	# Every worker gets a pipe of its own for the payloads, a worker killed in the middle of a send cannot garble the next one's.
+	api = ConditionsServer().start(API_PORT, API_ADDRESS) if API_PORT is not None else None
+	if api is not None:
+		api.setMode(mode)
+	def receivePayloads(receiver):
+		try:
+			while True:
+				api.publish(receiver.recv())
+		except (EOFError, OSError):
+			receiver.close()
+
+	def startWorker():
+		frameBuffer.beat()
+		receiver, sender = context.Pipe(duplex = False) if api is not None else (None, None)
+		process = context.Process(target = dataWorker, args = (frameBuffer.name, metricsBuffer.name, published, sender, powered, airports, segments), daemon = True)
+		process.start()
+		if api is not None:
+			# Only the worker holds the sending end, so the receiving thread ends when the worker does
+			sender.close()
+			threading.Thread(target = receivePayloads, args = (receiver,), daemon = True).start()
+		return process
+	worker = startWorker()
+
+	# Stop the worker before the shared memory is unlinked. pkill stops the map with SIGTERM, which would skip
+	# atexit, so it is turned into a normal exit.
+	stopping = threading.Event()
+	def stopWorker():
+		stopping.set()
+		worker.terminate()
+		worker.join(5)
+		if worker.is_alive():
+			worker.kill()
+			worker.join()
+	atexit.register(stopWorker)
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+	# Restart the worker when it died or a refresh has been running for longer than WORKER_TIMEOUT, not while the map is off
+	def watchdog():
+		global worker
+		while True:
+			time.sleep(WATCHDOG_INTERVAL)
+			powered.wait()
+			if stopping.is_set() or (worker.is_alive() and time.time() - frameBuffer.heartbeat() < WORKER_TIMEOUT):
+				continue
+			print("Data worker is not responding, restarting it.")
+			worker.kill()
+			worker.join()
+			metrics.count("metarmap_worker_restarts_total")
+			worker = startWorker()
+	threading.Thread(target = watchdog, daemon = True).start()
+
+	# Unpack new frames on a thread of their own as soon as the worker published them and wake the render loop,
+	# which only has to swap the reference
+	received = { "maps" : None }
+	def receive():
+		while True:
+			published.wait()
+			published.clear()
+			payload = frameBuffer.read()
+			if payload is not None:
+				received["maps"] = unpackFrames(payload)
+				wake.set()
+	threading.Thread(target = receive, daemon = True).start()
+
+	# Wait for the first frames, from the cached response of the last run or the first fetch
+	while received["maps"] is None:
+		wake.wait()
+		wake.clear()
+	maps = received["maps"]
+
+	# Setting LED colors based on weather conditions, the writers apply the brightness and color order to every frame
+	writers = [FrameWriter(strip, metrics, LED_BRIGHTNESS) for strip in pixels]
+	clock = FrameClock(FRAME_RATE if SMOOTH_ANIMATION else 1 / BLINK_SPEED, ANIMATION_CPU_BUDGET, metrics)
+
+	# Export the frame counts and the metrics of the worker, its stage timings and the age of every station's data, together
+	workerMetrics = { "snapshot" : None }
+	def workerSnapshot():
+		payload = metricsBuffer.read()
+		if payload is not None:
+			workerMetrics["snapshot"] = json.loads(payload)
+		return workerMetrics["snapshot"]
+	metrics.collect("metarmap_frames_shown_total", "counter", lambda: [("", sum(writer.shown for writer in writers))])
+	metrics.collect("metarmap_frames_skipped_total", "counter", lambda: [("", sum(writer.skipped for writer in writers))])
+	metrics.collect("metarmap_power_seconds_total", "counter", lambda: usage.values(0))
+	metrics.collect("metarmap_cpu_seconds_total", "counter", lambda: usage.values(1))
+	metrics.collect("metarmap_wakeups_total", "counter", lambda: usage.values(2))
+	metrics.include(workerSnapshot)
+	metrics.start(METRICS_FILE, METRICS_PORT, METRICS_INTERVAL, powered)
+	blanks = [frameBytes(blankFrames(airports[segment["start"]:segment["end"]])) for segment in segments]
+	lastAnimations = None
+	lit = None							# Whether the map is on, None until the first pass of the loop
+	while True:
+		# Switch modes right away on a button press, the frames of every mode are already compiled
+		for channel in buttons.drain():
+			print("Button was pushed.")
+			mode = nextMode(mode)
+			config['mode'] = mode
+			saver.save(config)
+			if api is not None:
+				api.setMode(mode)
+
+		# Outside the power windows blank the strips once, pause the worker and sleep until the next window,
+		# only a button press wakes the loop up in between
+		on = power.isOn()
+		if on != lit:
+			lit = on
+			usage.switch(on)
+			print(("Lights on. " if on else "Lights off. ") + usage.report())
+			if on:
+				frameBuffer.beat()
+				powered.set()
+				clock.reset()
+			else:
+				powered.clear()
+				for (pin, count, order, members), writer in zip(strips, writers):
+					writer.write(b"".join(blanks[index][0] for index in members))
+				if METRICS_FILE is not None:
+					try:
+						metrics.writeFile(METRICS_FILE)
+					except OSError as e:
+						print("Could not write metrics: " + str(e))
+		if not on:
+			wake.wait(power.nextChange())
+			wake.clear()
+			usage.wakeup()
 			continue
 
-		color = COLOR_CLEAR
-		conditions = conditionDict.get(airportcode, None)
-
-		# Mode 1 = METAR
-		if mode == 'metar': 
-			if conditions != None:
-				windy = True if (ACTIVATE_WINDCONDITION_ANIMATION and flashCycle == True and (conditions["windSpeed"] > WIND_BLINK_THRESHOLD or conditions["windGust"] == True)) else False
-				lightningConditions = True if (ACTIVATE_LIGHTNING_ANIMATION and flashCycle == False and conditions["lightning"] == True) else False
-				if conditions["flightCategory"] == "VFR":
-					color = COLOR_VFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_VFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-				elif conditions["flightCategory"] == "MVFR":
-					color = COLOR_MVFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_MVFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-				elif conditions["flightCategory"] == "IFR":
-					color = COLOR_IFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_IFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-				elif conditions["flightCategory"] == "LIFR":
-					color = COLOR_LIFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_LIFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-				else:
-					color = COLOR_CLEAR
-			#print("Setting LED " + str(i) + " for " + airportcode + " to " + ("lightning " if lightningConditions else "") + ("windy " if windy else "") + (conditions["flightCategory"] if conditions != None else "None") + " " + str(color))
-		# Mode 2 = Temp
-		elif mode == 'temp':
-			flash = True if flashCycle else False
-			if conditions != None:
-				# if ((tempC == 0) & (dewpointC == 0)):
-				# 	color = COLOR_CLEAR
-				# 	print("Error: temperature and/or dewpoint values unavailable.")
-				if (flash and (conditions["heatIndex"] > HEAT_INDEX_THRESHOLD)):
-					color = COLOR_HOT
-				elif conditions["tempC"] < FtoC(0):
-					color = COLOR_NEG
-				elif conditions["tempC"] < FtoC(10):
-					color = COLOR_0
-				elif conditions["tempC"] < FtoC(20):
-					color = COLOR_10
-				elif conditions["tempC"] < FtoC(30):
-					color = COLOR_20
-				elif conditions["tempC"] < FtoC(40):
-					color = COLOR_30
-				elif conditions["tempC"] < FtoC(50):
-					color = COLOR_40
-				elif conditions["tempC"] < FtoC(60):
-					color = COLOR_50
-				elif conditions["tempC"] < FtoC(70):
-					color = COLOR_60
-				elif conditions["tempC"] < FtoC(80):
-					color = COLOR_70
-				elif conditions["tempC"] < FtoC(90):
-					color = COLOR_80
-				elif conditions["tempC"] < FtoC(100):
-					color = COLOR_90
-				elif conditions["tempC"] >= FtoC(100):
-					color = COLOR_100
-				else:
-					color = COLOR_CLEAR
+		# Pick up new frames after the worker published them, the frames are never modified in place
+		if received["maps"] is not maps:
+			maps = received["maps"]
+			for writer in writers:
+				print(writer.stats())
+			print(clock.report())
+
+		# Follow the day/night brightness, the strip only has to be rewritten when it changed
+		brightness = scheduler.brightness()
+		if brightness != LED_BRIGHTNESS:
+			LED_BRIGHTNESS = brightness
+			for writer in writers:
+				writer.setBrightness(brightness)
+
+		# Every map shows its own mode or the one of the button
+		animations = [maps[index].get(segment["mode"] or mode, blanks[index]) for index, segment in enumerate(segments)]
+		if lastAnimations is None or any(animation is not last for animation, last in zip(animations, lastAnimations)):
+			if any(animation is blank for animation, blank in zip(animations, blanks)):
+				print("Mode setting unavailable.")
+			animated = any(isAnimated(animation) for animation in animations)
+			lastAnimations = animations
+
+		# Send the precompiled frame of every map for this point of the animation cycle, unchanged frames are not sent again
+		# The frames are bytes, the maps on one strip are simply joined
+		clock.frameStarted()
+		for (pin, count, order, members), writer in zip(strips, writers):
+			if len(members) == 1:
+				animation = animations[members[0]]
+				writer.write(animation[clock.tick % len(animation)])
+			else:
+				writer.write(b"".join(animations[index][clock.tick % len(animations[index])] for index in members))
+		clock.frameDone()
+
+		# Wait for the next frame on the fixed timeline, without any animated station sleep until new data, a button press,
+		# a brightness change or the end of the power window
+		if animated:
+			clock.wait(wake)
 		else:
-			print("Mode setting unavailable.")
-
-		pixels[i] = color
-		i += 1
-
-	# Update actual LEDs all at once
-	pixels.show()
-
-	# Switching between animation cycles
-	time.sleep(BLINK_SPEED)
-	flashCycle = False if flashCycle else True
-
-print()
-print("Done")
+			powerChange = power.nextChange()
+			wake.wait(scheduler.nextChange() if powerChange is None else min(scheduler.nextChange(), powerChange))
+			wake.clear()
+			clock.reset()
+		usage.wakeup()
+
+	print()
+	print("Done")
@@ -1,16 +1,29 @@
 #!/usr/bin/env python3
 
-import urllib.request
-import xml.etree.ElementTree as ET
-import board
-import neopixel
+import os
 import time
+from fetch import ChunkedFetcher
+from metarparse import parseResponses
+from rawmetar import decodeMetar
+from refresher import Refresher
+from power import PowerSchedule, PowerUsage
+from frames import compileFrames, frameBytes, FrameWriter, isAnimated
+from animation import compileAnimation, stationOffsets, FrameClock
+from metrics import Metrics
+from hardware import createStrip
+from stationstate import CATEGORY_CODES, newState, stationPositions, dataAges, fillMissing
+from stations import StationTable
+from colorrules import loadColorRules
+
+# Folder with the airports file, /home/pi/METARMap on the Raspberry Pi
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # NeoPixel LED Configuration
 LED_COUNT			= 150				# Number of LED pixels.
-LED_PIN				= board.D18			# GPIO pin connected to the pixels (18 is PCM).
+LED_PIN				= "D18"				# GPIO pin connected to the pixels (18 is PCM).
 LED_BRIGHTNESS			= 0.1				# Float from 0.0 (min) to 1.0 (max)
-LED_ORDER			= neopixel.GRB			# Strip type and colour ordering
+LED_ORDER			= "GRB"				# Strip type and colour ordering
+LED_BACKEND			= os.environ.get("METARMAP_BACKEND", "neopixel")	# "neopixel" for the strip, "memory" or "terminal" to run without a Raspberry Pi
 
 COLOR_VFR		= (255,0,0)			# Green
 COLOR_VFR_FADE	= (125,0,0)			# Green Fade for wind
@@ -22,6 +35,8 @@ COLOR_LIFR		= (0,125,125)			# Magenta
 COLOR_LIFR_FADE	= (0,75,75)			# Magenta Fade for wind
 COLOR_CLEAR		= (0,0,0)			# Clear
 COLOR_LIGHTNING	= (255,255,255)			# White
+COLOR_STALE		= (0,0,0)			# Stations without a report and no station nearby to stand in, e.g. (10,10,10) for a dim white
+COLOR_RULES_FILE	= os.path.join(BASE_DIR, 'colors.json')	# Other colors for the metar mode, see colors.example.json
 
 # Do you want the METARMap to be static to just show flight conditions, or do you also want blinking/fading based on current wind conditions
 ACTIVATE_WINDCONDITION_ANIMATION = True		# Set this to False for Static or True for animated wind conditions
@@ -39,79 +54,211 @@ ALWAYS_BLINK_FOR_GUSTS	= False				# Always animate for Gusts (regardless of spee
 # Blinking Speed in seconds
 BLINK_SPEED		= 1.0				# Float in seconds, e.g. 0.5 for half a second
 
-# Initialize the LED strip
-pixels = neopixel.NeoPixel(LED_PIN, LED_COUNT, brightness = LED_BRIGHTNESS, pixel_order = LED_ORDER, auto_write = False)
-
-# Read the airports file to retrieve list of airports and use as order for LEDs
-with open("/home/pi/METARMap/airports") as f:
-	airports = f.readlines()
-airports = [x.strip() for x in airports]
-
-# Retrieve METAR from aviationweather.gov data server
-# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
-url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString=" + ",".join([item for item in airports if item != "NULL"])
-print(url)
-
-content = urllib.request.urlopen(url).read()
-
-# Retrieve flying conditions from the service response and store in a dictionary for each airport
-root = ET.fromstring(content)
-conditionDict = { "": {"flightCategory" : "", "windSpeed" : 0, "windGust" : False, "lightning": False } }
-for metar in root.iter('METAR'):
-	stationId = metar.find('station_id').text
-	if metar.find('flight_category') is None:
-		print("Missing flight condition, skipping.")
-		continue
-	flightCategory = metar.find('flight_category').text
-	windGust = False
-	windSpeed = 0
-	lightning = False
-	if metar.find('wind_gust_kt') is not None:
-		windGust = (True if (ALWAYS_BLINK_FOR_GUSTS or int(metar.find('wind_gust_kt').text) > WIND_BLINK_THRESHOLD) else False)
-	if metar.find('wind_speed_kt') is not None:
-		windSpeed = int(metar.find('wind_speed_kt').text)
-	if metar.find('raw_text') is not None:
-		rawText = metar.find('raw_text').text
-		lightning = False if rawText.find('LTG') == -1 else True
-	print(stationId + ":" + flightCategory + ":" + str(windSpeed) + ":" + str(windGust) + ":" + str(lightning))
-	conditionDict[stationId] = { "flightCategory" : flightCategory, "windSpeed" : windSpeed, "windGust": windGust, "lightning": lightning }
-
-# Setting LED colors based on weather conditions
-windCycle = False
-while True:
-	i = 0
-	for airportcode in airports:
-		# Skip NULL entries
-		if airportcode == "NULL":
-			i += 1
+# Smooth animation, fading at FRAME_RATE instead of switching colors every BLINK_SPEED seconds
+SMOOTH_ANIMATION		= True			# Set to False for the two step blinking/fading
+FRAME_RATE				= 30			# Frames per second of the smooth animation, one fade cycle takes two BLINK_SPEED
+ANIMATION_GAMMA			= 2.2			# Gamma correction so fades look even to the eye
+ANIMATION_PHASE_OFFSETS	= True			# Give every airport its own phase so windy airports don't pulse in lockstep
+ANIMATION_CPU_BUDGET	= 0.25			# Share of one CPU the render loop may use before it draws fewer frames
+
+# Data refresh interval in seconds, the map keeps running and fetches new METARs in the background
+REFRESH_INTERVAL	= 300			# Float in seconds, e.g. 300 for five minutes
+FETCH_TIMEOUT		= 30			# Seconds before giving up on a single request to aviationweather.gov
+CACHE_FILE			= os.path.join(BASE_DIR, 'metar.xml.gz')	# Last good response (one file per chunk), used right away after a restart or during an outage
+FETCH_CHUNK_SIZE	= 300			# Stations per request, longer station lists are split into several requests
+FETCH_WORKERS		= 16			# Requests that run at the same time, never more than there are chunks
+
+# Power schedule, outside these windows of local time the LED is dark, no data is fetched and the script sleeps until the next window
+POWER_WINDOWS		= []			# (on, off) times, e.g. [("07:00", "22:00")] or [("06:30", "09:00"), ("17:00", "23:30")], [] to stay on around the clock
+
+# Metrics of every stage for monitoring, with the same names in map.py, metar.py and temp.py
+METRICS_FILE		= None			# Prometheus text file, e.g. '/dev/shm/metarmap.prom' on a tmpfs, for the node_exporter textfile collector (None to disable)
+METRICS_PORT		= None			# Port of a local HTTP endpoint with the same metrics, e.g. 9101 (None to disable)
+METRICS_INTERVAL	= 60			# Seconds between writes of METRICS_FILE
+
+# Stations without a report, e.g. when their METAR is stale, are filled in from the nearest station on the map that has one
+STATION_FILE		= os.path.join(BASE_DIR, 'stations.json')		# Station coordinates, learned from the METAR responses and the station information
+STATION_INFO_FILE	= os.path.join(BASE_DIR, 'stationinfo.xml.gz')	# Last good station information response, like CACHE_FILE
+STATION_INFO_INTERVAL	= 86400		# Seconds between requests for the coordinates of stations that have not reported yet
+FALLBACK_RADIUS		= 50			# Nautical miles a station may be away to stand in, 0 to leave stations without a report dark
+FALLBACK_NEIGHBOURS	= 3				# Nearest stations that may stand in, nearest first
+
+# Timings and counters of every stage, exported by the main block
+metrics = Metrics()
+
+# Retrieve flying conditions from the service response and store them in the rows of the airports' LEDs
+# The coordinates of the stations are added to the station table, if there is one
+def parseConditions(contents, airports, stations = None):
+	state = newState(len(airports))
+	positions = stationPositions(airports)
+	for metar in parseResponses(contents):
+		stationId = metar['stationId']
+		rows = positions.get(stationId)
+		if rows is None:
+			continue
+		if stations is not None:
+			stations.add(stationId, metar['latitude'], metar['longitude'])
+		# Decode the raw report to catch thunderstorms and to derive the flight category when the feed has none
+		decoded = decodeMetar(metar['rawText']) if metar['rawText'] is not None else None
+		flightCategory = metar['flightCategory']
+		if flightCategory is None and decoded is not None:
+			flightCategory = decoded['flightCategory']
+		if flightCategory is None:
+			print("Missing flight condition, skipping.")
 			continue
+		observed = 0
+		windSpeed = 0
+		windGust = -1
+		lightning = False
+		if metar['observationTime'] is not None:
+			observed = metar['observationTime']
+		if metar['windSpeed'] is not None:
+			windSpeed = metar['windSpeed']
+		if metar['windGust'] is not None:
+			windGust = metar['windGust']
+		if decoded is not None:
+			lightning = decoded['lightning']
+		print(stationId + ":" + flightCategory + ":" + str(windSpeed) + ":" + str(windGust >= 0 and (ALWAYS_BLINK_FOR_GUSTS or windGust > WIND_BLINK_THRESHOLD)) + ":" + str(lightning))
+		state[rows] = (True, observed, CATEGORY_CODES.get(flightCategory, 0), windSpeed, windGust, lightning, 0, 0, 0, 0, 0, 0, False)
+	return state
+
+# Color rules of the flight categories (see colorrules.py), fading to a darker shade on the second phase
+# when it is windy or gusting and white on the first phase for lightning
+METAR_RULES = {
+	"colors" : { "column" : "flightCategory", "colors" : { "VFR" : COLOR_VFR, "MVFR" : COLOR_MVFR, "IFR" : COLOR_IFR, "LIFR" : COLOR_LIFR }, "default" : COLOR_CLEAR },
+	"flash" : ([{ "phase" : 1,
+		"any" : [{ "column" : "windSpeed", "above" : WIND_BLINK_THRESHOLD }, { "column" : "windGust", "atLeast" : 0 } if ALWAYS_BLINK_FOR_GUSTS else { "column" : "windGust", "above" : WIND_BLINK_THRESHOLD }],
+		"colors" : { "column" : "flightCategory", "colors" : { "VFR" : COLOR_VFR_FADE, "MVFR" : COLOR_MVFR_FADE, "IFR" : COLOR_IFR_FADE, "LIFR" : COLOR_LIFR_FADE }, "default" : COLOR_CLEAR } if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR,
+	}] if ACTIVATE_WINDCONDITION_ANIMATION else []) + ([{ "phase" : 0,
+		"all" : [{ "column" : "lightning" }, { "column" : "flightCategory", "above" : 0 }],
+		"colors" : COLOR_LIGHTNING,
+	}] if ACTIVATE_LIGHTNING_ANIMATION else []),
+}
+
+# Colors of all stations, the second argument switches between the two animation phases
+# The metar mode of COLOR_RULES_FILE replaces the rules above
+metarColor = loadColorRules(COLOR_RULES_FILE, { 'metar' : METAR_RULES })['metar']
+
+# Compile the frames of a mode into one animation cycle, ANIMATION_STEPS frames long
+ANIMATION_STEPS = int(round(FRAME_RATE * 2 * BLINK_SPEED)) if SMOOTH_ANIMATION else 2
+def animate(frames, airports):
+	return compileAnimation(frames, ANIMATION_STEPS, ANIMATION_GAMMA, stationOffsets(airports, ANIMATION_STEPS) if ANIMATION_PHASE_OFFSETS else None)
 
-		color = COLOR_CLEAR
-		conditions = conditionDict.get(airportcode, None)
-
-		if conditions != None:
-			windy = True if (ACTIVATE_WINDCONDITION_ANIMATION and windCycle == True and (conditions["windSpeed"] > WIND_BLINK_THRESHOLD or conditions["windGust"] == True)) else False
-			lightningConditions = True if (ACTIVATE_LIGHTNING_ANIMATION and windCycle == False and conditions["lightning"] == True) else False
-			if conditions["flightCategory"] == "VFR":
-				color = COLOR_VFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_VFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-			elif conditions["flightCategory"] == "MVFR":
-				color = COLOR_MVFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_MVFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-			elif conditions["flightCategory"] == "IFR":
-				color = COLOR_IFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_IFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
-			elif conditions["flightCategory"] == "LIFR":
-				color = COLOR_LIFR if not (windy or lightningConditions) else COLOR_LIGHTNING if lightningConditions else (COLOR_LIFR_FADE if FADE_INSTEAD_OF_BLINK else COLOR_CLEAR) if windy else COLOR_CLEAR
+# Parse a response and compile its frames and animation, all on the refresh thread
+# With a station table, stations without a report are filled in from their neighbours
+def loadData(contents, airports, stations = None):
+	airports = airports[:LED_COUNT]
+	with metrics.stage("parse"):
+		state = parseConditions(contents, airports, stations)
+		fillMissing(state, airports, stations.neighbours(airports, FALLBACK_RADIUS, FALLBACK_NEIGHBOURS) if stations is not None and FALLBACK_RADIUS > 0 else None)
+	if stations is not None:
+		stations.save()
+	with metrics.stage("frames"):
+		frames = compileFrames(state, metarColor, COLOR_STALE)
+		animation = frameBytes(animate(frames, airports))
+	return { "state" : state, "frames" : frames, "animation" : animation }
+
+# Everything below only runs when the script is started, not when it is imported e.g. by benchmark.py
+if __name__ == "__main__":
+	# Initialize the LED strip
+	pixels = createStrip(LED_BACKEND, LED_PIN, LED_COUNT, LED_ORDER)
+
+	# Read the airports file to retrieve list of airports and use as order for LEDs
+	with open(os.path.join(BASE_DIR, "airports")) as f:
+		airports = f.readlines()
+	airports = [x.strip() for x in airports]
+
+	# Retrieve METAR from aviationweather.gov data server
+	# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
+	url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString="
+	stations = [item for item in airports if item != "NULL"]
+	print(url + ",".join(stations))
+
+	# Station coordinates for the stations without a report
+	# Stations that have not reported since the table was started are looked up in the station information of the same data server
+	stationTable = StationTable(STATION_FILE)
+	stationUrl = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=stations&requestType=retrieve&format=xml&stationString="
+	stationFetcher = ChunkedFetcher(stationUrl, stations, STATION_INFO_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	stationTable.addStations(stationFetcher.contents)
+
+	# Fetching and parsing runs on a background thread every REFRESH_INTERVAL seconds while the LEDs keep animating
+	# Only download and parse again when the feed has changed since the last request
+	def fetchData():
+		with metrics.stage("fetch"):
+			contents = fetcher.fetch()
+		metrics.count("metarmap_fetch_bytes_total", fetcher.bytesDownloaded)
+		metrics.count("metarmap_fetch_chunk_failures_total", fetcher.failed)
+		placed = stationTable.lookup(stationFetcher, stations, STATION_INFO_INTERVAL)
+		if not fetcher.modified and not placed and refresher.data is not None:
+			return refresher.data
+		return loadData(contents, airports, stationTable)
+
+	# Start from the cached response of the last run, if there is one, while the first fetch is running
+	fetcher = ChunkedFetcher(url, stations, CACHE_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	refresher = Refresher(fetchData, REFRESH_INTERVAL, initial = loadData(fetcher.contents, airports, stationTable) if fetcher.contents else None).start()
+	refresher.updated.wait()
+
+	# Setting LED colors based on weather conditions
+	writer = FrameWriter(pixels, metrics, LED_BRIGHTNESS)
+	clock = FrameClock(FRAME_RATE if SMOOTH_ANIMATION else 1 / BLINK_SPEED, ANIMATION_CPU_BUDGET, metrics)
+
+	# Export the stage timings together with the frame counts and the age of every station's data
+	def stationAges():
+		if refresher.data is None:
+			return []
+		return [('station="' + stationId + '"', round(age, 1)) for stationId, age in dataAges(refresher.data["state"], airports[:LED_COUNT], time.time())]
+	metrics.collect("metarmap_frames_shown_total", "counter", lambda: [("", writer.shown)])
+	metrics.collect("metarmap_frames_skipped_total", "counter", lambda: [("", writer.skipped)])
+	metrics.collect("metarmap_station_data_age_seconds", "gauge", stationAges)
+
+	# On and off hours, the time, CPU time and wakeups of both are counted to check the savings of the off hours
+	power = PowerSchedule(POWER_WINDOWS)
+	usage = PowerUsage(power.isOn())
+	metrics.collect("metarmap_power_seconds_total", "counter", lambda: usage.values(0))
+	metrics.collect("metarmap_cpu_seconds_total", "counter", lambda: usage.values(1))
+	metrics.collect("metarmap_wakeups_total", "counter", lambda: usage.values(2))
+	metrics.start(METRICS_FILE, METRICS_PORT, METRICS_INTERVAL, refresher.active)
+	lit = None							# Whether the map is on, None until the first pass of the loop
+	while True:
+		# Count the skipped writes of the previous data, the animation is swapped as a whole by the refresher
+		if refresher.updated.is_set():
+			refresher.updated.clear()
+			animation = refresher.data["animation"]
+			animated = isAnimated(animation)
+			print(writer.stats())
+			print(clock.report())
+
+		# Outside the power windows blank the strip once, stop fetching and sleep until the next window.
+		# The refresher keeps its data and the fetcher its cache, the first refresh afterwards is a conditional request.
+		on = power.isOn()
+		if on != lit:
+			lit = on
+			usage.switch(on)
+			print(("Lights on. " if on else "Lights off. ") + usage.report())
+			if on:
+				refresher.resume()
+				clock.reset()
 			else:
-				color = COLOR_CLEAR
-		#print("Setting LED " + str(i) + " for " + airportcode + " to " + ("lightning " if lightningConditions else "") + ("windy " if windy else "") + (conditions["flightCategory"] if conditions != None else "None") + " " + str(color))
-		pixels[i] = color
-		i += 1
+				refresher.pause()
+				writer.write(bytes(len(animation[0])))
+		if not on:
+			time.sleep(power.nextChange())
+			usage.wakeup()
+			continue
 
-	# Update actual LEDs all at once
-	pixels.show()
+		# Send the precompiled frame for this point of the animation cycle, unchanged frames are not sent again
+		clock.frameStarted()
+		writer.write(animation[clock.tick % len(animation)])
+		clock.frameDone()
 
-	# Switching between animation cycles
-	time.sleep(BLINK_SPEED)
-	windCycle = False if windCycle else True
+		# Wait for the next frame on the fixed timeline, without any animated station sleep until new data arrives
+		# or the end of the power window
+		if animated:
+			clock.wait()
+		else:
+			refresher.updated.wait(power.nextChange())
+			clock.reset()
+		usage.wakeup()
 
-print()
-print("Done")
+	print()
+	print("Done")
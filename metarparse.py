@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import datetime
+import io
+import xml.etree.ElementTree as ET
+
+# Seconds since the epoch of a UTC time like 2026-10-18T18:53:00Z, fromisoformat takes a tenth of the time of strptime
+def isoTime(text):
+	if text[-1:] != "Z":
+		raise ValueError("Not a UTC time: " + text)
+	return int(datetime.datetime.fromisoformat(text[:-1] + "+00:00").timestamp())
+
+# Fields read from each <METAR> element: XML tag -> (record key, conversion)
+FIELDS = {
+	'station_id'		: ('stationId', str),
+	'flight_category'	: ('flightCategory', str),
+	'wind_speed_kt'		: ('windSpeed', int),
+	'wind_gust_kt'		: ('windGust', int),
+	'raw_text'			: ('rawText', str),
+	'temp_c'			: ('tempC', float),
+	'dewpoint_c'		: ('dewpointC', float),
+	'observation_time'	: ('observationTime', isoTime),
+	'latitude'			: ('latitude', float),
+	'longitude'			: ('longitude', float),
+}
+
+# Fields read from each <Station> element of the station information
+STATION_FIELDS = {
+	'station_id'		: ('stationId', str),
+	'latitude'			: ('latitude', float),
+	'longitude'			: ('longitude', float),
+}
+
+# Streaming parser for the aviationweather.gov METAR XML.
+# Each <METAR> element's children are read in a single pass into a small dictionary
+# (None for fields the report does not have) and the element is cleared right after,
+# so memory stays flat and parse time grows linearly with the number of stations.
+def parseMetars(content):
+	return parseRecords(content, 'METAR', FIELDS)
+
+# Coordinates of the stations in a station information response, dataSource=stations of the data server
+def parseStations(content):
+	return parseRecords(content, 'Station', STATION_FIELDS)
+
+# Records of the elements called tag with the fields of their children, e.g. the <TAF> elements of the TAF feed.
+# Only end events are read, a start event per element would cost more than the whole tree build of ET.fromstring.
+def parseRecords(content, tag, fields):
+	empty = { key : None for key, conversion in fields.values() }
+	for event, elem in ET.iterparse(io.BytesIO(content)):
+		if elem.tag != tag:
+			continue
+
+		record = dict(empty)
+		for child in elem:
+			field = fields.get(child.tag)
+			if field is not None and child.text is not None:
+				try:
+					record[field[0]] = field[1](child.text)
+				except ValueError:
+					pass
+		# Drop the children of the finished element, only its empty shell stays in the tree
+		elem.clear()
+		if record['stationId'] is not None:
+			yield record
+
+# Records of several responses one after the other, e.g. one response per chunk of stations
+def parseResponses(contents):
+	for content in contents:
+		yield from parseMetars(content)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import contextlib
+import http.server
+import os
+import threading
+import time
+
+# Run time metrics of the map in the Prometheus text format.
+# Stages and other timings are summaries (sum, count and the maximum since start), counters only add up
+# and collectors are functions that are asked for their current values when the metrics are exported.
+# Recording a value is one dictionary lookup under a lock, cheap enough for every frame. The text is
+# written to a file, e.g. for the node_exporter textfile collector, and/or served on a local HTTP port.
+class Metrics:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.summaries = {}				# name -> labels -> [sum, count, max]
+		self.counters = {}				# name -> labels -> value
+		self.collectors = []			# (name, type, function returning [(labels, value)])
+		self.included = []				# Functions returning a snapshot of the metrics of another process, or None
+
+	# Record one value of a summary, labels is preformatted like 'stage="parse"'
+	def observe(self, name, value, labels = ""):
+		with self.lock:
+			summary = self.summaries.setdefault(name, {}).get(labels)
+			if summary is None:
+				self.summaries[name][labels] = [value, 1, value]
+			else:
+				summary[0] += value
+				summary[1] += 1
+				if value > summary[2]:
+					summary[2] = value
+
+	def count(self, name, value = 1, labels = ""):
+		with self.lock:
+			counter = self.counters.setdefault(name, {})
+			counter[labels] = counter.get(labels, 0) + value
+
+	def collect(self, name, kind, function):
+		self.collectors.append((name, kind, function))
+
+	# Time a stage of the pipeline, failed stages are counted as well before the exception is passed on
+	@contextlib.contextmanager
+	def stage(self, stage):
+		labels = 'stage="' + stage + '"'
+		start = time.perf_counter()
+		try:
+			yield
+		except Exception:
+			self.count("metarmap_stage_failures_total", 1, labels)
+			raise
+		finally:
+			self.observe("metarmap_stage_seconds", time.perf_counter() - start, labels)
+
+	# Export the metrics of another process together with these, e.g. from a snapshot it shares
+	def include(self, function):
+		self.included.append(function)
+
+	# All values as plain dictionaries and lists that can be sent to another process as JSON
+	def snapshot(self):
+		with self.lock:
+			summaries = { name : { labels : list(values) for labels, values in series.items() } for name, series in self.summaries.items() }
+			counters = { name : dict(series) for name, series in self.counters.items() }
+		collected = {}
+		for name, kind, function in self.collectors:
+			try:
+				collected[name] = [kind, [list(value) for value in function()]]
+			except Exception as e:
+				print("Metrics collector " + name + " failed: " + str(e))
+		return { "summaries" : summaries, "counters" : counters, "collected" : collected }
+
+	def render(self):
+		snapshot = self.snapshot()
+		for function in self.included:
+			other = function()
+			if other is None:
+				continue
+			for name, series in other["summaries"].items():
+				snapshot["summaries"].setdefault(name, {}).update(series)
+			for name, series in other["counters"].items():
+				snapshot["counters"].setdefault(name, {}).update(series)
+			for name, collected in other["collected"].items():
+				snapshot["collected"].setdefault(name, collected)
+		summaries, counters = snapshot["summaries"], snapshot["counters"]
+		lines = []
+		def sample(name, labels, value):
+			lines.append(name + ("{" + labels + "}" if labels else "") + " " + repr(float(value)))
+		for name in sorted(summaries):
+			lines.append("# TYPE " + name + " summary")
+			for labels, (total, count, maximum) in sorted(summaries[name].items()):
+				sample(name + "_sum", labels, total)
+				sample(name + "_count", labels, count)
+			lines.append("# TYPE " + name + "_max gauge")
+			for labels, (total, count, maximum) in sorted(summaries[name].items()):
+				sample(name + "_max", labels, maximum)
+		for name in sorted(counters):
+			lines.append("# TYPE " + name + " counter")
+			for labels, value in sorted(counters[name].items()):
+				sample(name, labels, value)
+		for name, (kind, values) in snapshot["collected"].items():
+			lines.append("# TYPE " + name + " " + kind)
+			for labels, value in values:
+				sample(name, labels, value)
+		return "\n".join(lines) + "\n"
+
+	# Replace the metrics file atomically, so a collector never reads half of it
+	def writeFile(self, path):
+		with open(path + ".tmp", 'w') as f:
+			f.write(self.render())
+		os.replace(path + ".tmp", path)
+
+	# Serve the metrics on http://address:port/metrics from a daemon thread
+	def serve(self, port, address = "127.0.0.1"):
+		metrics = self
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self):
+				content = metrics.render().encode()
+				self.send_response(200)
+				self.send_header("Content-Type", "text/plain; version=0.0.4")
+				self.send_header("Content-Length", str(len(content)))
+				self.end_headers()
+				self.wfile.write(content)
+			def log_message(self, format, *args):
+				pass
+		server = http.server.ThreadingHTTPServer((address, port), Handler)
+		threading.Thread(target = server.serve_forever, daemon = True).start()
+		return server
+
+	# Export the metrics every interval seconds to path and/or on port, both are optional.
+	# With active, an event, the file is only written while it is set, e.g. while the map is on.
+	def start(self, path = None, port = None, interval = 60, active = None):
+		if port is not None:
+			self.serve(port)
+		if path is not None:
+			def run():
+				while True:
+					if active is not None:
+						active.wait()
+					try:
+						self.writeFile(path)
+					except OSError as e:
+						print("Could not write metrics: " + str(e))
+					time.sleep(interval)
+			threading.Thread(target = run, daemon = True).start()
+		return self
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+# On/off schedule of the map in local time, instead of a cron job that kills the map and turns the LEDs off.
+# windows are (on, off) times like ("07:00", "22:00"), a window whose off time is before its on time runs past
+# midnight and one with the same on and off time lasts the whole day. Without windows the map is always on.
+class PowerSchedule:
+	def __init__(self, windows):
+		self.windows = [(minutes(on), minutes(off)) for on, off in windows]
+
+	def isOn(self, now = None):
+		if not self.windows:
+			return True
+		local = time.localtime(time.time() if now is None else now)
+		minute = local.tm_hour * 60 + local.tm_min + local.tm_sec / 60
+		for on, off in self.windows:
+			if on == off or (on <= minute < off if on < off else (minute >= on or minute < off)):
+				return True
+		return False
+
+	# Seconds until the map is switched on or off the next time, None if it never is
+	def nextChange(self, now = None):
+		now = time.time() if now is None else now
+		state = self.isOn(now)
+		local = time.localtime(now)
+		# Every on and off time of today and the next two days, mktime takes care of month ends and daylight saving time
+		changes = sorted(time.mktime((local.tm_year, local.tm_mon, local.tm_mday + day, boundary // 60, boundary % 60, 0, 0, 0, -1))
+			for day in range(3) for window in self.windows for boundary in window)
+		for change in changes:
+			if change > now and self.isOn(change) != state:
+				return change - now
+		return None
+
+# Minutes after midnight of a time like "07:30"
+def minutes(clock):
+	hours, separator, mins = clock.partition(":")
+	if not separator or not 0 <= int(hours) < 24 or not 0 <= int(mins) < 60:
+		raise ValueError("Times of the power schedule are written like 07:30, not " + clock)
+	return int(hours) * 60 + int(mins)
+
+# Wall time, CPU time of this process and wakeups of the render loop while the map is on and while it is off,
+# so the savings of the off hours can be checked in the metrics and the log
+class PowerUsage:
+	def __init__(self, on = True):
+		self.state = "on" if on else "off"
+		self.totals = { "on" : [0.0, 0.0, 0], "off" : [0.0, 0.0, 0] }	# state -> [seconds, CPU seconds, wakeups]
+		self.since = (time.monotonic(), time.process_time())
+		self.lock = threading.Lock()		# The metrics are collected on another thread
+
+	def switch(self, on):
+		state = "on" if on else "off"
+		with self.lock:
+			if state != self.state:
+				self.add()
+				self.state = state
+
+	def wakeup(self):
+		self.totals[self.state][2] += 1
+
+	# Move the time since the last switch into the totals of the current state
+	def add(self):
+		now = (time.monotonic(), time.process_time())
+		self.totals[self.state][0] += now[0] - self.since[0]
+		self.totals[self.state][1] += now[1] - self.since[1]
+		self.since = now
+
+	# Values of one column of the totals for a metrics collector, up to now
+	def values(self, column):
+		with self.lock:
+			self.add()
+			return [('state="' + state + '"', totals[column]) for state, totals in self.totals.items()]
+
+	def report(self):
+		with self.lock:
+			self.add()
+			return "Power: " + ", ".join(state + " " + str(round(seconds)) + " s with " + str(round(cpu, 1)) + " s CPU and " + str(wakeups) + " wakeups" for state, (seconds, cpu, wakeups) in self.totals.items())
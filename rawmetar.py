@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import re
+
+# Tokens of the body of a METAR, matched in one pass over the report.
+# Every alternative is wrapped in an outer named group so match.lastgroup tells which one matched.
+TOKEN = re.compile(r"""(?<!\S)(?:
+	(?P<wind>(?P<windDir>\d{3}|VRB)(?P<windSpeed>\d{2,3})(?:G(?P<windGust>\d{2,3}))?(?P<windUnit>KT|MPS))
+	|(?P<visSM>(?P<visLess>[MP])?(?:(?P<visWhole>\d{1,2})\s)?(?P<visNum>\d{1,2})(?:/(?P<visDen>\d{1,2}))?SM)
+	|(?P<visMetric>(?P<visMeters>\d{4})(?:NDV)?)
+	|(?P<cavok>CAVOK)
+	|(?P<sky>(?P<cover>FEW|SCT|BKN|OVC|VV)(?P<base>\d{3}|///)(?:CB|TCU|///)?)
+	|(?P<clear>SKC|CLR|NSC|NCD)
+	|(?P<temps>(?P<temp>M?\d{2})/(?P<dewpoint>M?\d{2})?)
+	|(?P<weather>[-+]?(?:VC)?(?:MI|PR|BC|DR|BL|SH|TS|FZ)?(?:DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)*)
+	|(?P<remarks>RMK)
+)(?!\S)""", re.VERBOSE)
+
+LIGHTNING = re.compile(r"LTG")
+
+# Convert a METAR temperature like M05 to degrees C
+def metarTemp(text):
+	return -int(text[1:]) if text[0] == 'M' else int(text)
+
+# Flight category from visibility in statute miles and ceiling in feet, None if both are unknown
+def flightCategory(visibility, ceiling):
+	if visibility is None and ceiling is None:
+		return None
+	if (ceiling is not None and ceiling < 500) or (visibility is not None and visibility < 1):
+		return "LIFR"
+	if (ceiling is not None and ceiling < 1000) or (visibility is not None and visibility < 3):
+		return "IFR"
+	if (ceiling is not None and ceiling <= 3000) or (visibility is not None and visibility <= 5):
+		return "MVFR"
+	return "VFR"
+
+# Decode a raw METAR report into a dictionary with wind, visibility, cloud layers, ceiling,
+# temperature/dewpoint, weather phenomena, lightning and the flight category derived from them.
+# Fields that are not in the report are None, weather and layers are empty lists.
+def decodeMetar(rawText):
+	decoded = { "windDir" : None, "windSpeed" : None, "windGust" : None, "visibility" : None, "layers" : [], "ceiling" : None, "tempC" : None, "dewpointC" : None, "weather" : [], "lightning" : False }
+	remarks = None
+	for match in TOKEN.finditer(rawText):
+		kind = match.lastgroup
+		if kind == 'weather':
+			if match.group(0) not in ('', '-', '+'):
+				decoded["weather"].append(match.group(0))
+		elif kind == 'wind':
+			factor = 1.94384 if match.group('windUnit') == 'MPS' else 1
+			decoded["windDir"] = None if match.group('windDir') == 'VRB' else int(match.group('windDir'))
+			decoded["windSpeed"] = int(round(int(match.group('windSpeed')) * factor))
+			if match.group('windGust') is not None:
+				decoded["windGust"] = int(round(int(match.group('windGust')) * factor))
+		elif kind == 'visSM':
+			visibility = float(match.group('visNum'))
+			if match.group('visDen') is not None:
+				visibility /= float(match.group('visDen'))
+			if match.group('visWhole') is not None:
+				visibility += float(match.group('visWhole'))
+			decoded["visibility"] = visibility
+		elif kind == 'visMetric':
+			decoded["visibility"] = 10.0 if match.group('visMeters') == '9999' else int(match.group('visMeters')) / 1609.34
+		elif kind == 'cavok':
+			decoded["visibility"] = 10.0
+		elif kind == 'sky':
+			base = None if match.group('base') == '///' else int(match.group('base')) * 100
+			decoded["layers"].append((match.group('cover'), base))
+			if match.group('cover') in ('BKN', 'OVC', 'VV') and base is not None and (decoded["ceiling"] is None or base < decoded["ceiling"]):
+				decoded["ceiling"] = base
+		elif kind == 'temps':
+			decoded["tempC"] = metarTemp(match.group('temp'))
+			if match.group('dewpoint') is not None:
+				decoded["dewpointC"] = metarTemp(match.group('dewpoint'))
+		elif kind == 'remarks':
+			remarks = rawText[match.end():]
+			break
+
+	# The category comes from whichever of visibility and ceiling the report has, e.g. OVC004 alone is LIFR
+	decoded["flightCategory"] = flightCategory(decoded["visibility"], decoded["ceiling"])
+	decoded["lightning"] = any('TS' in weather for weather in decoded["weather"]) or (remarks is not None and LIGHTNING.search(remarks) is not None)
+	return decoded
@@ -1,3 +1,4 @@
-/usr/bin/sudo pkill -F /home/pi/METARMap/offpid.pid
-/usr/bin/sudo pkill -F /home/pi/METARMap/metarpid.pid
-/usr/bin/sudo /usr/bin/python3 /home/pi/METARMap/metar.py & echo $! > /home/pi/METARMap/metarpid.pid
\ No newline at end of file
+/usr/bin/sudo pkill -f /home/pi/METARMap/map.py
+/usr/bin/sudo pkill -f /home/pi/METARMap/temp.py
+# metar.py stays running and refreshes its own data, only start it when it is not running yet
+/usr/bin/pgrep -f /home/pi/METARMap/metar.py > /dev/null || { /usr/bin/sudo /usr/bin/python3 /home/pi/METARMap/metar.py & }
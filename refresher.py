@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+# Background data refresh for the long-running map scripts.
+# The load function is called every interval seconds on a daemon thread and its result
+# replaces the previous one with a single reference assignment, so the render loop always
+# sees either the complete old data or the complete new data, never a mix of both.
+class Refresher:
+	def __init__(self, load, interval, retry = 30, initial = None, wake = None):
+		self.load = load
+		self.interval = interval		# Seconds between refreshes
+		self.retry = retry				# Seconds before retrying when there is no data yet
+		self.data = initial				# e.g. conditions parsed from a cached response
+		self.updated = threading.Event()	# Set every time new data has been swapped in
+		self.wake = wake					# Optional extra event set together with updated, e.g. to wake an idle render loop
+		if initial is not None:
+			self.updated.set()
+		self.busySince = None				# Start of the refresh that is running right now, None between refreshes
+		self.stopped = threading.Event()
+		self.active = threading.Event()		# Cleared while paused, the thread then sleeps without waking up
+		self.active.set()
+		self.woken = threading.Event()		# Ends the wait for the next refresh early
+		self.thread = threading.Thread(target = self.run, daemon = True)
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+		self.woken.set()
+		self.active.set()
+
+	# Stop refreshing, e.g. while the map is off. A refresh that is running finishes, the data is kept.
+	def pause(self):
+		self.active.clear()
+
+	# Refresh right away and then every interval again, the fetcher still has its cache and validators
+	def resume(self):
+		if not self.active.is_set():
+			self.active.set()
+			self.woken.set()
+
+	# Load once and swap the result in, keeping the previous data if the load fails
+	def refresh(self):
+		self.busySince = time.time()
+		try:
+			data = self.load()
+		except Exception as e:
+			print("Refresh failed, keeping previous data: " + str(e))
+			return False
+		finally:
+			self.busySince = None
+		self.data = data
+		self.updated.set()
+		if self.wake is not None:
+			self.wake.set()
+		return True
+
+	def run(self):
+		while True:
+			self.active.wait()
+			if self.stopped.is_set():
+				break
+			self.woken.clear()
+			self.refresh()
+			self.woken.wait(self.interval if self.data is not None else self.retry)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import time
+import zlib
+import numpy
+from events import writeJson
+from metarparse import parseStations
+
+# Coordinates of the stations, learned from the METAR responses and kept in a local file.
+# Every report carries the latitude and longitude of its station, so the table fills itself and is
+# only saved when a station was added or moved. Stations that have not reported for a while keep
+# their coordinates, so their LEDs still have a position on a grid. Stations that have not reported
+# at all are looked up in the station information of the data server, see lookup.
+class StationTable:
+	def __init__(self, path):
+		self.path = path
+		self.changed = False
+		self.neighbourCache = None		# (key, neighbours) of the last airports list
+		self.lookedUp = 0				# Time of the last station information request
+		try:
+			with open(path) as f:
+				self.coordinates = json.load(f)		# station -> [latitude, longitude]
+		except (OSError, ValueError):
+			self.coordinates = {}
+
+	def add(self, stationId, latitude, longitude):
+		if latitude is None or longitude is None:
+			return
+		position = [latitude, longitude]
+		if self.coordinates.get(stationId) != position:
+			self.coordinates[stationId] = position
+			self.changed = True
+
+	# Coordinates of the <Station> records of station information responses
+	def addStations(self, contents):
+		for content in contents:
+			for station in parseStations(content):
+				self.add(station['stationId'], station['latitude'], station['longitude'])
+
+	# Stations of the list without coordinates
+	def missing(self, stations):
+		return [stationId for stationId in stations if stationId not in self.coordinates]
+
+	# Fill in the stations without coordinates from the station information the fetcher, a ChunkedFetcher of the station list, returns.
+	# Only asked every interval seconds while stations are missing, e.g. a misspelled station the data server does not know.
+	# Returns True if coordinates were added, so the neighbours have to be found again.
+	def lookup(self, fetcher, stations, interval):
+		if not self.missing(stations) or time.time() - self.lookedUp < interval:
+			return False
+		self.lookedUp = time.time()
+		try:
+			fetcher.fetch()
+		except Exception as e:
+			print("Could not fetch the station information: " + str(e))
+		count = len(self.coordinates)
+		self.addStations(fetcher.contents)
+		return len(self.coordinates) > count
+
+	def save(self):
+		if not self.changed:
+			return
+		try:
+			writeJson(self.path, self.coordinates)
+			self.changed = False
+		except OSError as e:
+			print("Could not save the station table: " + str(e))
+
+	# Latitude and longitude of every LED, NaN for NULL slots and stations without known coordinates
+	def positions(self, airports):
+		latitudes = numpy.full(len(airports), numpy.nan)
+		longitudes = numpy.full(len(airports), numpy.nan)
+		for position, airportcode in enumerate(airports):
+			coordinates = self.coordinates.get(airportcode)
+			if coordinates is not None:
+				latitudes[position], longitudes[position] = coordinates
+		return latitudes, longitudes
+
+	# Nearest stations of every LED, see nearestNeighbours, only calculated again when the airports or their coordinates change
+	def neighbours(self, airports, radius, count):
+		latitudes, longitudes = self.positions(airports)
+		key = (zlib.crc32(latitudes.tobytes() + longitudes.tobytes()), radius, count)
+		if self.neighbourCache is None or self.neighbourCache[0] != key:
+			self.neighbourCache = (key, nearestNeighbours(latitudes, longitudes, radius, count))
+		return self.neighbourCache[1]
+
+EARTH_RADIUS = 3440.065		# Nautical miles
+
+# Great circle distances in nautical miles from one position to arrays of positions
+def distances(latitude, longitude, latitudes, longitudes):
+	lat1, lat2 = numpy.radians(latitude), numpy.radians(latitudes)
+	a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin(numpy.radians(longitudes - longitude) / 2) ** 2
+	return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+# Up to count other LEDs within radius nautical miles of every LED, nearest first, padded with -1.
+# The positions are sorted into cells of radius degrees of latitude, so every LED only measures the
+# distance to the LEDs in the cells around it. LEDs at the same position, e.g. one station on two LEDs, are not each other's neighbours.
+# The columns of cells go once around the globe, so stations on both sides of the 180th meridian are neighbours too.
+def nearestNeighbours(latitudes, longitudes, radius, count):
+	neighbours = numpy.full((len(latitudes), count), -1, dtype = numpy.int32)
+	known = numpy.flatnonzero(~(numpy.isnan(latitudes) | numpy.isnan(longitudes)))
+	if radius <= 0 or count <= 0 or len(known) == 0:
+		return neighbours
+	cell = radius / 60.0
+	# A whole number of columns, each at least a cell wide, so the last column ends at the first
+	columns = max(1, math.floor(360 / cell))
+	width = 360.0 / columns
+	cells = {}
+	for row in known:
+		cells.setdefault((math.floor(latitudes[row] / cell), math.floor(longitudes[row] % 360 / width) % columns), []).append(row)
+	for row in known:
+		latitude, longitude = latitudes[row], longitudes[row]
+		i, j = math.floor(latitude / cell), math.floor(longitude % 360 / width) % columns
+		# Cells are narrower towards the poles, so more of them are needed to cover the radius east and west
+		span = math.ceil(1 / max(math.cos(math.radians(abs(latitude) + cell)), 1e-3))
+		nearby = range(columns) if 2 * span + 1 >= columns else [(j + dj) % columns for dj in range(-span, span + 1)]
+		candidates = numpy.array([other for di in (-1, 0, 1) for column in nearby for other in cells.get((i + di, column), ())], dtype = numpy.int64)
+		candidates = candidates[(latitudes[candidates] != latitude) | (longitudes[candidates] != longitude)]
+		distance = distances(latitude, longitude, latitudes[candidates], longitudes[candidates])
+		inside = distance <= radius
+		nearest = candidates[inside][numpy.argsort(distance[inside], kind = 'stable')][:count]
+		neighbours[row, :len(nearest)] = nearest
+	return neighbours
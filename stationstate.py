@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import numpy
+from weather import derivedMetrics
+
+# Flight categories as stored in the flightCategory column, 0 for a station without a known category
+CATEGORIES = ["", "VFR", "MVFR", "IFR", "LIFR"]
+CATEGORY_CODES = { name : code for code, name in enumerate(CATEGORIES) }
+
+# Station state with one row per LED, in the order of the airports file and with NULL slots included.
+# The data of every station is kept in typed columns instead of a dictionary per station, so the
+# parse, compute and frame stages work on whole columns by LED position without any string lookups.
+STATE_DTYPE = numpy.dtype([
+	("reported", numpy.bool_),			# False for NULL slots and stations without a report
+	("observed", numpy.float64),		# Observation time in seconds since the epoch, 0 if unknown
+	("flightCategory", numpy.uint8),	# Index into CATEGORIES
+	("windSpeed", numpy.int16),			# Knots
+	("windGust", numpy.int16),			# Knots, -1 without gusts
+	("lightning", numpy.bool_),
+	("tempC", numpy.float32),
+	("dewpointC", numpy.float32),
+	("RH", numpy.float32),				# Percent
+	("heatIndex", numpy.float32),		# Degrees F
+	("tempWet", numpy.float32),			# Degrees C
+	("WBGT", numpy.float32),			# Degrees C
+	("missing", numpy.bool_),			# Station on the map without a report of its own, reported as well if a neighbour stands in
+])
+
+# Empty state for count LEDs, nothing reported
+def newState(count):
+	state = numpy.zeros(count, dtype = STATE_DTYPE)
+	state["windGust"] = -1
+	return state
+
+# LED positions of every station in the airports list, a station can be on more than one LED
+def stationPositions(airports):
+	positions = {}
+	for position, airportcode in enumerate(airports):
+		if airportcode != "NULL" and airportcode != "":
+			positions.setdefault(airportcode, []).append(position)
+	return positions
+
+# Stand in for every station on the map that has no report with its nearest reporting neighbour.
+# neighbours has the candidate rows of every row, nearest first (see stations.nearestNeighbours), or is None
+# to only mark the missing stations. Filled rows are a copy of the neighbour's row without its observation
+# time, so they never count as fresh data of their own, and only stations with a report stand in.
+def fillMissing(state, airports, neighbours = None):
+	missing = numpy.array([airportcode != "NULL" and airportcode != "" for airportcode in airports], dtype = numpy.bool_) & ~state["reported"]
+	state["missing"] = missing
+	rows = numpy.flatnonzero(missing)
+	if neighbours is None or len(rows) == 0:
+		return
+	candidates = neighbours[rows]
+	usable = (candidates >= 0) & state["reported"][candidates]
+	found = usable.any(axis = 1)
+	sources = candidates[numpy.arange(len(rows)), usable.argmax(axis = 1)][found]
+	rows = rows[found]
+	state[rows] = state[sources]
+	state["observed"][rows] = 0
+	state["missing"][rows] = True
+
+# Fill the RH, heatIndex, tempWet and WBGT columns of all reported rows in one vectorized pass
+def computeMetrics(state):
+	rows = numpy.flatnonzero(state["reported"])
+	# Temperatures are reported in tenths of a degree, round away the float32 error before calculating
+	tempC = numpy.round(state["tempC"][rows].astype(numpy.float64), 1)
+	dewpointC = numpy.round(state["dewpointC"][rows].astype(numpy.float64), 1)
+	for key, values in derivedMetrics(tempC, dewpointC).items():
+		state[key][rows] = values
+
+# Age in seconds of the observation of every station with a known observation time
+def dataAges(state, airports, now):
+	observed = state["observed"]
+	return [(airportcode, float(now - observed[rows[0]])) for airportcode, rows in stationPositions(airports).items() if observed[rows[0]] > 0]
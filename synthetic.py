@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Synthetic aviationweather.gov METAR responses for benchmarks and for running the map offline.
+# Run with: python3 synthetic.py COUNT [SEED] > metars.xml
+
+import random
+import sys
+import time
+from rawmetar import flightCategory
+
+COVERS = ["FEW", "SCT", "BKN", "OVC"]
+WEATHER = ["-RA", "RA", "+RA", "BR", "FG", "HZ", "-SN", "SN", "VCSH", "-DZ"]
+THUNDER = ["TS", "VCTS", "-TSRA", "+TSRA"]
+
+# Station identifiers KAAA, KAAB, ... and further prefixes after the first 17,576
+def stationIds(count):
+	ids = []
+	for i in range(count):
+		letters = ""
+		for n in range(3):
+			letters = chr(ord('A') + i % 26) + letters
+			i //= 26
+		ids.append("KCPE"[i % 4] + letters)
+	return ids
+
+# Visibility in statute miles as it is written in the report
+def visibilityText(visibility):
+	if visibility >= 10:
+		return "10SM"
+	if visibility < 1:
+		return str(int(visibility * 4)) + "/4SM"
+	return str(int(visibility)) + "SM"
+
+def metarTemp(tempC):
+	return ("M%02d" if tempC < 0 else "%02d") % abs(round(tempC))
+
+# One <METAR> element with a consistent raw report, with missing fields, gusts, thunderstorms,
+# lightning remarks and hot and humid or extreme temperatures mixed in at realistic rates
+def syntheticMetar(stationId, observed, rng):
+	kind = rng.random()
+	if kind < 0.1:
+		# Hot and humid, above the 70F and the 115F limits of the heat index
+		tempC = round(rng.uniform(30, 50), 1)
+		dewpointC = round(tempC - rng.uniform(0, 8), 1)
+	elif kind < 0.15:
+		# Extreme cold
+		tempC = round(rng.uniform(-50, -25), 1)
+		dewpointC = round(tempC - rng.uniform(0, 5), 1)
+	else:
+		tempC = round(rng.uniform(-15, 35), 1)
+		dewpointC = round(tempC - rng.uniform(0, 20), 1)
+	windDir = rng.randrange(0, 360, 10)
+	windSpeed = int(rng.expovariate(1 / 10))
+	windGust = windSpeed + rng.randint(8, 25) if rng.random() < 0.15 else None
+	visibility = rng.choice([10] * 12 + [6, 5, 4, 3, 2, 1.5, 0.75, 0.25])
+	layers = [(rng.choice(COVERS), rng.choice([2, 5, 8, 12, 18, 25, 35, 45, 50, 60, 80, 100, 120, 150, 200, 250])) for n in range(rng.choice([0, 1, 1, 2, 2, 3]))]
+	layers.sort(key = lambda layer: layer[1])
+	ceiling = min([base * 100 for cover, base in layers if cover in ("BKN", "OVC")], default = None)
+	weather = []
+	if visibility < 6:
+		weather.append(rng.choice(WEATHER))
+	thunder = rng.random() < 0.05
+	if thunder:
+		weather.insert(0, rng.choice(THUNDER))
+	remarks = "AO2"
+	if thunder or rng.random() < 0.03:
+		remarks += rng.choice([" LTG DSNT NW", " FRQ LTGICCG OHD", " OCNL LTGCG VC"])
+
+	wind = "%03d%02d" % (windDir, windSpeed) + ("G%02d" % windGust if windGust is not None else "") + "KT"
+	sky = " ".join("%s%03d" % layer for layer in layers) or "CLR"
+	rawText = " ".join([stationId, time.strftime("%d%H%MZ", time.gmtime(observed)), wind, visibilityText(visibility)] + weather + [sky, metarTemp(tempC) + "/" + metarTemp(dewpointC), "A%04d" % rng.randint(2950, 3050), "RMK", remarks])
+
+	fields = [
+		("raw_text", rawText),
+		("station_id", stationId),
+		("observation_time", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(observed))),
+		("latitude", "%.4f" % rng.uniform(25, 49)),
+		("longitude", "%.4f" % rng.uniform(-124, -67)),
+		("temp_c", str(tempC)),
+		("dewpoint_c", str(dewpointC)),
+		("wind_dir_degrees", str(windDir)),
+		("wind_speed_kt", str(windSpeed)),
+		("wind_gust_kt", str(windGust) if windGust is not None else None),
+		("visibility_statute_mi", "%g" % visibility),
+		("altim_in_hg", "%.2f" % rng.uniform(29.5, 30.5)),
+		("flight_category", flightCategory(visibility, ceiling)),
+		("metar_type", "METAR"),
+		("elevation_m", str(rng.randint(0, 3000))),
+	]
+	# Some reports miss fields altogether, e.g. stations without a dewpoint sensor or a flight category
+	missing = rng.random()
+	elements = []
+	for tag, value in fields:
+		if value is None or (missing < 0.05 and tag in ("temp_c", "dewpoint_c")) or (0.05 <= missing < 0.08 and tag == "flight_category") or (0.08 <= missing < 0.1 and tag.startswith("wind")):
+			continue
+		elements.append("<" + tag + ">" + value + "</" + tag + ">")
+		if tag == "visibility_statute_mi":
+			elements.extend('<sky_condition sky_cover="%s" cloud_base_ft_agl="%d" />' % (cover, base * 100) for cover, base in layers)
+	return "<METAR>" + "".join(elements) + "</METAR>"
+
+# A complete response for count stations, the same for the same seed and observation time
+def syntheticResponse(count, seed = 1, observed = None):
+	rng = random.Random(seed)
+	observed = int(time.time()) // 3600 * 3600 - 420 if observed is None else observed
+	stations = stationIds(count)
+	metars = [syntheticMetar(stationId, observed - rng.randint(0, 3000), rng) for stationId in stations]
+	content = '<?xml version="1.0" encoding="UTF-8"?>\n<response version="1.2"><request_index>1</request_index><data_source name="metars" /><request type="retrieve" /><errors /><warnings /><time_taken_ms>12</time_taken_ms><data num_results="' + str(count) + '">' + "".join(metars) + "</data></response>"
+	return stations, content.encode()
+
+if __name__ == "__main__":
+	stations, content = syntheticResponse(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+	sys.stdout.buffer.write(content)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import bisect
+import calendar
+import functools
+import re
+import time
+from metarparse import isoTime, parseRecords
+from rawmetar import decodeMetar, flightCategory
+from stationstate import CATEGORY_CODES
+
+# Fields read from each <TAF> element of the aviationweather.gov TAF feed
+TAF_FIELDS = {
+	'station_id'	: ('stationId', str),
+	'raw_text'		: ('rawText', str),
+	'issue_time'	: ('issueTime', isoTime),
+}
+
+ISSUED = re.compile(r"^(\d{2})(\d{2})(\d{2})Z$")
+PERIOD = re.compile(r"^(\d{2})(\d{2})/(\d{2})(\d{2})$")
+FROM = re.compile(r"^FM(\d{2})(\d{2})(\d{2})$")
+PROBABILITY = re.compile(r"^PROB(\d{2})$")
+CLEAR_SKY = ("SKC", "CLR", "NSC", "NCD", "CAVOK")
+
+# Records of the TAFs in the responses of the TAF feed, one response per chunk of stations
+def parseTafs(contents):
+	for content in contents:
+		yield from parseRecords(content, 'TAF', TAF_FIELDS)
+
+# Start of a day of the month in the month before, the month of and the month after year and month, if it has that day
+@functools.lru_cache(maxsize = 256)
+def dayStarts(year, month, day):
+	starts = []
+	for offset in (-1, 0, 1):
+		candidateYear, candidateMonth = year + (month - 1 + offset) // 12, (month - 1 + offset) % 12 + 1
+		if day <= calendar.monthrange(candidateYear, candidateMonth)[1]:
+			starts.append(calendar.timegm((candidateYear, candidateMonth, day, 0, 0, 0)))
+	return starts
+
+# Seconds since the epoch of a day of the month and a time like the ones in a TAF, in the month of the
+# reference time or the one before or after it, whichever is closest. Hour 24 is midnight at the end of the day.
+def resolveTime(day, hour, minute, reference):
+	year, month = time.gmtime(reference)[:2]
+	offset = hour * 3600 + minute * 60
+	return min((start + offset for start in dayStarts(year, month, day)), key = lambda candidate: abs(candidate - reference))
+
+# Elements a group of a TAF forecasts, None for the ones it leaves as they are
+def groupConditions(tokens):
+	decoded = decodeMetar(" ".join(tokens))
+	conditions = { "visibility" : decoded["visibility"], "windSpeed" : decoded["windSpeed"], "windGust" : decoded["windGust"], "sky" : False, "ceiling" : None, "lightning" : None }
+	if decoded["layers"] or any(token in CLEAR_SKY for token in tokens):
+		conditions["sky"] = True
+		conditions["ceiling"] = decoded["ceiling"]
+	if decoded["weather"] or "NSW" in tokens:
+		conditions["lightning"] = decoded["lightning"]
+	return conditions
+
+# Decode a raw TAF into its validity and groups, None if it has no header.
+# Every group is (kind, start, end, conditions), kind is BASE for the forecast at the start of the validity, FM, BECMG,
+# TEMPO or PROB. Times are seconds since the epoch, the month and year come from reference, e.g. the issue time.
+def decodeTaf(rawText, reference):
+	tokens = rawText.split()
+	while tokens and tokens[0] in ("TAF", "AMD", "COR"):
+		del tokens[0]
+	if len(tokens) < 3 or ISSUED.match(tokens[1]) is None or PERIOD.match(tokens[2]) is None:
+		return None
+	stationId = tokens[0]
+	day, hour, minute = map(int, ISSUED.match(tokens[1]).groups())
+	issued = resolveTime(day, hour, minute, reference)
+	startDay, startHour, endDay, endHour = map(int, PERIOD.match(tokens[2]).groups())
+	validFrom = resolveTime(startDay, startHour, 0, issued)
+	validTo = resolveTime(endDay, endHour, 0, issued)
+
+	# Split the body into groups at FM, BECMG, TEMPO and PROB, the remarks are not part of the forecast
+	groups = []
+	kind, start, end, body = "BASE", validFrom, validTo, []
+	index = 3
+	while index < len(tokens):
+		token = tokens[index]
+		index += 1
+		if token == "RMK":
+			break
+		fromMatch = FROM.match(token)
+		probability = PROBABILITY.match(token)
+		if fromMatch is None and probability is None and token not in ("BECMG", "TEMPO"):
+			body.append(token)
+			continue
+		groups.append((kind, start, end, groupConditions(body)))
+		body = []
+		if fromMatch is not None:
+			kind, start, end = "FM", resolveTime(*map(int, fromMatch.groups()), issued), validTo
+			continue
+		kind = "PROB" if probability is not None else token
+		if probability is not None and index < len(tokens) and tokens[index] == "TEMPO":
+			index += 1
+		period = PERIOD.match(tokens[index]) if index < len(tokens) else None
+		if period is None:
+			kind = None				# Group without a period, its conditions are ignored
+			continue
+		index += 1
+		startDay, startHour, endDay, endHour = map(int, period.groups())
+		start, end = resolveTime(startDay, startHour, 0, issued), resolveTime(endDay, endHour, 0, issued)
+	groups.append((kind, start, end, groupConditions(body)))
+	return { "stationId" : stationId, "issued" : issued, "validFrom" : validFrom, "validTo" : validTo, "groups" : [group for group in groups if group[0] is not None] }
+
+# Prevailing conditions after a group that changes some of them
+def applyChange(conditions, change):
+	conditions = dict(conditions)
+	if change["windSpeed"] is not None:
+		conditions["windSpeed"] = change["windSpeed"]
+		conditions["windGust"] = change["windGust"]
+	if change["visibility"] is not None:
+		conditions["visibility"] = change["visibility"]
+	if change["sky"]:
+		conditions["ceiling"] = change["ceiling"]
+	if change["lightning"] is not None:
+		conditions["lightning"] = change["lightning"]
+	return conditions
+
+# Flight category code, wind, gust (-1 without) and lightning of forecast conditions, the category from the visibility or the ceiling alone if only one is forecast
+def summarize(conditions):
+	category = flightCategory(conditions["visibility"], conditions["ceiling"])
+	return (CATEGORY_CODES.get(category, 0), conditions["windSpeed"] or 0, -1 if conditions["windGust"] is None else conditions["windGust"], bool(conditions["lightning"]))
+
+# The worse of two summaries: the higher flight category, the stronger wind and gust and lightning in either
+def worst(first, second):
+	if first is None:
+		return second
+	return (max(first[0], second[0]), max(first[1], second[1]), max(first[2], second[2]), first[3] or second[3])
+
+# Forecast of every hour that starts at one of hourStarts, as (flight category code, wind, gust, lightning), None for
+# hours outside the validity. An hour gets the worst conditions forecast at any time during it: FM replaces all
+# conditions from its time on, BECMG the ones it names from the start of its period. TEMPO and PROB groups are
+# temporary and only count with temporary, as the prevailing conditions changed by their group.
+def forecastHours(taf, hourStarts, temporary = True):
+	empty = { "visibility" : None, "windSpeed" : None, "windGust" : None, "ceiling" : None, "lightning" : False }
+	changes = []					# (time, prevailing conditions from then on), in time order
+	for kind, start, end, change in taf["groups"]:
+		if kind in ("BASE", "FM"):
+			changes.append((start, applyChange(empty, change)))
+		elif kind == "BECMG" and changes:
+			changes.append((start, applyChange(changes[-1][1], change)))
+	changes.sort(key = lambda change: change[0])
+	temporaryGroups = [(start, end, change) for kind, start, end, change in taf["groups"] if kind in ("TEMPO", "PROB")] if temporary else []
+
+	# Every set of prevailing conditions, alone and changed by a temporary group, is only summarized once
+	times = [changeTime for changeTime, conditions in changes]
+	summaries = [summarize(conditions) for changeTime, conditions in changes]
+	temporarySummaries = {}
+	hours = []
+	for hourStart in hourStarts:
+		hourEnd = hourStart + 3600
+		if hourEnd <= taf["validFrom"] or hourStart >= taf["validTo"] or not changes:
+			hours.append(None)
+			continue
+		# Prevailing conditions at the start of the hour and every change during it
+		first = max(bisect.bisect_right(times, max(hourStart, taf["validFrom"])) - 1, 0)
+		last = bisect.bisect_left(times, hourEnd)
+		overlapping = [index for index, (start, end, change) in enumerate(temporaryGroups) if start < hourEnd and end > hourStart]
+		summary = None
+		for index in range(first, last):
+			summary = worst(summary, summaries[index])
+			for group in overlapping:
+				if (index, group) not in temporarySummaries:
+					temporarySummaries[index, group] = summarize(applyChange(changes[index][1], temporaryGroups[group][2]))
+				summary = worst(summary, temporarySummaries[index, group])
+		hours.append(summary)
+	return hours
@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 
-import urllib.request
-import xml.etree.ElementTree as ET
-import board
-import neopixel
+import os
 import time
-import numpy
+from fetch import ChunkedFetcher
+from metarparse import parseResponses
+from refresher import Refresher
+from power import PowerSchedule, PowerUsage
+from frames import compileFrames, frameBytes, FrameWriter, isAnimated
+from animation import compileAnimation, stationOffsets, FrameClock
+from metrics import Metrics
+from hardware import createStrip
+from stationstate import newState, stationPositions, computeMetrics, dataAges, fillMissing
+from stations import StationTable
+from colorrules import loadColorRules
+
+# Folder with the airports file, /home/pi/METARMap on the Raspberry Pi
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # NeoPixel LED Configuration
 LED_COUNT			= 150				# Number of LED pixels.
-LED_PIN				= board.D18			# GPIO pin connected to the pixels (18 is PCM).
+LED_PIN				= "D18"				# GPIO pin connected to the pixels (18 is PCM).
 LED_BRIGHTNESS		= 0.2				# Float from 0.0 (min) to 1.0 (max)
-LED_ORDER			= neopixel.GRB		# Strip type and colour ordering
+LED_ORDER			= "GRB"				# Strip type and colour ordering
+LED_BACKEND			= os.environ.get("METARMAP_BACKEND", "neopixel")	# "neopixel" for the strip, "memory" or "terminal" to run without a Raspberry Pi
 
 # COLOR_NEG		= (38,157,176)		# Magenta
 # COLOR_0			= (57,102,183)		# Violet
@@ -42,6 +53,8 @@ COLOR_90		= (51,255,0)		# Dark Orange
 COLOR_100		= (0,255,0)			# Red 
 COLOR_HOT		= (255,255,255)		# White
 COLOR_CLEAR 	= (0,0,0)			# Clear
+COLOR_STALE		= (0,0,0)			# Stations without a report and no station nearby to stand in, e.g. (10,10,10) for a dim white
+COLOR_RULES_FILE	= os.path.join(BASE_DIR, 'colors.json')	# Other colors for the temp mode, see colors.example.json
 
 # Wet Bulb Threshold
 WET_BULB_THRESHOLD = 27.8			# Float in degrees C
@@ -52,121 +65,206 @@ HEAT_INDEX_THRESHOLD = 100			# Float in degrees F
 # Blinking Speed in seconds
 BLINK_SPEED		= 1.0				# Float in seconds, e.g. 0.5 for half a second
 
-# Function to convert degrees fahrenheit to celsius
-def FtoC(temp):
-	return ((temp - 32) * (5/9))
-
-# Function to convert degrees celsius to fahrenheit
-def CtoF(temp):
-	return ((temp * (9/5)) + 32)
-
-# Initialize the LED strip
-pixels = neopixel.NeoPixel(LED_PIN, LED_COUNT, brightness = LED_BRIGHTNESS, pixel_order = LED_ORDER, auto_write = False)
-
-# Read the airports file to retrieve list of airports and use as order for LEDs
-with open("/home/pi/METARMap/airports") as f:
-	airports = f.readlines()
-airports = [x.strip() for x in airports]
-
-# Retrieve METAR from aviationweather.gov data server
-# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
-url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString=" + ",".join([item for item in airports if item != "NULL"])
-print(url)
-
-content = urllib.request.urlopen(url).read()
-
-# Retrieve flying conditions from the service response and store in a dictionary for each airport
-root = ET.fromstring(content)
-conditionDict = { "": {"tempC" : 0, "dewpointC" : 0,} }
-for metar in root.iter('METAR'):
-	stationId = metar.find('station_id').text
-	tempC = 0
-	dewpointC = 0
-	if metar.find('temp_c') is not None:
-		tempC = float(metar.find('temp_c').text)
-	if metar.find('dewpoint_c') is not None:
-		dewpointC = float(metar.find('dewpoint_c').text)
-
-	# Calculate weather values
-	e = 6.11 * 10**((7.5 * dewpointC)/(237.3 + dewpointC))
-	e_s = 6.11 * 10**((7.5 * tempC)/(237.3 + tempC))
-	rh  = e/e_s * 100
-
-	tempF = CtoF(tempC) 
-	# hi = -42.379 + 2.04901523*tempF + 10.14333127*rh - .22475541*tempF*rh - .00683783*tempF*tempF - .05481717*rh*rh + .00122874*tempF*tempF*rh + .00085282*tempF*rh*rh - .00000199*tempF*tempF*rh*rh
-	if tempF < 70:
-		hi = -1
-	elif tempF > 115:
-		hi = 1000
-	else:
-		hi = 16.923 + 0.185212*tempF + 5.37941*rh - 0.100254*tempF*rh + 0.00941695*(tempF**2) + 0.00728898*(rh**2) + 0.000345372*(tempF**2)*rh - 0.000814971*tempF*(rh**2) + 0.0000102102*(tempF**2)*(rh**2) - 0.000038646*(tempF**3) + 0.0000291583*(rh**3) + 0.00000142721*(tempF**3)*rh + 0.000000197483*tempF*(rh**3) - 0.0000000218429*(tempF**3)*(rh**2) + 0.000000000843296*(tempF**2)*(rh**3) - 0.0000000000481975*(tempF**3)*(rh**3)
-	t_w = tempC * numpy.arctan(0.151977 * (rh + 8.313659)**(1/2)) + numpy.arctan(tempC + rh) - numpy.arctan(rh - 1.676331) + 0.00391838 *(rh)**(3/2) * numpy.arctan(0.023101 * rh) - 4.686035
-	WBGT = 0.7 * t_w + 0.3 * tempC
-
-	# Round floats
-	t_w = round(t_w * 10) / 10
-	rh = round(rh * 10) / 10
-	hi = round(hi*10) / 10
-	WBGT = round(WBGT * 10) / 10
-
-	print(stationId + "; T_c:" + str(tempC) + "; D_c:" + str(dewpointC) + "; RH:" + str(rh) +"; HI:" + str(hi) + "; T_w:" + str(t_w) + "; WBGT:" + str(WBGT))
-	conditionDict[stationId] = { "tempC" : tempC, "dewpointC" : dewpointC, "RH" : rh, "heatIndex" : hi, "tempWet" : t_w, "WBGT" : WBGT }
-
-# Setting LED colors based on weather conditions
-flashCycle = False
-while True:
-	i = 0
-	for airportcode in airports:
-		# Skip NULL entries
-		if airportcode == "NULL":
-			i += 1
+# Smooth animation, fading at FRAME_RATE instead of switching colors every BLINK_SPEED seconds
+SMOOTH_ANIMATION		= True			# Set to False for the two step blinking/fading
+FRAME_RATE				= 30			# Frames per second of the smooth animation, one fade cycle takes two BLINK_SPEED
+ANIMATION_GAMMA			= 2.2			# Gamma correction so fades look even to the eye
+ANIMATION_PHASE_OFFSETS	= True			# Give every airport its own phase so windy airports don't pulse in lockstep
+ANIMATION_CPU_BUDGET	= 0.25			# Share of one CPU the render loop may use before it draws fewer frames
+
+# Data refresh interval in seconds, the map keeps running and fetches new METARs in the background
+REFRESH_INTERVAL	= 300			# Float in seconds, e.g. 300 for five minutes
+FETCH_TIMEOUT		= 30			# Seconds before giving up on a single request to aviationweather.gov
+CACHE_FILE			= os.path.join(BASE_DIR, 'metar.xml.gz')	# Last good response (one file per chunk), used right away after a restart or during an outage
+FETCH_CHUNK_SIZE	= 300			# Stations per request, longer station lists are split into several requests
+FETCH_WORKERS		= 16			# Requests that run at the same time, never more than there are chunks
+
+# Power schedule, outside these windows of local time the LED is dark, no data is fetched and the script sleeps until the next window
+POWER_WINDOWS		= []			# (on, off) times, e.g. [("07:00", "22:00")] or [("06:30", "09:00"), ("17:00", "23:30")], [] to stay on around the clock
+
+# Metrics of every stage for monitoring, with the same names in map.py, metar.py and temp.py
+METRICS_FILE		= None			# Prometheus text file, e.g. '/dev/shm/metarmap.prom' on a tmpfs, for the node_exporter textfile collector (None to disable)
+METRICS_PORT		= None			# Port of a local HTTP endpoint with the same metrics, e.g. 9101 (None to disable)
+METRICS_INTERVAL	= 60			# Seconds between writes of METRICS_FILE
+
+# Stations without a report, e.g. when their METAR is stale, are filled in from the nearest station on the map that has one
+STATION_FILE		= os.path.join(BASE_DIR, 'stations.json')		# Station coordinates, learned from the METAR responses and the station information
+STATION_INFO_FILE	= os.path.join(BASE_DIR, 'stationinfo.xml.gz')	# Last good station information response, like CACHE_FILE
+STATION_INFO_INTERVAL	= 86400		# Seconds between requests for the coordinates of stations that have not reported yet
+FALLBACK_RADIUS		= 50			# Nautical miles a station may be away to stand in, 0 to leave stations without a report dark
+FALLBACK_NEIGHBOURS	= 3				# Nearest stations that may stand in, nearest first
+
+# Timings and counters of every stage, exported by the main block
+metrics = Metrics()
+
+# Retrieve the temperatures from the service response and store them in the rows of the airports' LEDs
+# The coordinates of the stations are added to the station table, if there is one
+def parseConditions(contents, airports, stations = None):
+	state = newState(len(airports))
+	positions = stationPositions(airports)
+	for metar in parseResponses(contents):
+		rows = positions.get(metar['stationId'])
+		if rows is None:
 			continue
+		if stations is not None:
+			stations.add(metar['stationId'], metar['latitude'], metar['longitude'])
+		observed = 0
+		tempC = 0
+		dewpointC = 0
+		if metar['observationTime'] is not None:
+			observed = metar['observationTime']
+		if metar['tempC'] is not None:
+			tempC = metar['tempC']
+		if metar['dewpointC'] is not None:
+			dewpointC = metar['dewpointC']
+
+		state["reported"][rows] = True
+		state["observed"][rows] = observed
+		state["tempC"][rows] = tempC
+		state["dewpointC"][rows] = dewpointC
+	return state
+
+# Print the temperatures and weather values of every station with a report, stations filled in from a neighbour are marked with a *
+def printConditions(state, airports):
+	for stationId, rows in stationPositions(airports).items():
+		row = state[rows[0]]
+		if row["reported"]:
+			print(stationId + ("*" if row["missing"] else "") + "; T_c:%.1f; D_c:%.1f; RH:%.1f; HI:%.1f; T_w:%.1f; WBGT:%.1f" % (row["tempC"], row["dewpointC"], row["RH"], row["heatIndex"], row["tempWet"], row["WBGT"]))
+
+# Color rules of the temperatures (see colorrules.py), bands of 10 degrees F that are converted to degrees C once,
+# flashing white on the second phase when the heat index is high
+TEMP_RULES = {
+	"colors" : { "column" : "tempC", "fahrenheit" : True, "limits" : [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100], "colors" : [COLOR_NEG, COLOR_0, COLOR_10, COLOR_20, COLOR_30, COLOR_40, COLOR_50, COLOR_60, COLOR_70, COLOR_80, COLOR_90, COLOR_100] },
+	"flash" : [{ "phase" : 1, "all" : [{ "column" : "heatIndex", "above" : HEAT_INDEX_THRESHOLD }], "colors" : COLOR_HOT }],
+}
+
+# Colors of all stations, the temp mode of COLOR_RULES_FILE replaces the rules above
+tempColor = loadColorRules(COLOR_RULES_FILE, { 'temp' : TEMP_RULES })['temp']
+
+# Compile the frames of a mode into one animation cycle, ANIMATION_STEPS frames long
+ANIMATION_STEPS = int(round(FRAME_RATE * 2 * BLINK_SPEED)) if SMOOTH_ANIMATION else 2
+def animate(frames, airports):
+	return compileAnimation(frames, ANIMATION_STEPS, ANIMATION_GAMMA, stationOffsets(airports, ANIMATION_STEPS) if ANIMATION_PHASE_OFFSETS else None)
 
-		color = COLOR_CLEAR
-		conditions = conditionDict.get(airportcode, None)
-
-		flash = True if flashCycle else False
-		if conditions != None:
-			# if ((tempC == 0) & (dewpointC == 0)):
-			# 	color = COLOR_CLEAR
-			# 	print("Error: temperature and/or dewpoint values unavailable.")
-			if (flash and (conditions["heatIndex"] > HEAT_INDEX_THRESHOLD)):
-				color = COLOR_HOT
-			elif conditions["tempC"] < FtoC(0):
-				color = COLOR_NEG
-			elif conditions["tempC"] < FtoC(10):
-				color = COLOR_0
-			elif conditions["tempC"] < FtoC(20):
-				color = COLOR_10
-			elif conditions["tempC"] < FtoC(30):
-				color = COLOR_20
-			elif conditions["tempC"] < FtoC(40):
-				color = COLOR_30
-			elif conditions["tempC"] < FtoC(50):
-				color = COLOR_40
-			elif conditions["tempC"] < FtoC(60):
-				color = COLOR_50
-			elif conditions["tempC"] < FtoC(70):
-				color = COLOR_60
-			elif conditions["tempC"] < FtoC(80):
-				color = COLOR_70
-			elif conditions["tempC"] < FtoC(90):
-				color = COLOR_80
-			elif conditions["tempC"] < FtoC(100):
-				color = COLOR_90
-			elif conditions["tempC"] >= FtoC(100):
-				color = COLOR_100
+# Parse a response and compile its frames and animation, all on the refresh thread
+# With a station table, stations without a report are filled in from their neighbours
+def loadData(contents, airports, stations = None):
+	airports = airports[:LED_COUNT]
+	with metrics.stage("parse"):
+		state = parseConditions(contents, airports, stations)
+		fillMissing(state, airports, stations.neighbours(airports, FALLBACK_RADIUS, FALLBACK_NEIGHBOURS) if stations is not None and FALLBACK_RADIUS > 0 else None)
+	if stations is not None:
+		stations.save()
+	# Calculate weather values for all stations in one vectorized pass
+	with metrics.stage("compute"):
+		computeMetrics(state)
+	printConditions(state, airports)
+	with metrics.stage("frames"):
+		frames = compileFrames(state, tempColor, COLOR_STALE)
+		animation = frameBytes(animate(frames, airports))
+	return { "state" : state, "frames" : frames, "animation" : animation }
+
+# Everything below only runs when the script is started, not when it is imported e.g. by benchmark.py
+if __name__ == "__main__":
+	# Initialize the LED strip
+	pixels = createStrip(LED_BACKEND, LED_PIN, LED_COUNT, LED_ORDER)
+
+	# Read the airports file to retrieve list of airports and use as order for LEDs
+	with open(os.path.join(BASE_DIR, "airports")) as f:
+		airports = f.readlines()
+	airports = [x.strip() for x in airports]
+
+	# Retrieve METAR from aviationweather.gov data server
+	# Details about parameters can be found here: https://www.aviationweather.gov/dataserver/example?datatype=metar
+	url = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&hoursBeforeNow=5&mostRecentForEachStation=true&stationString="
+	stations = [item for item in airports if item != "NULL"]
+	print(url + ",".join(stations))
+
+	# Station coordinates for the stations without a report
+	# Stations that have not reported since the table was started are looked up in the station information of the same data server
+	stationTable = StationTable(STATION_FILE)
+	stationUrl = "https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=stations&requestType=retrieve&format=xml&stationString="
+	stationFetcher = ChunkedFetcher(stationUrl, stations, STATION_INFO_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	stationTable.addStations(stationFetcher.contents)
+
+	# Fetching and parsing runs on a background thread every REFRESH_INTERVAL seconds while the LEDs keep animating
+	# Only download and parse again when the feed has changed since the last request
+	def fetchData():
+		with metrics.stage("fetch"):
+			contents = fetcher.fetch()
+		metrics.count("metarmap_fetch_bytes_total", fetcher.bytesDownloaded)
+		metrics.count("metarmap_fetch_chunk_failures_total", fetcher.failed)
+		placed = stationTable.lookup(stationFetcher, stations, STATION_INFO_INTERVAL)
+		if not fetcher.modified and not placed and refresher.data is not None:
+			return refresher.data
+		return loadData(contents, airports, stationTable)
+
+	# Start from the cached response of the last run, if there is one, while the first fetch is running
+	fetcher = ChunkedFetcher(url, stations, CACHE_FILE, FETCH_CHUNK_SIZE, FETCH_WORKERS, FETCH_TIMEOUT)
+	refresher = Refresher(fetchData, REFRESH_INTERVAL, initial = loadData(fetcher.contents, airports, stationTable) if fetcher.contents else None).start()
+	refresher.updated.wait()
+
+	# Setting LED colors based on weather conditions
+	writer = FrameWriter(pixels, metrics, LED_BRIGHTNESS)
+	clock = FrameClock(FRAME_RATE if SMOOTH_ANIMATION else 1 / BLINK_SPEED, ANIMATION_CPU_BUDGET, metrics)
+
+	# Export the stage timings together with the frame counts and the age of every station's data
+	def stationAges():
+		if refresher.data is None:
+			return []
+		return [('station="' + stationId + '"', round(age, 1)) for stationId, age in dataAges(refresher.data["state"], airports[:LED_COUNT], time.time())]
+	metrics.collect("metarmap_frames_shown_total", "counter", lambda: [("", writer.shown)])
+	metrics.collect("metarmap_frames_skipped_total", "counter", lambda: [("", writer.skipped)])
+	metrics.collect("metarmap_station_data_age_seconds", "gauge", stationAges)
+
+	# On and off hours, the time, CPU time and wakeups of both are counted to check the savings of the off hours
+	power = PowerSchedule(POWER_WINDOWS)
+	usage = PowerUsage(power.isOn())
+	metrics.collect("metarmap_power_seconds_total", "counter", lambda: usage.values(0))
+	metrics.collect("metarmap_cpu_seconds_total", "counter", lambda: usage.values(1))
+	metrics.collect("metarmap_wakeups_total", "counter", lambda: usage.values(2))
+	metrics.start(METRICS_FILE, METRICS_PORT, METRICS_INTERVAL, refresher.active)
+	lit = None							# Whether the map is on, None until the first pass of the loop
+	while True:
+		# Count the skipped writes of the previous data, the animation is swapped as a whole by the refresher
+		if refresher.updated.is_set():
+			refresher.updated.clear()
+			animation = refresher.data["animation"]
+			animated = isAnimated(animation)
+			print(writer.stats())
+			print(clock.report())
+
+		# Outside the power windows blank the strip once, stop fetching and sleep until the next window.
+		# The refresher keeps its data and the fetcher its cache, the first refresh afterwards is a conditional request.
+		on = power.isOn()
+		if on != lit:
+			lit = on
+			usage.switch(on)
+			print(("Lights on. " if on else "Lights off. ") + usage.report())
+			if on:
+				refresher.resume()
+				clock.reset()
 			else:
-				color = COLOR_CLEAR
-		pixels[i] = color
-		i += 1
+				refresher.pause()
+				writer.write(bytes(len(animation[0])))
+		if not on:
+			time.sleep(power.nextChange())
+			usage.wakeup()
+			continue
 
-	# Update actual LEDs all at once
-	pixels.show()
+		# Send the precompiled frame for this point of the animation cycle, unchanged frames are not sent again
+		clock.frameStarted()
+		writer.write(animation[clock.tick % len(animation)])
+		clock.frameDone()
 
-	# Switching between animation cycles
-	time.sleep(BLINK_SPEED)
-	flashCycle = False if flashCycle else True
+		# Wait for the next frame on the fixed timeline, without any animated station sleep until new data arrives
+		# or the end of the power window
+		if animated:
+			clock.wait()
+		else:
+			refresher.updated.wait(power.nextChange())
+			clock.reset()
+		usage.wakeup()
 
-print()
-print("Done")
+	print()
+	print("Done")
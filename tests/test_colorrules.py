@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import itertools
+import json
+import os
+import tempfile
+import unittest
+import numpy
+import map
+import metar
+import temp
+from colorrules import loadColorRules
+from stationstate import newState
+from weather import FtoC
+
+EXAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "colors.example.json")
+WHITE = [255,255,255]
+
+# Mode definitions that are not valid, with a part of the message they are rejected with
+MALFORMED = [
+	("unknown column", { "colors" : { "column" : "visibility", "limits" : [1], "colors" : [[0,0,0], WHITE] } }, "Unknown column in color rules: visibility"),
+	("unknown key of a mode", { "colours" : WHITE }, "Unknown key colours in a mode"),
+	("unknown key of a palette", { "colors" : { "column" : "windSpeed", "limit" : [10], "colors" : [[0,0,0], WHITE] } }, "Unknown key limit in a palette"),
+	("unknown key of an overlay", { "colors" : WHITE, "flash" : [{ "phase" : 1, "when" : [], "colors" : WHITE }] }, "Unknown key when in a flash overlay"),
+	("bad operator", { "colors" : WHITE, "flash" : [{ "any" : [{ "column" : "windGust", "greater" : 25 }] }] }, "Unknown key greater in a condition"),
+	("two operators", { "colors" : WHITE, "flash" : [{ "any" : [{ "column" : "windGust", "above" : 25, "below" : 40 }] }] }, "can only have one of"),
+	("missing default color", { "colors" : { "column" : "flightCategory", "colors" : { "VFR" : WHITE } } }, "needs a default color"),
+	("unknown value", { "colors" : { "column" : "flightCategory", "colors" : { "VRF" : WHITE }, "default" : [0,0,0] } }, "Unknown value VRF"),
+	("negative value", { "colors" : { "column" : "windSpeed", "colors" : { "-1" : WHITE }, "default" : [0,0,0] } }, "cannot be negative"),
+	("without colors", { "flash" : [] }, "needs colors"),
+	("color out of range", { "colors" : [0,0,256] }, "Colors in color rules are [G,R,B]"),
+	("color with two values", { "colors" : [0,0] }, "Colors in color rules are [G,R,B]"),
+	("one color too few", { "colors" : { "column" : "windSpeed", "limits" : [10, 20], "colors" : [[0,0,0], WHITE] } }, "one color more than limits"),
+	("limits not increasing", { "colors" : { "column" : "windSpeed", "limits" : [20, 10], "colors" : [[0,0,0], WHITE, WHITE] } }, "have to be increasing"),
+	("palette without limits or values", { "colors" : { "column" : "windSpeed", "colors" : [WHITE] } }, "needs limits and a list of colors"),
+	("bad phase", { "colors" : WHITE, "flash" : [{ "phase" : 2, "colors" : [0,0,0] }] }, "0 or 1"),
+	("fahrenheit of wind", { "colors" : { "column" : "windSpeed", "fahrenheit" : True, "limits" : [10], "colors" : [[0,0,0], WHITE] } }, "can have limits in degrees F"),
+	("mode that is not a dictionary", [WHITE], "is a dictionary"),
+]
+
+# Colors of the metar mode as the scripts computed them before the rules, from the settings of module
+def metarColorBefore(module, state, flashCycle):
+	metarColors = numpy.array([module.COLOR_CLEAR, module.COLOR_VFR, module.COLOR_MVFR, module.COLOR_IFR, module.COLOR_LIFR], dtype = numpy.uint8)
+	metarFades = numpy.array([module.COLOR_CLEAR, module.COLOR_VFR_FADE, module.COLOR_MVFR_FADE, module.COLOR_IFR_FADE, module.COLOR_LIFR_FADE] if module.FADE_INSTEAD_OF_BLINK else [module.COLOR_CLEAR] * 5, dtype = numpy.uint8)
+	category = state["flightCategory"]
+	colors = metarColors[category]
+	if module.ACTIVATE_WINDCONDITION_ANIMATION and flashCycle:
+		gusts = (state["windGust"] >= 0) & (module.ALWAYS_BLINK_FOR_GUSTS | (state["windGust"] > module.WIND_BLINK_THRESHOLD))
+		windy = (state["windSpeed"] > module.WIND_BLINK_THRESHOLD) | gusts
+		colors[windy] = metarFades[category[windy]]
+	if module.ACTIVATE_LIGHTNING_ANIMATION and not flashCycle:
+		colors[state["lightning"] & (category != 0)] = module.COLOR_LIGHTNING
+	return colors
+
+# Colors of the temp mode as the scripts computed them before the rules, from the settings of module
+def tempColorBefore(module, state, flashCycle):
+	bands = [(FtoC(0), module.COLOR_NEG), (FtoC(10), module.COLOR_0), (FtoC(20), module.COLOR_10), (FtoC(30), module.COLOR_20), (FtoC(40), module.COLOR_30), (FtoC(50), module.COLOR_40), (FtoC(60), module.COLOR_50), (FtoC(70), module.COLOR_60), (FtoC(80), module.COLOR_70), (FtoC(90), module.COLOR_80), (FtoC(100), module.COLOR_90)]
+	limits = numpy.array([limit for limit, color in bands])
+	tempColors = numpy.array([color for limit, color in bands] + [module.COLOR_100], dtype = numpy.uint8)
+	colors = tempColors[numpy.searchsorted(limits, state["tempC"], side = 'right')]
+	if flashCycle:
+		colors[state["heatIndex"] > module.HEAT_INDEX_THRESHOLD] = module.COLOR_HOT
+	return colors
+
+# State with one station per combination of the given values of the columns
+def gridState(**columns):
+	combinations = list(itertools.product(*columns.values()))
+	state = newState(len(combinations))
+	for column, values in zip(columns, zip(*combinations)):
+		state[column] = values
+	return state
+
+class ColorRulesTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def rulesFile(self, content):
+		path = os.path.join(self.directory.name, "colors.json")
+		with open(path, "w") as f:
+			f.write(content if isinstance(content, str) else json.dumps(content))
+		return path
+
+	def testWithoutFileOnlyTheBuiltInModes(self):
+		modes = loadColorRules(os.path.join(self.directory.name, "colors.json"), { "white" : { "colors" : WHITE } })
+		self.assertEqual(list(modes), ["white"])
+		self.assertEqual(modes["white"](newState(2), False).tolist(), [WHITE, WHITE])
+
+	def testFileReplacesBuiltInModesAndAddsModes(self):
+		path = self.rulesFile({ "modes" : { "extra" : { "colors" : [1,2,3] }, "white" : { "colors" : [0,0,0] } } })
+		modes = loadColorRules(path, { "white" : { "colors" : WHITE }, "temp" : { "colors" : WHITE } })
+		self.assertEqual(list(modes), ["white", "temp", "extra"])
+		self.assertEqual(modes["white"](newState(1), False).tolist(), [[0,0,0]])
+
+	def testMalformedRules(self):
+		for name, definition, message in MALFORMED:
+			with self.subTest(name):
+				path = self.rulesFile({ "modes" : { "broken" : definition } })
+				with self.assertRaises(ValueError) as raised:
+					loadColorRules(path, {})
+				self.assertIn("Mode broken in " + path, str(raised.exception))
+				self.assertIn(message, str(raised.exception))
+
+	def testUnreadableFile(self):
+		for name, content in (("invalid JSON", '{ "modes" : { "wind" : '), ("without modes", { "wind" : { "colors" : WHITE } }), ("modes not a dictionary", { "modes" : [WHITE] })):
+			with self.subTest(name):
+				path = self.rulesFile(content)
+				with self.assertRaises(ValueError) as raised:
+					loadColorRules(path, {})
+				self.assertIn("Could not read the color rules in " + path, str(raised.exception))
+
+class ExampleFileTest(unittest.TestCase):
+	def setUp(self):
+		self.modes = loadColorRules(EXAMPLE_FILE, {})
+
+	def testModes(self):
+		self.assertEqual(list(self.modes), ["spread", "wind", "wbgt"])
+
+	def testSpreadInDegreesF(self):
+		# The limits of 3, 5, 10 and 20 degrees F of spread are 1.67, 2.78, 5.56 and 11.11 degrees C
+		state = gridState(tempC = [20.0], dewpointC = [19.0, 17.5, 16.0, 12.0, 5.0])
+		self.assertEqual(self.modes["spread"](state, False).tolist(), [[0,255,0], [51,255,0], [255,255,0], [255,0,0], [0,0,255]])
+
+	def testWindFlashesForGusts(self):
+		state = gridState(windSpeed = [4, 12, 35], windGust = [-1, 30])
+		bands = [[0,0,255], [0,0,255], [255,0,0], [255,0,0], [0,255,0], [0,255,0]]
+		self.assertEqual(self.modes["wind"](state, False).tolist(), bands)
+		self.assertEqual(self.modes["wind"](state, True).tolist(), [WHITE if gust == 30 else color for color, gust in zip(bands, state["windGust"])])
+
+	def testWbgtInDegreesF(self):
+		# 80, 85, 88 and 90 degrees F are 26.67, 29.44, 31.11 and 32.22 degrees C
+		state = gridState(WBGT = [25.0, 28.0, 30.0, 32.0, 33.0])
+		self.assertEqual(self.modes["wbgt"](state, False).tolist(), [[255,0,0], [255,255,0], [153,255,0], [0,255,0], [0,125,125]])
+		self.assertEqual(self.modes["wbgt"](state, True).tolist()[-1], WHITE)
+
+class BuiltInRulesTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	# The compiled built-in rules of every script color every station like the code they replaced, on both phases
+	def assertSameColors(self, rules, before, state):
+		for module in rules:
+			color = loadColorRules(os.path.join(self.directory.name, "colors.json"), { "mode" : rules[module] })["mode"]
+			for flashCycle in (False, True):
+				with self.subTest(script = module.__name__, flashCycle = flashCycle):
+					self.assertEqual(color(state.copy(), flashCycle).tolist(), before(module, state.copy(), flashCycle).tolist())
+
+	def testMetar(self):
+		state = gridState(flightCategory = range(5), windSpeed = [0, 29, 30, 31], windGust = [-1, 0, 25, 30, 31], lightning = [False, True])
+		self.assertSameColors({ map : map.METAR_RULES, metar : metar.METAR_RULES }, metarColorBefore, state)
+
+	def testTemp(self):
+		# Every band limit, the temperatures right next to it and the heat index around the threshold
+		limits = [numpy.float32(FtoC(limit)) for limit in range(0, 101, 10)]
+		temperatures = limits + [numpy.nextafter(limit, numpy.float32(-100)) for limit in limits] + [numpy.nextafter(limit, numpy.float32(100)) for limit in limits] + list(numpy.arange(-40, 50, 0.5))
+		state = gridState(tempC = temperatures, heatIndex = [-1, 99.9, 100, 100.1, 1000])
+		self.assertSameColors({ map : map.TEMP_RULES, temp : temp.TEMP_RULES }, tempColorBefore, state)
+
+if __name__ == "__main__":
+	unittest.main()
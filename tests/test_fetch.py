@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import gzip
+import http.client
+import http.server
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from fetch import CachedFetcher, ChunkedFetcher
+from metarparse import parseResponses
+
+BODY = b"<response><data><METAR><station_id>KAUS</station_id></METAR></data></response>"
+ETAG = '"metar-1"'
+LAST_MODIFIED = "Sun, 18 Oct 2026 18:00:00 GMT"
+TIMEOUT = 0.5						# Seconds the fetchers under test wait for a response
+
+# Local stand-in for the data server. mode decides how every request is answered:
+#   etag	200 with the gzip compressed body and validators, 304 when the request carries the ETag
+#   drop	like etag, but the keep-alive connection is closed after the response without saying so
+#   hangup	the connection is closed without any response
+#   slow	like etag, after waiting longer than TIMEOUT
+#   error	500
+# Every request that reached the server is kept in requests with its headers, every connection is counted.
+class StubServer:
+	def __init__(self):
+		self.mode = "etag"
+		self.requests = []
+		self.connections = 0
+		stub = self
+		class Handler(http.server.BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+			def setup(self):
+				super().setup()
+				stub.connections += 1
+			def do_GET(self):
+				stub.requests.append(dict(self.headers))
+				if stub.mode == "hangup":
+					self.close_connection = True
+					return
+				if stub.mode == "slow":
+					time.sleep(TIMEOUT * 3)
+				if stub.mode == "error":
+					self.send_response(500)
+					self.send_header("Content-Length", "0")
+					self.end_headers()
+					return
+				if self.headers.get("If-None-Match") == ETAG:
+					self.send_response(304)
+					self.send_header("ETag", ETAG)
+					self.end_headers()
+				else:
+					content = gzip.compress(BODY)
+					self.send_response(200)
+					self.send_header("Content-Encoding", "gzip")
+					self.send_header("Content-Length", str(len(content)))
+					self.send_header("ETag", ETAG)
+					self.send_header("Last-Modified", LAST_MODIFIED)
+					self.end_headers()
+					self.wfile.write(content)
+				if stub.mode == "drop":
+					self.close_connection = True
+			def log_message(self, format, *args):
+				pass
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self.url = "http://127.0.0.1:" + str(self.server.server_address[1]) + "/metar?stationString=KAUS"
+		threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+class CachedFetcherTest(unittest.TestCase):
+	def setUp(self):
+		self.stub = StubServer()
+		self.directory = tempfile.TemporaryDirectory()
+		self.cacheFile = os.path.join(self.directory.name, "metar.xml.gz")
+		self.fetchers = []
+
+	def tearDown(self):
+		for fetcher in self.fetchers:
+			fetcher.close()
+		self.stub.close()
+		self.directory.cleanup()
+
+	def fetcher(self):
+		fetcher = CachedFetcher(self.stub.url, self.cacheFile, TIMEOUT)
+		self.fetchers.append(fetcher)
+		return fetcher
+
+	def testNotModifiedReturnsCachedContent(self):
+		fetcher = self.fetcher()
+		self.assertEqual(fetcher.fetch(), BODY)
+		self.assertTrue(fetcher.modified)
+		self.assertEqual(fetcher.fetch(), BODY)
+		self.assertFalse(fetcher.modified)
+		self.assertEqual(fetcher.bytesDownloaded, 0)
+		self.assertEqual(self.stub.requests[1].get("If-None-Match"), ETAG)
+		self.assertEqual(self.stub.requests[1].get("If-Modified-Since"), LAST_MODIFIED)
+		# Both requests went over the same keep-alive connection
+		self.assertEqual(self.stub.connections, 1)
+
+	def testValidatorsReloadFromMetaFile(self):
+		self.fetcher().fetch()
+		fetcher = self.fetcher()
+		self.assertEqual(fetcher.content, BODY)
+		self.assertEqual(fetcher.etag, ETAG)
+		self.assertEqual(fetcher.lastModified, LAST_MODIFIED)
+		self.assertEqual(fetcher.fetch(), BODY)
+		self.assertFalse(fetcher.modified)
+		self.assertEqual(self.stub.requests[-1].get("If-None-Match"), ETAG)
+
+	def testCacheOfAnotherUrlIsIgnored(self):
+		self.fetcher().fetch()
+		fetcher = CachedFetcher(self.stub.url + ",KJFK", self.cacheFile, TIMEOUT)
+		self.fetchers.append(fetcher)
+		self.assertIsNone(fetcher.content)
+		self.assertIsNone(fetcher.etag)
+
+	def testTimeoutKeepsCachedContent(self):
+		fetcher = self.fetcher()
+		fetcher.fetch()
+		self.stub.mode = "slow"
+		with self.assertRaises(OSError):
+			fetcher.fetch()
+		self.assertFalse(fetcher.modified)
+		self.assertEqual(fetcher.content, BODY)
+		# A restart during the outage starts from the cache on disk
+		self.assertEqual(self.fetcher().content, BODY)
+
+	def testServerErrorKeepsCachedContent(self):
+		fetcher = self.fetcher()
+		fetcher.fetch()
+		self.stub.mode = "error"
+		with self.assertRaises(http.client.HTTPException):
+			fetcher.fetch()
+		self.assertFalse(fetcher.modified)
+		self.assertEqual(fetcher.content, BODY)
+		self.assertEqual(self.fetcher().content, BODY)
+
+	def testDroppedConnectionIsRetriedOnANewOne(self):
+		self.stub.mode = "drop"
+		fetcher = self.fetcher()
+		fetcher.fetch()
+		self.assertEqual(fetcher.fetch(), BODY)
+		self.assertFalse(fetcher.modified)
+		self.assertEqual(len(self.stub.requests), 2)
+		self.assertEqual(self.stub.connections, 2)
+
+	def testOnlyOneRetry(self):
+		fetcher = self.fetcher()
+		fetcher.fetch()
+		self.stub.mode = "hangup"
+		with self.assertRaises((http.client.HTTPException, ConnectionError)):
+			fetcher.fetch()
+		# The request on the kept-alive connection and exactly one retry on a new connection
+		self.assertEqual(len(self.stub.requests), 3)
+		self.assertEqual(self.stub.connections, 2)
+		self.assertEqual(fetcher.content, BODY)
+
+# Data server that answers every request with a METAR for each station of its stationString after latency seconds,
+# or with 500 if one of the stations is in failing
+class StationServer:
+	def __init__(self, latency = 0):
+		self.latency = latency
+		self.failing = set()
+		stub = self
+		class Handler(http.server.BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+			def do_GET(self):
+				time.sleep(stub.latency)
+				stations = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get("stationString", [""])[0].split(",")
+				if stub.failing.intersection(stations):
+					self.send_response(500)
+					self.send_header("Content-Length", "0")
+					self.end_headers()
+					return
+				content = ("<response><data>" + "".join("<METAR><station_id>" + station + "</station_id><flight_category>VFR</flight_category></METAR>" for station in stations) + "</data></response>").encode()
+				self.send_response(200)
+				self.send_header("Content-Length", str(len(content)))
+				self.end_headers()
+				self.wfile.write(content)
+			def log_message(self, format, *args):
+				pass
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self.url = "http://127.0.0.1:" + str(self.server.server_address[1]) + "/metar?stationString="
+		threading.Thread(target = self.server.serve_forever, daemon = True).start()
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+class ChunkedFetcherTest(unittest.TestCase):
+	STATIONS = ["S" + str(i) for i in range(10)]
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.stubs = []
+		self.fetchers = []
+
+	def tearDown(self):
+		for fetcher in self.fetchers:
+			fetcher.close()
+		for stub in self.stubs:
+			stub.close()
+		self.directory.cleanup()
+
+	def fetcher(self, latency = 0, chunkSize = 3, workers = 16):
+		stub = StationServer(latency)
+		self.stubs.append(stub)
+		fetcher = ChunkedFetcher(stub.url, self.STATIONS, os.path.join(self.directory.name, "metar.xml.gz"), chunkSize, workers, TIMEOUT * 4)
+		self.fetchers.append(fetcher)
+		return stub, fetcher
+
+	def stations(self, contents):
+		return sorted(record['stationId'] for record in parseResponses(contents))
+
+	def testChunksAreMerged(self):
+		stub, fetcher = self.fetcher()
+		self.assertEqual(len(fetcher.fetchers), 4)
+		self.assertEqual(self.stations(fetcher.fetch()), sorted(self.STATIONS))
+		self.assertTrue(fetcher.modified)
+		self.assertEqual(fetcher.failed, 0)
+
+	def testFailedChunkKeepsItsLastGoodData(self):
+		stub, fetcher = self.fetcher()
+		stub.failing = { "S4" }
+		# Without a last good response the stations of the failed chunk S3 to S5 are missing, the other chunks are merged
+		self.assertEqual(self.stations(fetcher.fetch()), sorted(set(self.STATIONS) - { "S3", "S4", "S5" }))
+		self.assertEqual(fetcher.failed, 1)
+		stub.failing = set()
+		fetcher.fetch()
+		stub.failing = { "S4" }
+		self.assertEqual(self.stations(fetcher.fetch()), sorted(self.STATIONS))
+		self.assertEqual(fetcher.failed, 1)
+
+	def testEveryChunkFailing(self):
+		stub, fetcher = self.fetcher()
+		stub.failing = set(self.STATIONS)
+		with self.assertRaises(http.client.HTTPException):
+			fetcher.fetch()
+		self.assertEqual(fetcher.failed, 4)
+
+	def testPoolIsSizedToTheChunks(self):
+		stub, fetcher = self.fetcher(workers = 2)
+		self.assertEqual(fetcher.pool._max_workers, 2)
+		stub, fetcher = self.fetcher(workers = 16)
+		self.assertEqual(fetcher.pool._max_workers, 4)
+
+	# With a worker per chunk the chunks are fetched at the same time, a fetch takes about one response
+	def testChunksAreFetchedConcurrently(self):
+		latency = 0.3
+		stub, fetcher = self.fetcher(latency = latency)
+		start = time.perf_counter()
+		fetcher.fetch()
+		self.assertLess(time.perf_counter() - start, latency * 2.5)
+
+if __name__ == "__main__":
+	unittest.main()
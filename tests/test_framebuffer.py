@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import unittest
+from framebuffer import SharedBuffer, packFrames, packedSize, unpackFrames
+from frames import frameBytes
+
+# Frames of a mode for leds LEDs, every frame another color
+def modeFrames(leds, count, seed = 0):
+	return [[((seed + frame) % 256, frame % 256, led % 256) for led in range(leds)] for frame in range(count)]
+
+class SharedBufferTest(unittest.TestCase):
+	def setUp(self):
+		self.writer = SharedBuffer(size = 64)
+		self.reader = SharedBuffer(self.writer.name)
+
+	def tearDown(self):
+		self.reader.close()
+		self.writer.close()
+		self.writer.unlink()
+
+	def testRoundTrip(self):
+		self.assertEqual(self.reader.capacity, 64)
+		self.assertIsNone(self.reader.read())
+		self.writer.publish(b"first")
+		self.assertEqual(self.reader.read(), b"first")
+		self.assertIsNone(self.reader.read())
+		self.writer.publish(b"")
+		self.assertEqual(self.reader.read(), b"")
+
+	def testOnlyTheNewestPayload(self):
+		for payload in (b"one", b"two", b"three" * 12):
+			self.writer.publish(payload)
+		self.assertEqual(self.reader.read(), b"three" * 12)
+
+	def testPayloadTooLarge(self):
+		self.writer.publish(b"x" * 64)
+		with self.assertRaises(ValueError):
+			self.writer.publish(b"x" * 65)
+		self.assertEqual(self.reader.read(), b"x" * 64)
+
+	def testHeartbeat(self):
+		self.writer.beat(1234.5)
+		self.assertEqual(self.reader.heartbeat(), 1234.5)
+
+	def testTornReadIsRetried(self):
+		# The writer publishes twice while the reader copies, the second payload goes into the slot being copied
+		self.writer.publish(b"old")
+		slot = self.reader.slot
+		copies = []
+		def slotDuringPublish(index):
+			copies.append(index)
+			view = slot(index)
+			if len(copies) == 1:
+				self.writer.publish(b"newer")
+				self.writer.publish(b"newest")
+			return view
+		self.reader.slot = slotDuringPublish
+		self.assertEqual(self.reader.read(), b"newest")
+		self.assertEqual(copies, [1, 1])
+		self.assertIsNone(self.reader.read())
+
+class PackFramesTest(unittest.TestCase):
+	def testRoundTrip(self):
+		maps = [{ "metar" : modeFrames(5, 4), "temp" : modeFrames(5, 2, 7) }, { "metar" : modeFrames(3, 4, 1), "replay" : [] }]
+		unpacked = unpackFrames(packFrames(maps))
+		self.assertEqual(unpacked, [{ mode : frameBytes(frames) for mode, frames in animation.items() } for animation in maps])
+
+	def testRepeatedFramesStoredOnce(self):
+		frame = modeFrames(100, 1)[0]
+		payload = packFrames([{ "replay" : [frame] * 50, "grib" : [frame, frame] }])
+		self.assertLess(len(payload), 2 * 100 * 3)
+		self.assertEqual(unpackFrames(payload), [{ "replay" : [frameBytes([frame])[0]] * 50, "grib" : [frameBytes([frame])[0]] * 2 }])
+
+	def testPackedSizeIsLargeEnough(self):
+		# Many small maps with long animations have an index far larger than their frames
+		for ledCounts, frameCounts in (([1], { "metar" : 2 }), ([50], { "metar" : 60, "temp" : 60, "taf" : 1440, "replay" : 720 }), ([2] * 40, { "metar" : 60, "wind" : 60, "replay" : 720 }), ([0, 3], { "metar" : 2 })):
+			with self.subTest(ledCounts = len(ledCounts), frameCounts = frameCounts):
+				maps = [{ mode : modeFrames(leds, count, number * 1000) for mode, count in frameCounts.items() } for number, leds in enumerate(ledCounts)]
+				self.assertGreaterEqual(packedSize(ledCounts, frameCounts), len(packFrames(maps)))
+
+	def testPublishedThroughTheBuffer(self):
+		ledCounts = [2] * 40
+		frameCounts = { "metar" : 60, "replay" : 720 }
+		maps = [{ mode : modeFrames(leds, count, number * 1000) for mode, count in frameCounts.items() } for number, leds in enumerate(ledCounts)]
+		writer = SharedBuffer(size = packedSize(ledCounts, frameCounts))
+		try:
+			writer.publish(packFrames(maps))
+			reader = SharedBuffer(writer.name)
+			self.assertEqual(unpackFrames(reader.read()), unpackFrames(packFrames(maps)))
+			reader.close()
+		finally:
+			writer.close()
+			writer.unlink()
+
+if __name__ == "__main__":
+	unittest.main()
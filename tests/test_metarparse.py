@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import calendar
+import time
+import unittest
+from metarparse import isoTime, parseMetars, parseRecords, parseResponses
+
+RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<response version="1.3">
+	<request_index>1</request_index>
+	<data num_results="3">
+		<METAR>
+			<raw_text>KAUS 181853Z 17012G22KT 10SM FEW035 29/18 A2998</raw_text>
+			<station_id>KAUS</station_id>
+			<observation_time>2026-10-18T18:53:00Z</observation_time>
+			<temp_c>29.4</temp_c>
+			<dewpoint_c>17.8</dewpoint_c>
+			<wind_speed_kt>12</wind_speed_kt>
+			<wind_gust_kt>22</wind_gust_kt>
+			<sky_condition sky_cover="FEW" cloud_base_ft_agl="3500" />
+			<flight_category>VFR</flight_category>
+		</METAR>
+		<METAR>
+			<station_id>KJFK</station_id>
+			<wind_speed_kt>not a number</wind_speed_kt>
+		</METAR>
+		<METAR>
+			<raw_text>report without a station</raw_text>
+		</METAR>
+	</data>
+</response>"""
+
+class ParseTest(unittest.TestCase):
+	def testFields(self):
+		records = list(parseMetars(RESPONSE))
+		self.assertEqual([record['stationId'] for record in records], ["KAUS", "KJFK"])
+		self.assertEqual(records[0], {
+			'stationId' : "KAUS", 'flightCategory' : "VFR", 'windSpeed' : 12, 'windGust' : 22,
+			'rawText' : "KAUS 181853Z 17012G22KT 10SM FEW035 29/18 A2998", 'tempC' : 29.4, 'dewpointC' : 17.8,
+			'observationTime' : 1792349580, 'latitude' : None, 'longitude' : None,
+		})
+
+	def testMissingAndInvalidFieldsAreNone(self):
+		record = list(parseMetars(RESPONSE))[1]
+		self.assertIsNone(record['windSpeed'])
+		self.assertIsNone(record['flightCategory'])
+
+	def testRecordsOfAnotherTag(self):
+		self.assertEqual(list(parseRecords(b"<response><data><TAF><station_id>KAUS</station_id></TAF></data></response>", 'TAF', { 'station_id' : ('stationId', str) })), [{ 'stationId' : "KAUS" }])
+
+	def testResponsesOneAfterTheOther(self):
+		self.assertEqual([record['stationId'] for record in parseResponses([RESPONSE, RESPONSE])], ["KAUS", "KJFK", "KAUS", "KJFK"])
+
+class IsoTimeTest(unittest.TestCase):
+	def testSameAsStrptime(self):
+		for text in ("1970-01-01T00:00:00Z", "2026-10-18T18:53:00Z", "2026-12-31T23:59:59Z", "2028-02-29T12:00:00Z"):
+			with self.subTest(text = text):
+				self.assertEqual(isoTime(text), calendar.timegm(time.strptime(text, "%Y-%m-%dT%H:%M:%SZ")))
+
+	def testInvalidTimes(self):
+		for text in ("", "2026-10-18T18:53:00", "2026-10-18T18:53:00+02:00", "2026-13-01T00:00:00Z", "soon"):
+			with self.subTest(text = text):
+				with self.assertRaises(ValueError):
+					isoTime(text)
+
+if __name__ == "__main__":
+	unittest.main()
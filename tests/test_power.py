@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import unittest
+from unittest import mock
+import power
+from power import PowerSchedule, PowerUsage, minutes
+
+# Seconds since the epoch of a local time of the time zone the test runs in
+def local(year, month, day, hour, minute = 0):
+	return time.mktime((year, month, day, hour, minute, 0, 0, 0, -1))
+
+class PowerScheduleTest(unittest.TestCase):
+	# New York has daylight saving time, from 2:00 on 8 March 2026 to 2:00 on 1 November 2026
+	def setUp(self):
+		self.timezone = os.environ.get("TZ")
+		os.environ["TZ"] = "America/New_York"
+		time.tzset()
+
+	def tearDown(self):
+		if self.timezone is None:
+			del os.environ["TZ"]
+		else:
+			os.environ["TZ"] = self.timezone
+		time.tzset()
+
+	def assertSchedule(self, schedule, expected):
+		for (hour, minute), on, change in expected:
+			with self.subTest(time = "%02d:%02d" % (hour, minute)):
+				now = local(2026, 10, 18, hour, minute)
+				self.assertEqual(schedule.isOn(now), on)
+				self.assertEqual(schedule.nextChange(now), change)
+
+	def testWithoutWindowsAlwaysOn(self):
+		schedule = PowerSchedule([])
+		self.assertTrue(schedule.isOn())
+		self.assertIsNone(schedule.nextChange())
+
+	def testDayWindow(self):
+		self.assertSchedule(PowerSchedule([("07:00", "22:00")]), [
+			((6, 0), False, 3600), ((6, 59), False, 60), ((7, 0), True, 15 * 3600), ((21, 59), True, 60), ((22, 0), False, 9 * 3600),
+		])
+
+	def testOvernightWindow(self):
+		self.assertSchedule(PowerSchedule([("22:00", "06:00")]), [
+			((0, 0), True, 6 * 3600), ((5, 59), True, 60), ((6, 0), False, 16 * 3600), ((21, 0), False, 3600), ((23, 0), True, 7 * 3600),
+		])
+
+	def testSeveralWindows(self):
+		self.assertSchedule(PowerSchedule([("06:30", "09:00"), ("17:00", "23:30")]), [
+			((6, 0), False, 1800), ((8, 0), True, 3600), ((10, 0), False, 7 * 3600), ((23, 0), True, 1800), ((23, 30), False, 7 * 3600),
+		])
+
+	def testAdjoiningWindowsStayOn(self):
+		self.assertSchedule(PowerSchedule([("07:00", "12:00"), ("12:00", "22:00")]), [((8, 0), True, 14 * 3600), ((12, 0), True, 10 * 3600)])
+
+	def testWindowOfTheWholeDay(self):
+		self.assertSchedule(PowerSchedule([("07:00", "07:00")]), [((3, 0), True, None), ((7, 0), True, None)])
+
+	def testDaylightSavingTime(self):
+		schedule = PowerSchedule([("07:00", "22:00")])
+		# The nights the clocks go forward and back are an hour shorter and longer
+		self.assertEqual(schedule.nextChange(local(2026, 3, 7, 22)), 8 * 3600)
+		self.assertEqual(schedule.nextChange(local(2026, 10, 31, 22)), 10 * 3600)
+		self.assertTrue(schedule.isOn(local(2026, 3, 8, 7)))
+		self.assertFalse(schedule.isOn(local(2026, 11, 1, 6, 59)))
+		# An overnight window across the hour that is skipped or repeated
+		schedule = PowerSchedule([("01:00", "03:00")])
+		self.assertEqual(schedule.nextChange(local(2026, 3, 8, 1)), 3600)
+		self.assertEqual(schedule.nextChange(local(2026, 11, 1, 0)), 3600)
+		# From the first 1:00 of the night the clocks go back, before the one an hour later
+		self.assertEqual(schedule.nextChange(local(2026, 11, 1, 0) + 3600), 3 * 3600)
+
+	def testInvalidTimes(self):
+		for clock in ("7", "24:00", "07:60", "-1:00"):
+			with self.subTest(clock = clock):
+				with self.assertRaises(ValueError):
+					minutes(clock)
+		self.assertEqual(minutes("23:59"), 23 * 60 + 59)
+
+class PowerUsageTest(unittest.TestCase):
+	def testTotalsOfBothStates(self):
+		clock = [100.0, 10.0]
+		with mock.patch.object(power.time, "monotonic", lambda: clock[0]), mock.patch.object(power.time, "process_time", lambda: clock[1]):
+			usage = PowerUsage(on = True)
+			clock[:] = [160.0, 12.5]
+			usage.wakeup()
+			usage.switch(False)
+			usage.switch(False)
+			clock[:] = [460.0, 12.75]
+			usage.wakeup()
+			usage.wakeup()
+			self.assertEqual(usage.values(0), [('state="on"', 60.0), ('state="off"', 300.0)])
+			self.assertEqual(usage.values(1), [('state="on"', 2.5), ('state="off"', 0.25)])
+			self.assertEqual(usage.values(2), [('state="on"', 1), ('state="off"', 2)])
+			usage.switch(True)
+			clock[:] = [520.0, 13.75]
+			self.assertEqual(usage.report(), "Power: on 120 s with 3.5 s CPU and 1 wakeups, off 300 s with 0.2 s CPU and 2 wakeups")
+
+	def testStartsOff(self):
+		usage = PowerUsage(on = False)
+		usage.wakeup()
+		self.assertEqual(usage.values(2), [('state="on"', 0), ('state="off"', 1)])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import unittest
+from corpus import METAR_CORPUS
+from rawmetar import decodeMetar, flightCategory
+
+class CorpusTest(unittest.TestCase):
+	def testCategoryAndLightning(self):
+		for rawText, category, lightning in METAR_CORPUS:
+			with self.subTest(report = rawText):
+				decoded = decodeMetar(rawText)
+				self.assertEqual(decoded["flightCategory"], category)
+				self.assertEqual(decoded["lightning"], lightning)
+
+class DecodeTest(unittest.TestCase):
+	def testWind(self):
+		decoded = decodeMetar("KAUS 181853Z 17012G22KT 10SM CLR 29/18 A2998")
+		self.assertEqual((decoded["windDir"], decoded["windSpeed"], decoded["windGust"]), (170, 12, 22))
+		decoded = decodeMetar("KDEN 181853Z VRB03KT P6SM SCT080 M02/M08 A3020")
+		self.assertEqual((decoded["windDir"], decoded["windSpeed"], decoded["windGust"]), (None, 3, None))
+		# Meters per second are converted to knots
+		decoded = decodeMetar("EGLL 181850Z 24010G15MPS 9999 SCT035 14/08 Q1012")
+		self.assertEqual((decoded["windSpeed"], decoded["windGust"]), (19, 29))
+
+	def testVisibility(self):
+		for visibility, expected in (("10SM", 10.0), ("1 1/2SM", 1.5), ("3/4SM", 0.75), ("M1/4SM", 0.25), ("P6SM", 6.0), ("9999", 10.0), ("0800", 800 / 1609.34), ("CAVOK", 10.0)):
+			with self.subTest(visibility = visibility):
+				self.assertAlmostEqual(decodeMetar("KXXX 181853Z 00000KT " + visibility + " 15/05 A3010")["visibility"], expected)
+
+	def testCeilingIsTheLowestBrokenOrOvercastLayer(self):
+		decoded = decodeMetar("KATL 181852Z 20008KT 5SM BR FEW005 SCT009 BKN020 OVC015 22/20 A3004")
+		self.assertEqual(decoded["ceiling"], 1500)
+		self.assertEqual(decoded["layers"], [("FEW", 500), ("SCT", 900), ("BKN", 2000), ("OVC", 1500)])
+		self.assertEqual(decodeMetar("KSFO 181856Z 28008KT 1/4SM FG VV002 13/13 A3002")["ceiling"], 200)
+		self.assertIsNone(decodeMetar("KBOS 181854Z 00000KT 10SM FEW250 15/05 A3010")["ceiling"])
+
+	def testTemperatures(self):
+		decoded = decodeMetar("KMSP 181853Z 32018KT 3/4SM -SN OVC006 M05/M07 A3012")
+		self.assertEqual((decoded["tempC"], decoded["dewpointC"]), (-5, -7))
+		decoded = decodeMetar("KMSP 181853Z 32018KT 3/4SM -SN OVC006 M05/ A3012")
+		self.assertEqual((decoded["tempC"], decoded["dewpointC"]), (-5, None))
+
+	def testRemarksAreNotDecodedAsReport(self):
+		decoded = decodeMetar("KAUS 181853Z 17012KT 10SM CLR 29/18 A2998 RMK AO2 TSB05E30 OVC002")
+		self.assertEqual(decoded["weather"], [])
+		self.assertIsNone(decoded["ceiling"])
+		self.assertFalse(decoded["lightning"])
+
+	def testWithoutVisibilityOrCeiling(self):
+		self.assertIsNone(decodeMetar("KXXX 181853Z AUTO 36008KT 09/08 A3001")["flightCategory"])
+		self.assertIsNone(decodeMetar("KXXX 181853Z AUTO 36008KT CLR 09/08 A3001")["flightCategory"])
+
+class FlightCategoryTest(unittest.TestCase):
+	def testLimits(self):
+		for visibility, ceiling, expected in ((1, 500, "IFR"), (0.75, None, "LIFR"), (None, 499, "LIFR"), (3, 1000, "MVFR"), (2.5, None, "IFR"), (None, 3000, "MVFR"), (None, 3100, "VFR"), (5, None, "MVFR"), (5.5, 3100, "VFR"), (None, None, None)):
+			with self.subTest(visibility = visibility, ceiling = ceiling):
+				self.assertEqual(flightCategory(visibility, ceiling), expected)
+
+if __name__ == "__main__":
+	unittest.main()
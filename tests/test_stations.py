@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+import numpy
+from stations import StationTable, distances, nearestNeighbours
+
+STATION_INFO = b"""<?xml version="1.0" encoding="UTF-8"?>
+<response version="1.2">
+	<data num_results="3">
+		<Station>
+			<station_id>KAUS</station_id>
+			<latitude>30.18</latitude>
+			<longitude>-97.68</longitude>
+			<site>Austin-Bergstrom Intl</site>
+		</Station>
+		<Station>
+			<station_id>KEDC</station_id>
+			<latitude>30.4</latitude>
+			<longitude>-97.57</longitude>
+		</Station>
+		<Station>
+			<station_id>KXXX</station_id>
+			<latitude>unknown</latitude>
+		</Station>
+	</data>
+</response>"""
+
+# The neighbours of every LED the slow way, by the distance to every other LED
+def bruteForce(latitudes, longitudes, radius, count):
+	neighbours = numpy.full((len(latitudes), count), -1, dtype = numpy.int32)
+	for row in range(len(latitudes)):
+		if numpy.isnan(latitudes[row]):
+			continue
+		distance = distances(latitudes[row], longitudes[row], latitudes, longitudes)
+		others = [other for other in numpy.argsort(distance, kind = 'stable') if distance[other] <= radius and (latitudes[other] != latitudes[row] or longitudes[other] != longitudes[row])]
+		neighbours[row, :len(others[:count])] = others[:count]
+	return neighbours
+
+class NearestNeighboursTest(unittest.TestCase):
+	def testNearestFirstAndPadded(self):
+		# Two stations 30 and 45 nautical miles north of the first, a fourth 120 miles away
+		latitudes = numpy.array([40.0, 40.5, 40.75, 42.0])
+		longitudes = numpy.array([-100.0, -100.0, -100.0, -100.0])
+		neighbours = nearestNeighbours(latitudes, longitudes, 50, 3)
+		self.assertEqual(neighbours.tolist(), [[1, 2, -1], [2, 0, -1], [1, 0, -1], [-1, -1, -1]])
+
+	def testRadiusCutoff(self):
+		# 0.8 degrees of latitude are 48 nautical miles
+		latitudes = numpy.array([10.0, 10.8])
+		longitudes = numpy.array([20.0, 20.0])
+		self.assertEqual(nearestNeighbours(latitudes, longitudes, 49, 1).tolist(), [[1], [0]])
+		self.assertEqual(nearestNeighbours(latitudes, longitudes, 47, 1).tolist(), [[-1], [-1]])
+
+	def testUnknownAndSamePositions(self):
+		# A station without coordinates has and is no neighbour, a station on two LEDs is not its own neighbour
+		latitudes = numpy.array([50.0, numpy.nan, 50.0, 50.1])
+		longitudes = numpy.array([8.0, 8.0, 8.0, 8.0])
+		self.assertEqual(nearestNeighbours(latitudes, longitudes, 50, 2).tolist(), [[3, -1], [-1, -1], [3, -1], [0, 2]])
+
+	def testAcrossTheAntimeridian(self):
+		# Fiji and Taveuni are on both sides of the 180th meridian, about 25 nautical miles apart
+		for west, east in ((179.9, -179.7), (179.9, 180.3), (-180.1, -179.7)):
+			with self.subTest(west = west, east = east):
+				latitudes = numpy.array([-16.8, -16.8])
+				longitudes = numpy.array([west, east])
+				self.assertEqual(nearestNeighbours(latitudes, longitudes, 50, 1).tolist(), [[1], [0]])
+
+	def testSameAsBruteForce(self):
+		random = numpy.random.default_rng(7)
+		for name, latitudes, longitudes in (
+			("continental", random.uniform(25, 50, 2000), random.uniform(-125, -65, 2000)),
+			("antimeridian", random.uniform(-30, 30, 1000), random.uniform(170, 190, 1000) % 360 - 180),
+			("polar", random.uniform(80, 90, 500), random.uniform(-180, 180, 500)),
+		):
+			for radius in (10, 50, 200):
+				with self.subTest(name, radius = radius):
+					self.assertEqual(nearestNeighbours(latitudes, longitudes, radius, 3).tolist(), bruteForce(latitudes, longitudes, radius, 3).tolist())
+
+	def testTurnedOff(self):
+		self.assertEqual(nearestNeighbours(numpy.array([1.0, 1.1]), numpy.array([1.0, 1.0]), 0, 2).tolist(), [[-1, -1], [-1, -1]])
+
+# Stand-in for a ChunkedFetcher of the station information
+class StationFetcher:
+	def __init__(self, content, error = None):
+		self.content = content
+		self.error = error
+		self.requests = 0
+
+	@property
+	def contents(self):
+		return [self.content] if self.content is not None else []
+
+	def fetch(self):
+		self.requests += 1
+		if self.error is not None:
+			raise self.error
+		return self.contents
+
+class StationTableTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "stations.json")
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def testStationInformation(self):
+		table = StationTable(self.path)
+		table.addStations([STATION_INFO])
+		self.assertEqual(table.coordinates, { "KAUS" : [30.18, -97.68], "KEDC" : [30.4, -97.57] })
+		self.assertEqual(table.missing(["KAUS", "KXXX", "KEDC"]), ["KXXX"])
+
+	def testLookupOnlyWhileStationsAreMissing(self):
+		table = StationTable(self.path)
+		table.add("KAUS", 30.18, -97.68)
+		fetcher = StationFetcher(STATION_INFO)
+		self.assertFalse(table.lookup(fetcher, ["KAUS"], 0))
+		self.assertEqual(fetcher.requests, 0)
+		self.assertTrue(table.lookup(fetcher, ["KAUS", "KEDC"], 0))
+		self.assertEqual(table.coordinates["KEDC"], [30.4, -97.57])
+		# A station the data server does not know is only asked for again after the interval
+		self.assertFalse(table.lookup(fetcher, ["KAUS", "KXXX"], 3600))
+		self.assertEqual(fetcher.requests, 1)
+
+	def testLookupKeepsTheCachedResponse(self):
+		table = StationTable(self.path)
+		self.assertTrue(table.lookup(StationFetcher(STATION_INFO, OSError("unreachable")), ["KEDC"], 0))
+		self.assertEqual(table.missing(["KEDC"]), [])
+
+	def testSavedAndLoaded(self):
+		table = StationTable(self.path)
+		table.addStations([STATION_INFO])
+		table.save()
+		self.assertEqual(StationTable(self.path).coordinates, table.coordinates)
+		self.assertEqual(StationTable(self.path).neighbours(["KAUS", "NULL", "KEDC"], 50, 1).tolist(), [[2], [-1], [0]])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import unittest
+from corpus import TAF_CORPUS
+from metarparse import isoTime
+from stationstate import CATEGORIES
+from taf import decodeTaf, forecastHours, resolveTime
+
+def corpusTaf(stationId):
+	for rawText, issued, expected in TAF_CORPUS:
+		taf = decodeTaf(rawText, isoTime(issued))
+		if taf["stationId"] == stationId:
+			return taf
+
+# Forecast of the hours starting at the given times, as (category name, wind, gust, lightning)
+def forecast(taf, hours, temporary = True):
+	return [None if hour is None else (CATEGORIES[hour[0]],) + tuple(hour[1:]) for hour in forecastHours(taf, [isoTime(hour) for hour in hours], temporary)]
+
+class CorpusTest(unittest.TestCase):
+	def testCategoriesOfTheCorpusHours(self):
+		for rawText, issued, expected in TAF_CORPUS:
+			taf = decodeTaf(rawText, isoTime(issued))
+			self.assertIsNotNone(taf, rawText)
+			for (hour, category), result in zip(expected, forecast(taf, [hour for hour, category in expected])):
+				with self.subTest(station = taf["stationId"], hour = hour):
+					self.assertEqual(result[0] if result is not None else None, category)
+
+class DecodeTest(unittest.TestCase):
+	def testGroups(self):
+		taf = corpusTaf("KAUS")
+		self.assertEqual([kind for kind, start, end, conditions in taf["groups"]], ["BASE", "FM", "TEMPO", "BECMG", "PROB"])
+		kind, start, end, conditions = taf["groups"][2]
+		self.assertEqual((start, end), (isoTime("2026-10-19T04:00:00Z"), isoTime("2026-10-19T08:00:00Z")))
+		self.assertTrue(conditions["lightning"])
+		# The remarks after RMK are not part of the last group
+		self.assertEqual(taf["groups"][4][2], isoTime("2026-10-20T00:00:00Z"))
+
+	def testFromGroupStartsAtItsTime(self):
+		kind, start, end, conditions = corpusTaf("KJFK")["groups"][1]
+		self.assertEqual((kind, start, end), ("FM", isoTime("2026-10-19T03:00:00Z"), isoTime("2026-10-20T00:00:00Z")))
+		self.assertEqual(conditions["windSpeed"], 10)
+
+	def testAmendedTafKeepsItsStation(self):
+		self.assertEqual(corpusTaf("KJFK")["issued"], isoTime("2026-10-18T19:30:00Z"))
+
+	def testTempoWithoutPeriodIsDropped(self):
+		self.assertEqual([kind for kind, start, end, conditions in corpusTaf("KORD")["groups"]], ["BASE", "FM"])
+
+	def testProbabilityWithTempo(self):
+		kind, start, end, conditions = corpusTaf("KDEN")["groups"][1]
+		self.assertEqual((kind, start, end), ("PROB", isoTime("2026-10-18T20:00:00Z"), isoTime("2026-10-19T00:00:00Z")))
+		self.assertEqual((conditions["windSpeed"], conditions["windGust"]), (25, 40))
+
+	def testValidityRollsOverTheDayAndMonth(self):
+		taf = corpusTaf("KAUS")
+		self.assertEqual((taf["validFrom"], taf["validTo"]), (isoTime("2026-10-18T18:00:00Z"), isoTime("2026-10-20T00:00:00Z")))
+		taf = corpusTaf("KSEA")
+		self.assertEqual(taf["issued"], isoTime("2026-10-31T23:40:00Z"))
+		self.assertEqual((taf["validFrom"], taf["validTo"]), (isoTime("2026-11-01T00:00:00Z"), isoTime("2026-11-02T06:00:00Z")))
+
+	def testValidityRollsOverTheYear(self):
+		taf = decodeTaf("TAF KBOS 312340Z 0100/0124 27010KT P6SM SCT040", isoTime("2026-12-31T23:40:00Z"))
+		self.assertEqual((taf["validFrom"], taf["validTo"]), (isoTime("2027-01-01T00:00:00Z"), isoTime("2027-01-02T00:00:00Z")))
+
+	def testDayOfAnotherMonthIsTheClosest(self):
+		# Issued on the 1st for the 31st: the last day of the month before, not 30 days later
+		self.assertEqual(resolveTime(31, 18, 0, isoTime("2026-11-01T02:00:00Z")), isoTime("2026-10-31T18:00:00Z"))
+		# September has no 31st, the closest one is in October
+		self.assertEqual(resolveTime(31, 6, 0, isoTime("2026-09-30T23:00:00Z")), isoTime("2026-10-31T06:00:00Z"))
+
+	def testWithoutHeader(self):
+		self.assertIsNone(decodeTaf("KAUS 17012KT P6SM SKC", isoTime("2026-10-18T17:20:00Z")))
+		self.assertIsNone(decodeTaf("TAF KAUS 181720Z", isoTime("2026-10-18T17:20:00Z")))
+
+class ForecastTest(unittest.TestCase):
+	def testHoursOutsideTheValidity(self):
+		self.assertEqual(forecast(corpusTaf("KCAR"), ["2026-10-18T16:00:00Z", "2026-10-18T17:00:00Z", "2026-10-19T18:00:00Z", "2026-10-20T12:00:00Z"]), [None, None, None, None])
+
+	def testWindGustAndLightning(self):
+		taf = corpusTaf("KAUS")
+		self.assertEqual(forecast(taf, ["2026-10-18T18:00:00Z"]), [("VFR", 12, 22, False)])
+		self.assertEqual(forecast(taf, ["2026-10-19T00:00:00Z"]), [("VFR", 8, -1, False)])
+		self.assertEqual(forecast(taf, ["2026-10-19T05:00:00Z"]), [("MVFR", 8, -1, True)])
+
+	def testHourGetsTheWorstChangeDuringIt(self):
+		# FM2100 at KCAR turns LIFR into IFR, the hour from 20Z still counts as LIFR and the one from 21Z as IFR
+		self.assertEqual([hour[0] for hour in forecast(corpusTaf("KCAR"), ["2026-10-18T20:00:00Z", "2026-10-18T21:00:00Z"])], ["LIFR", "IFR"])
+
+	def testBecomingAppliesFromTheStartOfItsPeriod(self):
+		self.assertEqual([hour[0] for hour in forecast(corpusTaf("KSEA"), ["2026-11-01T05:00:00Z", "2026-11-01T06:00:00Z"])], ["MVFR", "VFR"])
+
+	def testCategoryFromCeilingOrVisibilityAlone(self):
+		# Ceilings below 500 feet are LIFR and 500 feet itself IFR, like the METARs
+		taf = decodeTaf("TAF KXYZ 181720Z 1818/1918 18005KT BKN004 FM182200 18005KT BKN005 FM190200 18005KT 2SM FM190600 18005KT", isoTime("2026-10-18T17:20:00Z"))
+		self.assertEqual(forecast(taf, ["2026-10-18T19:00:00Z", "2026-10-18T23:00:00Z", "2026-10-19T03:00:00Z", "2026-10-19T07:00:00Z"]), [("LIFR", 5, -1, False), ("IFR", 5, -1, False), ("IFR", 5, -1, False), ("", 5, -1, False)])
+
+	def testTemporaryGroupsOnlyCountWithTemporary(self):
+		taf = corpusTaf("KMIA")
+		self.assertEqual(forecast(taf, ["2026-10-18T19:00:00Z"], temporary = False), [("VFR", 14, 26, False)])
+		self.assertEqual(forecast(taf, ["2026-10-18T19:00:00Z"]), [("IFR", 14, 26, True)])
+		taf = corpusTaf("KAUS")
+		self.assertEqual(forecast(taf, ["2026-10-19T21:00:00Z"], temporary = False)[0][0], "MVFR")
+
+if __name__ == "__main__":
+	unittest.main()
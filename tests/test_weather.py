@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import unittest
+import numpy
+from stationstate import newState, computeMetrics
+from weather import FtoC, derivedMetrics, derivedMetricsScalar
+
+# Reports that make the heat index switch formula: 21.1 C is 69.98 F and 21.2 C 70.16 F, 46.1 C is 114.98 F and 46.2 C 115.16 F
+HEAT_INDEX_CUTOFFS = [(21.1, 15.0), (21.2, 15.0), (FtoC(70), 15.0), (46.1, 20.0), (46.2, 20.0), (FtoC(115), 20.0)]
+
+# Reports whose relative humidity is within a few millionths of a rounding step, e.g. 30.549999 for 42.8/21.8
+ROUNDING_BOUNDARIES = [(42.8, 21.8, 30.5), (44.4, 27.9, 40.4), (-34.0, -37.5, 70.2), (34.3, 4.2, 15.2), (16.5, -5.9, 21.0), (29.0, 12.4, 36.0)]
+
+# Missing temperatures and dewpoints are stored as 0 by the parsers, one of them or both
+MISSING = [(0.0, 0.0), (25.0, 0.0), (0.0, -5.0)]
+
+class DerivedMetricsTest(unittest.TestCase):
+	# Every metric of every station of the vectorized pass equals the scalar reference formulas
+	def assertMatchesScalar(self, tempC, dewpointC):
+		vectorized = derivedMetrics(tempC, dewpointC)
+		for i in range(len(tempC)):
+			scalar = derivedMetricsScalar(tempC[i], dewpointC[i])
+			for key, value in scalar.items():
+				with self.subTest(tempC = tempC[i], dewpointC = dewpointC[i], metric = key):
+					self.assertEqual(vectorized[key][i], value)
+
+	def testGridOfReports(self):
+		tempC, dewpointC = [], []
+		for temp in numpy.arange(-400, 501, 5) / 10:
+			for spread in numpy.arange(0, 401, 25) / 10:
+				tempC.append(float(temp))
+				dewpointC.append(round(float(temp - spread), 1))
+		self.assertMatchesScalar(tempC, dewpointC)
+
+	def testHeatIndexCutoffs(self):
+		tempC, dewpointC = zip(*HEAT_INDEX_CUTOFFS)
+		self.assertMatchesScalar(tempC, dewpointC)
+		heatIndex = derivedMetrics(tempC, dewpointC)["heatIndex"]
+		self.assertEqual(heatIndex[0], -1)
+		self.assertGreater(heatIndex[1], 0)
+		self.assertNotEqual(heatIndex[3], 1000)
+		self.assertEqual(heatIndex[4], 1000)
+
+	def testRoundingBoundaries(self):
+		tempC, dewpointC, rh = zip(*ROUNDING_BOUNDARIES)
+		self.assertMatchesScalar(tempC, dewpointC)
+		self.assertEqual(list(derivedMetrics(tempC, dewpointC)["RH"]), list(rh))
+
+	def testMissingValues(self):
+		tempC, dewpointC = zip(*MISSING)
+		self.assertMatchesScalar(tempC, dewpointC)
+		self.assertEqual(derivedMetrics([0.0], [0.0])["RH"][0], 100)
+
+	# Stations without a report keep zeros, the others get the values of the scalar formulas
+	def testComputeMetricsOnlyFillsReportedStations(self):
+		state = newState(3)
+		state["reported"] = [True, False, True]
+		state["tempC"] = [30.1, 25.0, -3.4]
+		state["dewpointC"] = [22.3, 20.0, -8.9]
+		computeMetrics(state)
+		for row, tempC, dewpointC in ((0, 30.1, 22.3), (2, -3.4, -8.9)):
+			scalar = derivedMetricsScalar(tempC, dewpointC)
+			for key, value in scalar.items():
+				self.assertAlmostEqual(float(state[key][row]), value, places = 4)
+		self.assertEqual([float(state[key][1]) for key in ("RH", "heatIndex", "tempWet", "WBGT")], [0, 0, 0, 0])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import math
+import numpy
+
+# Function to convert degrees fahrenheit to celsius
+def FtoC(temp):
+	return ((temp - 32) * (5/9))
+
+# Function to convert degrees celsius to fahrenheit
+def CtoF(temp):
+	return ((temp * (9/5)) + 32)
+
+# Calculate relative humidity, heat index, wet bulb and WBGT for all stations at once.
+# tempC and dewpointC are arrays (or lists) in degrees C, one entry per station; the result
+# is a dictionary of arrays in the same order, rounded to one decimal like the per-station code.
+def derivedMetrics(tempC, dewpointC):
+	tempC = numpy.asarray(tempC, dtype = numpy.float64)
+	dewpointC = numpy.asarray(dewpointC, dtype = numpy.float64)
+
+	e = 6.11 * 10**((7.5 * dewpointC)/(237.3 + dewpointC))
+	e_s = 6.11 * 10**((7.5 * tempC)/(237.3 + tempC))
+	rh = e/e_s * 100
+
+	# Heat index polynomial, only valid between 70F and 115F
+	tempF = CtoF(tempC)
+	tempF2 = tempF * tempF
+	tempF3 = tempF2 * tempF
+	rh2 = rh * rh
+	rh3 = rh2 * rh
+	hi = 16.923 + 0.185212*tempF + 5.37941*rh - 0.100254*tempF*rh + 0.00941695*tempF2 + 0.00728898*rh2 + 0.000345372*tempF2*rh - 0.000814971*tempF*rh2 + 0.0000102102*tempF2*rh2 - 0.000038646*tempF3 + 0.0000291583*rh3 + 0.00000142721*tempF3*rh + 0.000000197483*tempF*rh3 - 0.0000000218429*tempF3*rh2 + 0.000000000843296*tempF2*rh3 - 0.0000000000481975*tempF3*rh3
+	hi = numpy.where(tempF < 70, -1.0, numpy.where(tempF > 115, 1000.0, hi))
+
+	# Stull's wet bulb approximation and wet bulb globe temperature
+	t_w = tempC * numpy.arctan(0.151977 * numpy.sqrt(rh + 8.313659)) + numpy.arctan(tempC + rh) - numpy.arctan(rh - 1.676331) + 0.00391838 * rh**(3/2) * numpy.arctan(0.023101 * rh) - 4.686035
+	WBGT = 0.7 * t_w + 0.3 * tempC
+
+	# Round floats
+	return {
+		"RH" : numpy.round(rh * 10) / 10,
+		"heatIndex" : numpy.round(hi * 10) / 10,
+		"tempWet" : numpy.round(t_w * 10) / 10,
+		"WBGT" : numpy.round(WBGT * 10) / 10,
+	}
+
+# The same calculation for a single station with plain floats, kept as the reference for derivedMetrics
+def derivedMetricsScalar(tempC, dewpointC):
+	e = 6.11 * 10**((7.5 * dewpointC)/(237.3 + dewpointC))
+	e_s = 6.11 * 10**((7.5 * tempC)/(237.3 + tempC))
+	rh = e/e_s * 100
+
+	tempF = CtoF(tempC)
+	if tempF < 70:
+		hi = -1
+	elif tempF > 115:
+		hi = 1000
+	else:
+		hi = 16.923 + 0.185212*tempF + 5.37941*rh - 0.100254*tempF*rh + 0.00941695*(tempF**2) + 0.00728898*(rh**2) + 0.000345372*(tempF**2)*rh - 0.000814971*tempF*(rh**2) + 0.0000102102*(tempF**2)*(rh**2) - 0.000038646*(tempF**3) + 0.0000291583*(rh**3) + 0.00000142721*(tempF**3)*rh + 0.000000197483*tempF*(rh**3) - 0.0000000218429*(tempF**3)*(rh**2) + 0.000000000843296*(tempF**2)*(rh**3) - 0.0000000000481975*(tempF**3)*(rh**3)
+	t_w = tempC * math.atan(0.151977 * (rh + 8.313659)**(1/2)) + math.atan(tempC + rh) - math.atan(rh - 1.676331) + 0.00391838 *(rh)**(3/2) * math.atan(0.023101 * rh) - 4.686035
+	WBGT = 0.7 * t_w + 0.3 * tempC
+
+	# Round floats
+	t_w = round(t_w * 10) / 10
+	rh = round(rh * 10) / 10
+	hi = round(hi*10) / 10
+	WBGT = round(WBGT * 10) / 10
+	return { "RH" : rh, "heatIndex" : hi, "tempWet" : t_w, "WBGT" : WBGT }